@@ -20,6 +20,15 @@ unsigned int dVal = 0;      // holds the incoming raw data. Signal value can ran
 double inter_sample_interval_us = 2.7;
   
 
+// Serial protocol: 0 -> ASCII comma separated values, one line per sample; 1 -> binary frames, sent by the
+// PhysioKit_Frame library of arduino/libraries, which needs to be installed (see README)
+#define BINARY_PROTOCOL 0
+#define NUM_SENSORS 4
+
+#if BINARY_PROTOCOL
+#include <PhysioKit_Frame.h>
+#endif
+
 // The SetUp Function:
 void setup() {
     Serial.begin(baudrate);         // Set's up Serial Communication at certain speed.
@@ -36,6 +45,10 @@ void loop() {
     cVal = analogRead(CPin);  // Read the Sensor3 value. Assign this value to the "cVal" variable.
     dVal = analogRead(DPin);  // Read the Sensor4 value. Assign this value to the "dVal" variable.                                             
 
+#if BINARY_PROTOCOL
+    unsigned int vals[NUM_SENSORS] = {aVal, bVal, cVal, dVal};
+    send_frame(Serial, vals, NUM_SENSORS);
+#else
     Serial.print(aVal);         // Send the aVal value to Serial.
     Serial.print(",");
     Serial.print(bVal);         // Send the bVal value to Serial.
@@ -43,6 +56,7 @@ void loop() {
     Serial.print(cVal);         // Send the cVal value to Serial.
     Serial.print(",");
     Serial.println(dVal);       // Send the dVal value to Serial.
+#endif
     noInterrupts();
     _delay_ms(inter_sample_interval_us);
     interrupts();
@@ -13,6 +13,15 @@ unsigned int aVal = 0;
 // 0.1 -> ADC, 0.2 - serial.Print, 0.1 - Misc
 double inter_sample_interval_us = 3.6;
   
+// Serial protocol: 0 -> ASCII comma separated values, one line per sample; 1 -> binary frames, sent by the
+// PhysioKit_Frame library of arduino/libraries, which needs to be installed (see README)
+#define BINARY_PROTOCOL 0
+#define NUM_SENSORS 1
+
+#if BINARY_PROTOCOL
+#include <PhysioKit_Frame.h>
+#endif
+
 // The SetUp Function:
 void setup() {
    Serial.begin(baudrate);         // Set's up Serial Communication at certain speed.
@@ -22,7 +31,12 @@ void setup() {
 // The Main Loop Function
 void loop() {
     aVal = analogRead(APin);  // Read the sensor value. Assign this value to the "aVal" variable.
+#if BINARY_PROTOCOL
+    unsigned int vals[NUM_SENSORS] = {aVal};
+    send_frame(Serial, vals, NUM_SENSORS);
+#else
     Serial.println(aVal);                    // Send the aVal value to Serial.
+#endif
     noInterrupts();
     _delay_ms(inter_sample_interval_us);
     interrupts();
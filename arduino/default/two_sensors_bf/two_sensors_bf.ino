@@ -20,6 +20,15 @@ int bf = 0;
 // 0.1 -> ADC, 0.2 - serial.Print, 0.1 - Misc
 double inter_sample_interval_us = 3.3;
 
+// Serial protocol: 0 -> ASCII comma separated values, one line per sample; 1 -> binary frames, sent by the
+// PhysioKit_Frame library of arduino/libraries, which needs to be installed (see README)
+#define BINARY_PROTOCOL 0
+#define NUM_SENSORS 2
+
+#if BINARY_PROTOCOL
+#include <PhysioKit_Frame.h>
+#endif
+
 // The SetUp Function:
 void setup() {
    Serial.begin(baudrate);         // Set's up Serial Communication at certain speed.
@@ -79,9 +88,14 @@ void loop() {
    aVal = analogRead(APin); // Read the Sensor1 value. Assign this value to the "aVal" variable.
    bVal = analogRead(BPin); // Read the Sensor2 value. Assign this value to the "bVal" variable.
 
+#if BINARY_PROTOCOL
+   unsigned int vals[NUM_SENSORS] = {aVal, bVal};
+   send_frame(Serial, vals, NUM_SENSORS);
+#else
    Serial.print(aVal); // Send the aVal value to Serial.
    Serial.print(",");
    Serial.println(bVal); // Send the bVal value to Serial.
+#endif
    
    noInterrupts();
    _delay_ms(inter_sample_interval_us);
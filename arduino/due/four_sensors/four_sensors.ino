@@ -17,6 +17,15 @@ unsigned int dVal = 0;        // holds the incoming raw data. Signal value can r
 // 0.05 -> ADC, 0.1 - serial.Print, 0.05 - Misc
 int inter_sample_interval_us = int(3.35 * 1000);
 
+// Serial protocol: 0 -> ASCII comma separated values, one line per sample; 1 -> binary frames, sent by the
+// PhysioKit_Frame library of arduino/libraries, which needs to be installed (see README)
+#define BINARY_PROTOCOL 0
+#define NUM_SENSORS 4
+
+#if BINARY_PROTOCOL
+#include <PhysioKit_Frame.h>
+#endif
+
 // The SetUp Function:
 void setup() {
    SerialUSB.begin(baudrate);         // Set's up Serial Communication at certain speed.
@@ -40,6 +49,10 @@ void loop() {
     analogReadResolution(12);
     dVal = analogRead(DPin);  // Read the Sensor4 value. Assign this value to the "dVal" variable.                                             
 
+#if BINARY_PROTOCOL
+    unsigned int vals[NUM_SENSORS] = {aVal, bVal, cVal, dVal};
+    send_frame(SerialUSB, vals, NUM_SENSORS);
+#else
     SerialUSB.print(aVal);        // Send the aVal value to Serial.
     SerialUSB.print(",");
     SerialUSB.print(bVal);        // Send the bVal value to Serial.
@@ -47,6 +60,7 @@ void loop() {
     SerialUSB.print(cVal);        // Send the cVal value to Serial.
     SerialUSB.print(",");
     SerialUSB.println(dVal);      // Send the dVal value to Serial.
+#endif
     noInterrupts();
     delayMicroseconds(inter_sample_interval_us);
     interrupts();
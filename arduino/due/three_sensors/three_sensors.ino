@@ -15,6 +15,15 @@ unsigned int cVal = 0;        // holds the incoming raw data. Signal value can r
 // 0.05 -> ADC, 0.1 - serial.Print, 0.05 - Misc
 int inter_sample_interval_us = int(3.5 * 1000);
 
+// Serial protocol: 0 -> ASCII comma separated values, one line per sample; 1 -> binary frames, sent by the
+// PhysioKit_Frame library of arduino/libraries, which needs to be installed (see README)
+#define BINARY_PROTOCOL 0
+#define NUM_SENSORS 3
+
+#if BINARY_PROTOCOL
+#include <PhysioKit_Frame.h>
+#endif
+
 // The SetUp Function:
 void setup() {
    SerialUSB.begin(baudrate);         // Set's up Serial Communication at certain speed.
@@ -34,11 +43,16 @@ void loop() {
     analogReadResolution(12);
     cVal = analogRead(CPin);  // Read the Sensor3 value. Assign this value to the "cVal" variable.
     
+#if BINARY_PROTOCOL
+    unsigned int vals[NUM_SENSORS] = {aVal, bVal, cVal};
+    send_frame(SerialUSB, vals, NUM_SENSORS);
+#else
     SerialUSB.print(aVal);        // Send the aVal value to Serial.
     SerialUSB.print(",");
     SerialUSB.print(bVal);        // Send the bVal value to Serial.
     SerialUSB.print(",");
     SerialUSB.println(cVal);        // Send the cVal value to Serial.
+#endif
     noInterrupts();
     delayMicroseconds(inter_sample_interval_us);
     interrupts();
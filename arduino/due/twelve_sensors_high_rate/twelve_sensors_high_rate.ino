@@ -0,0 +1,40 @@
+//  Variables
+// Sensors 1 to 12 connected to ANALOG PINS 0 to 11
+int sensorPins[] = {0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11};
+int sampling_rate = 2000;
+long int baudrate = 2000000;
+
+// Samples are scheduled on micros() instead of a fixed delay, so the ADC and serial time does not add to the interval
+unsigned long inter_sample_interval_us = 1000000UL / sampling_rate;
+unsigned long next_sample_us = 0;
+
+// High rate mode only supports the binary protocol; use configs/arm_due/sw_config_high_rate.json
+// Binary frames are sent by the PhysioKit_Frame library of arduino/libraries, which needs to be installed (see README)
+#include <PhysioKit_Frame.h>
+
+#define NUM_SENSORS 12
+unsigned int vals[NUM_SENSORS];    // holds the incoming raw data. Signal value can range from 0-4096
+
+// The SetUp Function:
+void setup() {
+   SerialUSB.begin(baudrate);         // Set's up Serial Communication at certain speed.
+   for (int i = 0; i < NUM_SENSORS; i++) {
+       pinMode(sensorPins[i], INPUT);
+   }
+   analogReadResolution(12);
+   // Shorten the ADC startup time so that 12 conversions fit well within one sampling interval
+   ADC->ADC_MR = (ADC->ADC_MR & 0xFFF0FFFF) | 0x00020000;
+   next_sample_us = micros();
+}
+
+// The Main Loop Function
+void loop() {
+    while ((long)(micros() - next_sample_us) < 0) {
+    }
+    next_sample_us += inter_sample_interval_us;
+
+    for (int i = 0; i < NUM_SENSORS; i++) {
+        vals[i] = analogRead(sensorPins[i]);
+    }
+    send_frame(SerialUSB, vals, NUM_SENSORS);
+}
@@ -13,6 +13,15 @@ unsigned int bVal = 0;        // holds the incoming raw data. Signal value can r
 // 0.05 -> ADC, 0.1 - serial.Print, 0.05 - Misc
 int inter_sample_interval_us = int(3.65 * 1000);
 
+// Serial protocol: 0 -> ASCII comma separated values, one line per sample; 1 -> binary frames, sent by the
+// PhysioKit_Frame library of arduino/libraries, which needs to be installed (see README)
+#define BINARY_PROTOCOL 0
+#define NUM_SENSORS 2
+
+#if BINARY_PROTOCOL
+#include <PhysioKit_Frame.h>
+#endif
+
 // The SetUp Function:
 void setup() {
    SerialUSB.begin(baudrate);         // Set's up Serial Communication at certain speed.
@@ -28,9 +37,14 @@ void loop() {
     analogReadResolution(12);
     bVal = analogRead(BPin);  // Read the Sensor2 value. Assign this value to the "bVal" variable.  
         
+#if BINARY_PROTOCOL
+    unsigned int vals[NUM_SENSORS] = {aVal, bVal};
+    send_frame(SerialUSB, vals, NUM_SENSORS);
+#else
     SerialUSB.print(aVal);        // Send the aVal value to Serial.
     SerialUSB.print(",");
     SerialUSB.println(bVal);        // Send the bVal value to Serial.
+#endif
     noInterrupts();
     delayMicroseconds(inter_sample_interval_us);
     interrupts();
@@ -0,0 +1,46 @@
+// Binary frames of the PhysioKit serial protocol, as decoded by utils/serial_protocol.py
+// Binary frame (little-endian): sync word 0x55AA, uint16 sequence counter, uint16 per sensor, uint16 checksum
+// The checksum is the CRC-16/CCITT-FALSE (polynomial 0x1021, initial value 0xFFFF) of the sequence counter and sensor bytes
+#ifndef PHYSIOKIT_FRAME_H
+#define PHYSIOKIT_FRAME_H
+
+#include <Arduino.h>
+
+#define PHYSIOKIT_MAX_SENSORS 16
+#define PHYSIOKIT_FRAME_LEN(num_sensors) (6 + 2 * (num_sensors))
+
+inline unsigned int crc16_update(unsigned int crc, byte data) {
+    crc ^= (unsigned int)data << 8;
+    for (int i = 0; i < 8; i++) {
+        crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+    }
+    return crc & 0xFFFF;
+}
+
+// Writes the values of num_sensors sensors to port (Serial, SerialUSB...) as one frame, numbered by the sequence counter
+inline void send_frame(Print &port, const unsigned int *vals, int num_sensors) {
+    static unsigned int seq_num = 0;
+    static byte frame[PHYSIOKIT_FRAME_LEN(PHYSIOKIT_MAX_SENSORS)];
+    if (num_sensors > PHYSIOKIT_MAX_SENSORS) {
+        return;
+    }
+    int frame_len = PHYSIOKIT_FRAME_LEN(num_sensors);
+    unsigned int checksum = 0xFFFF;
+    frame[0] = 0xAA;
+    frame[1] = 0x55;
+    frame[2] = lowByte(seq_num);
+    frame[3] = highByte(seq_num);
+    for (int i = 0; i < num_sensors; i++) {
+        frame[4 + 2 * i] = lowByte(vals[i]);
+        frame[5 + 2 * i] = highByte(vals[i]);
+    }
+    for (int i = 2; i < frame_len - 2; i++) {
+        checksum = crc16_update(checksum, frame[i]);
+    }
+    frame[frame_len - 2] = lowByte(checksum);
+    frame[frame_len - 1] = highByte(checksum);
+    port.write(frame, frame_len);
+    seq_num++;
+}
+
+#endif
@@ -36,7 +36,7 @@ setup(name='PhysioKit2',
           "PhysioKit2": ["*.txt"],
           "PhysioKit2": ["*.ui"],
           "PhysioKit2.images": ["*.png"],
-          "PhysioKit2.sqa.ckpt": ["*.pth"],
+          "PhysioKit2.sqa.ckpt": ["*.pth", "*.pt"],
           "PhysioKit2.sqa.config": ["*.json"],
           "PhysioKit2.analysis_helper.sample_data": ["*.txt"],
           "PhysioKit2.configs": ["*.json"],
@@ -48,6 +48,8 @@ setup(name='PhysioKit2',
           'console_scripts': [
               'physiokit = PhysioKit2.main:main',
               'physiokit_analyze = PhysioKit2.analysis_helper.process_signals:main',
+              'physiokit_record = PhysioKit2.record:main',
+              'physiokit_recover = PhysioKit2.recover:main',
           ]
       }
       )
\ No newline at end of file
@@ -16,7 +16,8 @@ plt.rcParams["font.size"] = "18"
 import warnings
 warnings.filterwarnings('ignore')
 
-from PhysioKit2.analysis_helper.utils.load_data import load_csv_data_all
+from PhysioKit2.analysis_helper.utils.load_data import CHANNELS
+from PhysioKit2.utils.recording import Recording
 from PhysioKit2.sqa.inference import sqaPPGInference
 import matplotlib.pyplot as plt
 
@@ -111,19 +112,16 @@ class Process_Signals(object):
         sqi_window_len_samples = int(fs * self.sqi_window_len_sec)
         sqi_step_samples = int(fs * self.sqi_step_sec)
 
-        sqi_vec_array = np.array([])
-
-        for start_time_idx in np.arange(0, total_samples - sqi_window_len_samples, sqi_step_samples-1):
-            end_time_idx = start_time_idx + sqi_window_len_samples
-            
-            bvp_seg_filtered = sig_vec[start_time_idx: end_time_idx]
-            bvp_seg_filtered = bvp_seg_filtered.reshape(1, -1)
+        # windows starting every sqi_step_samples-1 samples, as a strided view of sig_vec, run as one batch
+        n_windows = len(range(0, total_samples - sqi_window_len_samples, sqi_step_samples-1))
+        if n_windows > 0:
+            bvp_segs_filtered = np.lib.stride_tricks.sliding_window_view(sig_vec, sqi_window_len_samples)[::sqi_step_samples-1][:n_windows]
 
             # compute SQIs
-            # bvp_vec, sq_vec, _ = self.sqa_inference_obj.run_inference(bvp_seg_filtered, axis=1)
-            sq_vec = self.sqa_inference_obj.run_inference(bvp_seg_filtered, axis=1)
-
-            sqi_vec_array = np.append(sqi_vec_array, sq_vec)
+            sq_vec = self.sqa_inference_obj.run_inference(bvp_segs_filtered, axis=1)
+            sqi_vec_array = sq_vec.ravel()
+        else:
+            sqi_vec_array = np.array([])
 
 
         sqi_vec_array = 1 - sqi_vec_array
@@ -140,111 +138,96 @@ class Process_Signals(object):
 
 
 
-    def ppg_process(self, ppg, fs, pid="", cond="", desc=""):
+    def filtered_epochs(self, recording, channel, sos, start, end, winlen_samples, step_samples):
+        # epochs of the (negated) ppg channel from sample start to end, band-pass filtered as one signal from its first
+        # sample: the filter state is carried over, and only the samples not in the previous epoch are read and filtered
+        fs = float(recording.fs)
+        zi = np.zeros((len(sos), 2))
+        filtered = np.zeros(0)
+        filtered_start = 0
+        filtered_end = 0
+        for onset_s, epoch in recording.epochs(winlen_samples / fs, step_samples / fs, channels=[channel], start_s=start / fs, end_s=end / fs):
+            onset = recording.sample_index(onset_s)
+            if onset > filtered_end:
+                # samples before the first epoch, or between epochs when the step is longer than the epochs
+                _, zi = signal.sosfilt(sos, -1 * recording.window(filtered_end / fs, onset / fs, [channel])[:, 0], zi=zi)
+                filtered = np.zeros(0)
+                filtered_start = onset
+                filtered_end = onset
+            new_filtered, zi = signal.sosfilt(sos, -1 * epoch[filtered_end - onset:, 0], zi=zi)
+            filtered = np.concatenate([filtered[onset - filtered_start:], new_filtered])
+            filtered_start = onset
+            filtered_end = onset + len(epoch)
+            yield filtered
+
+
 
-        self.max_samples = len(ppg)
+    def ppg_process(self, recording, channel, fs, pid="", cond="", desc=""):
+
+        self.max_samples = recording.n_samples
         fs_actual = int((float(self.max_samples/self.total_duration)))
         if fs_actual - fs >= self.exp_dict["fs_margin"]:
             fs_actual = fs
             self.max_samples = int(fs_actual*self.total_duration)
-            ppg = ppg[0:self.max_samples]
         elif fs - fs_actual >= self.exp_dict["fs_margin"]:
             fs_actual = fs
 
         self.fs_actual = fs_actual
         print("Achieved sampling rate: ", fs_actual)
 
-        # actual_total_duration = int(float(self.max_samples / fs_actual))
         step_samples = int(float(self.exp_dict["step_len"]) * fs_actual)
         winlen = int(self.exp_dict["winlen"])  # seconds
         winlen_samples = int(winlen * fs_actual)
-        
-        self.events = {}
-        e_onset = np.array(np.arange(0, self.max_samples - winlen_samples, step_samples))
-        e_duration = winlen_samples * np.ones_like(e_onset)        
-        e_label = np.array([str(d) for d in range(1, len(e_onset) + 1)])
-        e_condition = np.array([cond]*len(e_onset))
-        self.events["onset"] = e_onset
-        self.events["duration"] = e_duration
-        self.events["label"] = e_label
-        self.events["condition"] = e_condition
-        # self.epoch_start = 0
-        # self.epoch_end = winlen
-
-        # ppg_signals_raw, _ = nk.ppg_process(ppg, sampling_rate=fs_actual)
-        # ppg_epochs_raw = nk.epochs_create(ppg_signals_raw, events=self.events, sampling_rate=fs_actual, epochs_start=self.epoch_start, epochs_end=self.epoch_end)
-
-        # print("*"*50)
-        # print("ppg_epochs")
-        # print("*"*50)
-        # print("PPG_Raw", len(ppg_epochs["1"]["PPG_Raw"]))
-        # print("PPG_Clean", len(ppg_epochs["1"]["PPG_Clean"]))
-        # print("PPG_Rate", len(ppg_epochs["1"]["PPG_Rate"]))
 
         sos = signal.butter(0, (float(self.exp_dict["low_cut_freq"]), float(self.exp_dict["high_cut_freq"])), 'bandpass', fs=self.fs_actual, output='sos')
-        filtered_ppg = signal.sosfilt(sos, ppg)
-        filtered_ppg = filtered_ppg[self.discard_len * fs_actual:]
-
-        ppg_signals, ppg_info = nk.ppg_process(filtered_ppg, sampling_rate=fs_actual)
-        # ppg_features = nk.ppg_analyze(ppg_signals, sampling_rate=fs_actual)
-        ppg_epochs = nk.epochs_create(ppg_signals, events=self.events, sampling_rate=fs_actual)
-        # ppg_feats_eps = nk.ppg_intervalrelated(ppg_epochs, sampling_rate=fs_actual)
 
         SQI_epochs = []
-        # for key, val in ppg_epochs_raw.items():
-        #     ps = np.abs(np.fft.fft(val["PPG_Raw"]))**2
-        #     freqs = np.fft.fftfreq(len(val["PPG_Raw"]), 1/fs_actual)
-        #     pow_plot = ps[(freqs > self.plot_low_freq) & (freqs < self.plot_high_freq)]
-        #     freqs_plot = freqs[(freqs > self.plot_low_freq) & (freqs < self.plot_high_freq)]
-        #     sig_strength = np.sum(ps[(freqs > self.sqi_low_freq) & (freqs < self.sqi_high_freq)])
-        #     noise_strength = np.sum(ps[(freqs > self.noise_low_freq) & (freqs < self.noise_high_freq)])
-        #     SQI_epochs.append(np.round(float(sig_strength) / noise_strength, 2))
-
-        # for key, val in ppg_epochs.items():
-        for key, val in ppg_epochs.items():
-            # print("Key", key)
-            # plt.plot(val["PPG_Raw"])
-            # plt.show()
-            aSQI = self.compute_sqa(val["PPG_Raw"], fs_actual)
-            SQI_epochs.append(np.round(aSQI, 2))
-
         temp_epochs_met = {}
         temp_met_list = {}
         for met in self.exp_dict["metrics"]:
             temp_met_list[met] = []
+        # cleaned signal and peaks of the samples of each epoch not in the next one, only kept for the plot
+        plot_clean = []
+        plot_peaks = []
+
+        # the session is read one epoch at a time, after the first discard_len seconds, so that sessions of any length
+        # are processed in bounded memory
+        epochs = self.filtered_epochs(recording, channel, sos, self.discard_len * fs_actual, self.max_samples, winlen_samples, step_samples)
+        for nEpoch, filtered_ppg in enumerate(epochs):
+            epoch_num = str(nEpoch + 1)
+            ppg_signals, ppg_info = nk.ppg_process(filtered_ppg, sampling_rate=fs_actual)
+            aSQI = self.compute_sqa(ppg_signals["PPG_Raw"], fs_actual)
+            SQI_epochs.append(np.round(aSQI, 2))
 
-        # print(ppg_feats_eps.columns)
-        # print(ppg_feats_eps["HRV_LFHF"].to_list())
-        # print(ppg_feats_eps["HRV_pNN50"].to_list())
-        # print(ppg_feats_eps["HRV_SDNN"].to_list())
-        # print(ppg_feats_eps["PPG_Rate_Mean"].to_list())
-        # exit()
-
-        ppg_features = {}
-        ppg_features["SQI"] = np.mean(SQI_epochs)
-        ppg_features_epoch = {}
-        ppg_features_epoch["epoch_num"] = []
-        # If any metrics is not in valid ramge, the all metrics in the epoch will be considered as invalid
-        # If no epoch is valid, then the session is invalid
-        ppg_features["session_valid"] = True
+            if self.save_plot_flag:
+                plot_clean.append(ppg_signals["PPG_Clean"].values[:step_samples])
+                plot_peaks.append(ppg_signals["PPG_Peaks"].values[:step_samples])
+                last_clean = ppg_signals["PPG_Clean"].values[step_samples:]
+                last_peaks = ppg_signals["PPG_Peaks"].values[step_samples:]
 
-        for epoch_num in ppg_epochs:
-            if SQI_epochs[int(epoch_num) - 1] > self.SQI_threshold:
+            if SQI_epochs[-1] > self.SQI_threshold:
                 try:
-                    feats = nk.hrv_time(ppg_epochs[epoch_num]['PPG_Peaks'], sampling_rate=fs_actual)
+                    feats = nk.hrv_time(ppg_signals['PPG_Peaks'], sampling_rate=fs_actual)
                     temp_epochs_met[epoch_num] = {}
                     for met in self.exp_dict["metrics"]:
                         if met == "PPG_Rate_Mean":
-                            met_val = ppg_epochs[epoch_num]["PPG_Rate"].mean()
-                            # met_val = ppg_feats_eps[met][int(epoch_num) - 1]
+                            met_val = ppg_signals["PPG_Rate"].mean()
                         else:
                             met_val = feats[met][0]
-                            # met_val = ppg_feats_eps[met][int(epoch_num) - 1]
 
                         temp_epochs_met[epoch_num][met] = met_val
                         temp_met_list[met].append(met_val)
                 except Exception as e:
                     print(epoch_num, ": error:", e)
+
+        ppg_features = {}
+        ppg_features["SQI"] = np.mean(SQI_epochs)
+        ppg_features_epoch = {}
+        ppg_features_epoch["epoch_num"] = []
+        # If any metrics is not in valid ramge, the all metrics in the epoch will be considered as invalid
+        # If no epoch is valid, then the session is invalid
+        ppg_features["session_valid"] = True
+
         # print("met:", met, ": ", temp_met_list[met])
         # exit()
 
@@ -367,12 +350,12 @@ class Process_Signals(object):
                 os.makedirs(save_pth)
 
             fig, ax = plt.subplots(2, 1, figsize=(25, 16), layout = "tight")
-            ln_sig1 = int(len(ppg_signals['PPG_Clean'])/fs_actual)
-            x_axis1 = np.arange(0, ln_sig1, 1/fs_actual)
-            mn_len1 = min(len(x_axis1), len(ppg_signals['PPG_Clean']))
-            ax[0].plot(x_axis1[:mn_len1], ppg_signals['PPG_Clean'][:mn_len1])
-            ax[0].plot(ppg_info['PPG_Peaks']/fs_actual, ppg_signals['PPG_Clean'][ppg_info['PPG_Peaks']], 'go')
-            # ax[0].plot(ppg_info['PPG_Peaks']/fs_actual, ppg_signals['PPG_Clean'][ppg_info['PPG_Peaks'] == 0], 'ro')
+            if len(SQI_epochs) > 0:
+                ppg_clean = np.concatenate(plot_clean + [last_clean])
+                ppg_peaks = np.flatnonzero(np.concatenate(plot_peaks + [last_peaks]))
+                x_axis1 = np.arange(len(ppg_clean)) / fs_actual
+                ax[0].plot(x_axis1, ppg_clean)
+                ax[0].plot(ppg_peaks/fs_actual, ppg_clean[ppg_peaks], 'go')
             ax[0].set_xlabel("Time (seconds)")
             ax[0].set_ylabel("PPG Signal")
             # ax[1].plot(freqs_plot, pow_plot)
@@ -406,22 +389,25 @@ class Process_Signals(object):
                         self.analysis_dict_nk[pid][cond] = {}
 
                         fn = os.path.join(self.datapath, pid, val["path"])
-                        _, _, ppg1, ppg2, _ = load_csv_data_all(fn)
+                        recording = Recording(fn, fs=self.fs)
 
                         print("Processing: ", pid, cond)
-                        # PPG1
-                        if self.opt_sensor == "best" or self.opt_sensor == "ppg1":
-                            ppg1_features, ppg1_features_epoch = self.ppg_process(ppg1, fs=self.fs, pid=pid, cond=cond, desc="PPG Finger")
-                            session1_valid =  ppg1_features["session_valid"]
-                        else:
-                            session1_valid = False
-                        
-                        # PPG2
-                        if self.opt_sensor == "best" or self.opt_sensor == "ppg2":
-                            ppg2_features, ppg2_features_epoch = self.ppg_process(ppg2, fs=self.fs, pid=pid, cond=cond, desc="PPG Ear")
-                            session2_valid =  ppg2_features["session_valid"]
-                        else:
-                            session2_valid = False
+                        try:
+                            # PPG1
+                            if self.opt_sensor == "best" or self.opt_sensor == "ppg1":
+                                ppg1_features, ppg1_features_epoch = self.ppg_process(recording, CHANNELS["ppg1"], fs=self.fs, pid=pid, cond=cond, desc="PPG Finger")
+                                session1_valid =  ppg1_features["session_valid"]
+                            else:
+                                session1_valid = False
+
+                            # PPG2
+                            if self.opt_sensor == "best" or self.opt_sensor == "ppg2":
+                                ppg2_features, ppg2_features_epoch = self.ppg_process(recording, CHANNELS["ppg2"], fs=self.fs, pid=pid, cond=cond, desc="PPG Ear")
+                                session2_valid =  ppg2_features["session_valid"]
+                            else:
+                                session2_valid = False
+                        finally:
+                            recording.close()
 
                         # PPG
                         if (session1_valid or session2_valid):
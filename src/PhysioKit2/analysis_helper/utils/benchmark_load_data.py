@@ -0,0 +1,89 @@
+import argparse
+import csv
+import glob
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from PhysioKit2.utils.compression import open_csv
+from PhysioKit2.utils.events import events_path
+from PhysioKit2.analysis_helper.utils.load_data import read_csv_columns
+from PhysioKit2.utils.recording_cache import Recording_Cache, set_cache
+
+
+def load_csv_rows(filepath):
+    # row by row loader the CSV loaders used before read_csv_columns(), with the event code taken from column 4, if any
+    data = []
+    event_code = []
+    with open_csv(filepath) as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=',')
+        next(csvreader)
+        for ln in csvreader:
+            data.append([float(ln[0]), float(ln[1]), float(ln[2]), float(ln[3])])
+            if len(ln) > 4 and ln[4] != '':
+                event_code.append(float(ln[4]))
+            else:
+                event_code.append(-1)
+    return np.array(data), np.array(event_code)
+
+
+def time_loader(loader, filepaths, repeats):
+    best = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for filepath in filepaths:
+            loader(filepath)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    """
+        Compares the time to load the CSV recordings of a directory with the row by row loader and with read_csv_columns(),
+        parsing and from a temporary recording cache, checking that both return the same signals
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('datapath', help="directory of CSV recordings, searched recursively")
+    parser.add_argument('--repeats', type=int, default=3, help="best time out of repeats")
+    args = parser.parse_args()
+
+    filepaths = sorted(glob.glob(os.path.join(args.datapath, "**", "*.csv*"), recursive=True))
+    filepaths = [filepath for filepath in filepaths if not filepath.endswith(("_events.csv", "_health.json"))]
+    if len(filepaths) == 0:
+        print("No CSV recording found in:", args.datapath)
+        return
+
+    n_samples = 0
+    for filepath in filepaths:
+        rows, rows_event_code = load_csv_rows(filepath)
+        _, values, event_code = read_csv_columns(filepath, [0, 1, 2, 3], use_cache=False)
+        with open_csv(filepath) as csvfile:
+            header = next(csv.reader(csvfile))
+        if not np.array_equal(rows, np.stack(values, axis=1)):
+            print("Signals differ for:", filepath)
+        # recordings with more columns hold event codes after column 4, which the row by row loader missed, and
+        # read_csv_columns() takes them from the event table when there is one
+        if header[4:5] == ["event_code"] and not os.path.exists(events_path(filepath)) and \
+                not np.array_equal(rows_event_code, event_code):
+            print("Event codes differ for:", filepath)
+        n_samples += len(event_code)
+
+    rows_time = time_loader(load_csv_rows, filepaths, args.repeats)
+    columns_time = time_loader(lambda filepath: read_csv_columns(filepath, [0, 1, 2, 3], use_cache=False), filepaths, args.repeats)
+    recording_cache = Recording_Cache(tempfile.mkdtemp())
+    set_cache(recording_cache)
+    for filepath in filepaths:
+        read_csv_columns(filepath, [0, 1, 2, 3])
+    cached_time = time_loader(lambda filepath: read_csv_columns(filepath, [0, 1, 2, 3]), filepaths, args.repeats)
+    shutil.rmtree(recording_cache.cache_dir)
+    print("Files: {}, samples: {}".format(len(filepaths), n_samples))
+    print("Row by row loader: {:.3f} s ({:.2f} M samples/s)".format(rows_time, n_samples / rows_time / 1e6))
+    print("read_csv_columns: {:.3f} s ({:.2f} M samples/s)".format(columns_time, n_samples / columns_time / 1e6))
+    print("read_csv_columns, cached: {:.3f} s ({:.2f} M samples/s)".format(cached_time, n_samples / cached_time / 1e6))
+    print("Speedup: {:.1f}x, cached: {:.1f}x".format(rows_time / columns_time, rows_time / cached_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -270,6 +270,17 @@ class Ui_PPG(object):
 
         self.gridLayout_4.addWidget(self.label_status, 1, 0, 1, 1)
 
+        self.label_throughput = QLabel(self.groupBox_5)
+        self.label_throughput.setObjectName(u"label_throughput")
+        sizePolicy4.setHeightForWidth(self.label_throughput.sizePolicy().hasHeightForWidth())
+        self.label_throughput.setSizePolicy(sizePolicy4)
+        font3 = QFont()
+        font3.setPointSize(12)
+        self.label_throughput.setFont(font3)
+        self.label_throughput.setAlignment(Qt.AlignRight|Qt.AlignTrailing|Qt.AlignVCenter)
+
+        self.gridLayout_4.addWidget(self.label_throughput, 1, 1, 1, 1)
+
 
         self.gridLayout_2.addWidget(self.groupBox_5, 5, 0, 1, 3)
 
@@ -373,6 +384,7 @@ class Ui_PPG(object):
         self.label_sync.setText(QCoreApplication.translate("PPG", u"External Sync", None))
         self.groupBox_5.setTitle(QCoreApplication.translate("PPG", u"Info", None))
         self.label_status.setText("")
+        self.label_throughput.setText("")
         self.label.setText("")
         self.label_sq_legend.setText("")
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tab), QCoreApplication.translate("PPG", u"Real-Time Plotting of Signals", None))
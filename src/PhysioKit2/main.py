@@ -37,9 +37,11 @@ faulthandler.enable()
 
 from PhysioKit2.utils.external_sync import ServerThread, ClientThread
 from PhysioKit2.utils.acquisition import Data_Acquisition_Thread
+from PhysioKit2.utils.virtual_serial import VIRTUAL_PORT_NAME
 from PhysioKit2.utils.file_ops import File_IO
 from PhysioKit2.utils.biofeedback import BioFeedback_Thread
 from PhysioKit2.utils import config
+from PhysioKit2.utils.streaming_filters import Circular_Buffer
 from PhysioKit2.sqa.inference_thread import sqaPPGInference
 
 from PySide6.QtCore import QFile, Qt, QCoreApplication
@@ -87,7 +89,6 @@ class physManager(QWidget):
         self.ext_sync_flag = False
         self.ui.baudrate = 115200
 
-        self.phys_Acquisition_Obj = Data_Acquisition_Thread(config)
         self.ui.ser_port_names = []
         self.ui.ser_ports_desc = []
         self.ui.ser_open_status = False
@@ -100,11 +101,11 @@ class physManager(QWidget):
                 self.ui.sw_config_dict = json.load(json_file)
         except:
             print("Error opening the Software (SW) Config file")
+            self.create_acquisition_thread()
             return
 
         try:
-            config.SAMPLING_RATE = int(self.ui.sw_config_dict["acq_params"]["fs"])
-            self.ui.baudrate = int(self.ui.sw_config_dict["acq_params"]["baudrate"])
+            self.ui.baudrate = config.apply_sw_config(self.ui.sw_config_dict)
 
             # External Sync         
             self.ext_sync_flag = bool(self.ui.sw_config_dict["external_sync"]["enable"])
@@ -131,12 +132,15 @@ class physManager(QWidget):
 
                 else:
                     print("Invalid role specified for external sync settings in SW config file. Please check and start the application again...")
+                    self.create_acquisition_thread()
                     return
 
                 self.ui.pushButton_sync.pressed.connect(self.setup_external_sync)
         except:
             print("Invalid configuration in SW config file. Please check and start the application again...")
-            
+
+        self.create_acquisition_thread()
+
         for port, desc, hwid in sorted(self.phys_Acquisition_Obj.ports):
             # print("{}: {} [{}]".format(port, desc, hwid))
             self.ui.ser_ports_desc.append(str(port))
@@ -144,10 +148,19 @@ class physManager(QWidget):
                 port = port.replace('/dev/cu', '/dev/tty')
             self.ui.ser_port_names.append(port)
 
+        if config.REPLAY_PARAMS is not None:
+            self.ui.ser_ports_desc.append(VIRTUAL_PORT_NAME)
+            self.ui.ser_port_names.append(VIRTUAL_PORT_NAME)
+
         self.ui.comboBox_comport.addItems(self.ui.ser_ports_desc)
         if len(self.ui.ser_port_names) >= 1:
             self.ui.pushButton_connect.setEnabled(True)
             self.ui.curr_ser_port_name = self.ui.ser_port_names[0]
+        if config.DEVICE_PORTS is not None:
+            # the ports of the multi_device section of SW config are used, instead of the selected port
+            self.ui.comboBox_comport.setEnabled(False)
+            self.ui.pushButton_connect.setEnabled(True)
+            self.ui.curr_ser_port_name = ", ".join(config.DEVICE_PORTS)
         self.ui.label_status.setText("Serial port specified: " + self.ui.curr_ser_port_name +
                                      "; Select experiment and condition to start recording data.")
         self.ui.comboBox_comport.currentIndexChanged.connect(self.update_serial_port)
@@ -174,6 +187,13 @@ class physManager(QWidget):
         ui_file.close()
 
 
+    def create_acquisition_thread(self):
+        # created once SW config is applied, as it selects how acquisition runs (config.ACQUISITION_PROCESS),
+        # and also when the config is invalid, as the handlers of the interface use it
+        self.phys_Acquisition_Obj = Data_Acquisition_Thread(config)
+        self.ui.acq_health = self.phys_Acquisition_Obj.health
+
+
     def closeEvent(self, event):
         config.LIVE_ACQUISITION_FLAG = False
         config.HOLD_ACQUISITION_THREAD = False
@@ -297,7 +317,8 @@ class physManager(QWidget):
                 config.NCHANNELS = len(self.ui.channels)
                 self.ui.channel_types = self.ui.params_dict["exp"]["channel_types"]
                 config.CHANNEL_TYPES = self.ui.channel_types
-                self.ui.channel_plot_colors = self.ui.sw_config_dict["exp"]["channel_plot_colors"][:config.NCHANNELS]
+                plot_colors = self.ui.sw_config_dict["exp"]["channel_plot_colors"]
+                self.ui.channel_plot_colors = [plot_colors[nCh % len(plot_colors)] for nCh in range(config.NCHANNELS)]
 
                 # Initialize file_ops worker here
                 self.ui.fileIO_thread = File_IO(self.ui, config)
@@ -352,6 +373,7 @@ class physManager(QWidget):
                 self.phys_Acquisition_Obj.signals.data_signal_filt.connect(self.myAnim.addData)
                 self.phys_Acquisition_Obj.signals.time_signal.connect(self.update_time_elapsed)
                 self.phys_Acquisition_Obj.signals.log_signal.connect(self.update_log)
+                self.phys_Acquisition_Obj.signals.health_signal.connect(self.update_health)
                 # self.phys_Acquisition_Obj.signals.stop_signal.connect(self.stop_record_from_thread)
 
                 if self.ui.params_dict["exp"]["assess_signal_quality"]:
@@ -442,14 +464,18 @@ class physManager(QWidget):
             self.ui.eventcode = 0
 
     def toggle_marking(self):
+        # the sample index is taken first, so that the marker is placed at the sample acquired when the button was pressed
+        sample_index, host_monotonic_ns = self.phys_Acquisition_Obj.engine.mark_event()
         self.myAnim.event_toggle = True
         if not config.MARKER_EVENT_STATUS:
             config.MARKER_EVENT_STATUS = True
-            self.ui.write_eventcode = self.ui.eventcode
+            event_labels = dict(zip(self.ui.event_codes, self.ui.event_code_names))
+            self.ui.fileIO_thread.recorder.add_event(sample_index, host_monotonic_ns, self.ui.eventcode,
+                                                     event_labels.get(str(self.ui.eventcode), ''))
             self.ui.pushButton_Event.setText("Stop Marking")
         else:
             config.MARKER_EVENT_STATUS = False
-            self.ui.write_eventcode = ''
+            self.ui.fileIO_thread.recorder.add_event(sample_index, host_monotonic_ns, '')
             self.ui.pushButton_Event.setText("Start Marking")
 
 
@@ -516,10 +542,14 @@ class physManager(QWidget):
     def start_recording(self, start_signal):
         if start_signal:
             self.ui.record_start_time = datetime.now()
-            self.ui.data_record_flag = True
-
             self.ui.utc_sec = str((self.ui.record_start_time - datetime(1970, 1, 1)).total_seconds())
             self.ui.utc_sec = self.ui.utc_sec.replace('.', '_')
+            self.ui.fileIO_thread.recorder.start_recording({"pid": self.ui.pid, "study": self.ui.curr_exp_name,
+                                                            "condition": self.ui.curr_exp_condition, "start_time": self.ui.record_start_time.isoformat(),
+                                                            "utc_sec": self.ui.utc_sec, "data_root_dir": self.ui.data_root_dir})
+
+            self.ui.data_record_flag = True
+            self.phys_Acquisition_Obj.engine.start_recording(self.ui.curr_acquisition_time_ms if self.ui.timed_acquisition else None)
 
             self.ui.pushButton_record_data.setText("Stop Recording")
             self.ui.pushButton_record_data.setEnabled(True)
@@ -559,6 +589,7 @@ class physManager(QWidget):
 
         else:
             self.ui.data_record_flag = False
+            self.phys_Acquisition_Obj.engine.stop_recording()
             self.ui.fileIO_thread.stop_recording = True
             # stop_record_thread = threading.Thread(name='stop_record', target=self.stop_record_process, daemon=True)
             # stop_record_thread.start()
@@ -579,6 +610,21 @@ class physManager(QWidget):
     def update_log(self, log_message):
         self.ui.label_status.setText(log_message)
 
+    def update_health(self, health_report):
+        self.ui.label_throughput.setText(
+            "{:.0f} samples/s | {:.1f} kB/s | pending: {} B | jitter: {:.2f} ms\ncorrupt: {} | gaps: {} | lost: {}".format(
+                health_report["samples_per_sec"], health_report["bytes_per_sec"] / 1000.0, health_report["bytes_pending"],
+                health_report["interval_std_ms"], health_report["corrupt_lines"] + health_report["corrupt_frames"],
+                health_report["sequence_gaps"], health_report["samples_lost"]))
+        if self.ui.fileIO_thread_created:
+            recorder_stats = self.ui.fileIO_thread.recorder.stats()
+            self.ui.label_throughput.setText(self.ui.label_throughput.text() + " | write queue: {} | write latency: {:.1f} ms".format(
+                recorder_stats["queue_depth"], recorder_stats["write_latency_ms"]))
+        if health_report["degraded"]:
+            self.ui.label_throughput.setStyleSheet("color: rgb(200, 0, 0)")
+        else:
+            self.ui.label_throughput.setStyleSheet("")
+
     def update_bf_visualization_size(self, radius):
         disp_image = deepcopy(self.ui.bf_disp_image)
         disp_image = cv2.circle(disp_image, self.ui.bf_center_coordinates, radius, self.ui.bf_circle_color, self.ui.bf_circle_thickness)
@@ -597,11 +643,19 @@ class FigCanvas(FigureCanvas):
     def __init__(self, sampling_rate, channels, channel_types, ch_colors, sq_flag, parent=None, width=13.8, height=7.5, dpi=100):
         
         self.max_plot_time = 10 # 30 second time window
-        self.max_plot_channels = 4
+        self.max_plot_fs = 250  # higher sampling rates are decimated for plotting
+        self.max_plot_rows = 4
         self.nChannels = len(channels)
-        self.nChannels = min(self.nChannels, self.max_plot_channels)  #maximum number of channels for plaotting = 4
         self.channel_types = channel_types[:self.nChannels]
-        self.x_axis = np.linspace(0, self.max_plot_time, self.max_plot_time*sampling_rate)
+        self.plot_decimation = max(1, int(round(sampling_rate / self.max_plot_fs)))
+        plot_samples = int(self.max_plot_time * sampling_rate) // self.plot_decimation
+        self.x_axis = np.linspace(0, self.max_plot_time, plot_samples)
+        if self.nChannels == 4:
+            n_rows, n_cols = 2, 2
+        else:
+            n_cols = int(np.ceil(self.nChannels / self.max_plot_rows))
+            n_rows = int(np.ceil(self.nChannels / n_cols))
+        fontsize = 16 if self.nChannels <= 4 else 10
 
         self.plot_signals = []
         self.axs = {}
@@ -618,17 +672,14 @@ class FigCanvas(FigureCanvas):
         # self.fig = Figure(constrained_layout=True)
 
         for nCh in range(self.nChannels):
-            self.plot_signals.append(10 * np.ones(self.max_plot_time * sampling_rate))
+            self.plot_signals.append(10 * np.ones(plot_samples))
     
             # if self.sq_flag and self.channel_types[nCh] == "ppg":
             if self.sq_flag:
                 # self.sq_vecs.append(0.5 * np.ones((1, self.max_plot_time * 2))) # 1/0.5 as 0.5 is sq_resolution. 
                 self.sq_vecs.append(0.5 * np.ones((1, self.max_plot_time * sampling_rate))) # dense, per sample, sq_resolution. 
 
-            if self.nChannels == self.max_plot_channels:
-                self.axs[str(nCh)] = self.fig.add_subplot(2, 2, nCh+1)
-            else:
-                self.axs[str(nCh)] = self.fig.add_subplot(self.nChannels, 1, nCh+1)
+            self.axs[str(nCh)] = self.fig.add_subplot(n_rows, n_cols, nCh+1)
 
             (self.lines[str(nCh)],) = self.axs[str(nCh)].plot(self.x_axis, self.plot_signals[nCh], ch_colors[nCh], markersize=10, linestyle='solid')
             
@@ -636,8 +687,8 @@ class FigCanvas(FigureCanvas):
                 self.sq_images[str(nCh)] = self.axs[str(nCh)].imshow(
                     self.sq_vecs[nCh], clim=(0,1), cmap=plt.cm.RdYlGn, aspect='auto', alpha=0.5, extent=(0, self.max_plot_time, 0, 1)
                     )
-            self.axs[str(nCh)].set_xlabel('Time (seconds)', fontsize=16)
-            self.axs[str(nCh)].set_ylabel(channels[nCh], fontsize=16)
+            self.axs[str(nCh)].set_xlabel('Time (seconds)', fontsize=fontsize)
+            self.axs[str(nCh)].set_ylabel(channels[nCh], fontsize=fontsize)
             self.axs[str(nCh)].set_xlim(0, self.max_plot_time)
             self.axs[str(nCh)].set_ylim(0, 1)
             self.axs[str(nCh)].yaxis.set_ticks_position('left')
@@ -660,7 +711,11 @@ class PlotAnimation(TimedAnimation):
         self.max_plot_time = 10 # 30 second time window
         self.event_toggle = False
 
+        self.plot_decimation = figCanvas.plot_decimation
+        self.decimation_phase = 0
         self.plot_signals = figCanvas.plot_signals
+        self.plot_buffer = Circular_Buffer(len(self.plot_signals[0]), self.nChannels)
+        self.plot_buffer.extend(np.stack(self.plot_signals, axis=1))
         if self.sq_flag:
             self.sq_vecs = figCanvas.sq_vecs
             self.sq_images = figCanvas.sq_images
@@ -702,9 +757,14 @@ class PlotAnimation(TimedAnimation):
         return
 
     def addData(self, value):
-        for nCh in range(self.nChannels):
-            self.plot_signals[nCh] = np.roll(self.plot_signals[nCh], -1)
-            self.plot_signals[nCh][-1] = value[nCh]
+        if isinstance(value, np.ndarray):
+            # block of samples: (n_samples, n_channels), keeping every plot_decimation-th sample
+            self.plot_buffer.extend(value[self.decimation_phase::self.plot_decimation, :self.nChannels])
+            self.decimation_phase = (self.decimation_phase - value.shape[0]) % self.plot_decimation
+        else:
+            if self.decimation_phase == 0:
+                self.plot_buffer.append(value[:self.nChannels])
+            self.decimation_phase = (self.decimation_phase - 1) % self.plot_decimation
         return
 
 
@@ -725,13 +785,14 @@ class PlotAnimation(TimedAnimation):
         if config.LIVE_ACQUISITION_FLAG:   
 
             self._drawn_artists = []
+            plot_signals = self.plot_buffer.get()
             for nCh in range(self.nChannels):
-                mx = np.max(self.plot_signals[nCh])
-                mn = np.min(self.plot_signals[nCh])
+                mx = np.max(plot_signals[:, nCh])
+                mn = np.min(plot_signals[:, nCh])
                 if np.abs(mx - mn) > 1e-12:
-                    sig = (self.plot_signals[nCh] - mn)/(mx - mn)
+                    sig = (plot_signals[:, nCh] - mn)/(mx - mn)
                 else:
-                    sig = (self.plot_signals[nCh])
+                    sig = (plot_signals[:, nCh])
                 self.lines[str(nCh)].set_ydata(sig)
                 if self.sq_flag and self.channel_types[nCh] == "ppg":
                     self.sq_images[str(nCh)].set_data(self.sq_vecs[nCh])
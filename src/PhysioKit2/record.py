@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from importlib.resources import files
+
+from PhysioKit2.utils import config
+from PhysioKit2.utils.acquisition_engine import Acquisition_Engine
+from PhysioKit2.utils.acquisition_process import Process_Acquisition_Engine
+from PhysioKit2.utils.recorder import Recorder, recording_path, utc_seconds_str
+from PhysioKit2.utils.tcp_sync import Sync_Server, Sync_Client
+from PhysioKit2.utils.virtual_serial import VIRTUAL_PORT_NAME
+
+
+def print_health(health_report, recorder_stats):
+    print("{:.0f} samples/s | {:.1f} kB/s | pending: {} B | jitter: {:.2f} ms | corrupt: {} | gaps: {} | lost: {} | write queue: {} | write latency: {:.1f} ms{}".format(
+        health_report["samples_per_sec"], health_report["bytes_per_sec"] / 1000.0, health_report["bytes_pending"],
+        health_report["interval_std_ms"], health_report["corrupt_lines"] + health_report["corrupt_frames"],
+        health_report["sequence_gaps"], health_report["samples_lost"], recorder_stats["queue_depth"],
+        recorder_stats["write_latency_ms"], " | DEGRADED" if health_report["degraded"] else ""))
+
+
+def wait_for_external_sync(sw_config_dict):
+    """
+        Waits for the start of the recording as set in the "external_sync" section of SW config.
+        The server starts recording when Enter is pressed and sends the sync signal to its clients,
+        a client starts recording when it receives the sync signal. Returns the sync thread, if any.
+    """
+    role = sw_config_dict["external_sync"]["role"]
+    if role == "server":
+        server = Sync_Server("", sw_config_dict["server"]["tcp_port"], on_update=print)
+        server.start()
+        input("TCP server started. Press Enter to start recording and send the sync signal to clients...")
+        server.send_sync_to_client()
+        return server
+
+    elif role == "client":
+        synced = threading.Event()
+        sync_ip = sw_config_dict["client"]["server_ip"]
+        def on_connect(connect_status):
+            if connect_status:
+                print("Client is connected to the server with IP address = " + sync_ip + "; waiting for the sync signal...")
+            else:
+                print("Client could not connect with to the server with IP address = " + sync_ip + "; Retrying...")
+        def on_sync(sync_status):
+            if sync_status:
+                synced.set()
+        client = Sync_Client(sync_ip, sw_config_dict["client"]["tcp_port"], on_connect=on_connect, on_sync=on_sync)
+        client.wait_for_sync = True
+        client.start()
+        synced.wait()
+        return client
+
+    print("Invalid role specified for external sync settings in SW config file")
+    return None
+
+
+def main():
+    """
+        Records a session without the interface: physiokit_record --config sw_config.json --exp exp_params.json --port COM3
+        Uses the same SW config and experiment JSON as the interface, and only needs numpy and pyserial.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', default=str(files('PhysioKit2.configs.avr_default').joinpath('sw_config.json')), type=str,
+                        dest='config', help='Software Config file-path')
+    parser.add_argument('--exp', type=str, dest='exp', help='Experiment JSON file-path')
+    parser.add_argument('--port', type=str, default='', help='serial port, "' + VIRTUAL_PORT_NAME + '" or the first port found by default')
+    parser.add_argument('--pid', type=str, default='', help='participant ID')
+    parser.add_argument('--condition', type=str, default='', help='experiment condition, the first one by default')
+    parser.add_argument('--duration', type=float, default=None,
+                        help='seconds; max_time_seconds of the condition for timed acquisition, otherwise until Ctrl+C')
+    parser.add_argument('--list_ports', action='store_true', help='list the serial ports and exit')
+    parser.add_argument('--quiet', action='store_true', help='do not print the acquisition health every second')
+    args = parser.parse_args()
+
+    try:
+        with open(args.config) as json_file:
+            sw_config_dict = json.load(json_file)
+        baudrate = config.apply_sw_config(sw_config_dict)
+    except Exception as e:
+        print("Error loading the Software (SW) Config file:", e)
+        return 1
+
+    if config.ACQUISITION_PROCESS:
+        engine = Process_Acquisition_Engine(config)
+    else:
+        engine = Acquisition_Engine(config)
+    port_names = [port for port, desc, hwid in sorted(engine.ports)]
+    if config.REPLAY_PARAMS is not None:
+        port_names.append(VIRTUAL_PORT_NAME)
+    if args.list_ports:
+        print("\n".join(port_names))
+        return 0
+
+    if args.exp is None:
+        print("Experiment JSON file not specified (--exp)")
+        return 1
+    try:
+        with open(args.exp) as json_file:
+            params_dict = json.load(json_file)
+        channels = params_dict["exp"]["channels"]
+        channel_types = params_dict["exp"]["channel_types"]
+        conditions = params_dict["exp"]["conditions"]
+        exp_condition = args.condition if args.condition != '' else conditions[0]
+        exp_name = params_dict["exp"]["study_name"]
+        data_root_dir = params_dict["exp"]["datapath"]
+        duration = args.duration
+        if duration is None and params_dict["exp"]["timed_acquisition"] and exp_condition in conditions:
+            duration = params_dict["exp"]["max_time_seconds"][conditions.index(exp_condition)]
+    except Exception as e:
+        print("Error loading the experimentation configuration file:", e)
+        return 1
+    if not os.path.exists(data_root_dir):
+        os.makedirs(data_root_dir)
+
+    config.NCHANNELS = len(channels)
+    config.CHANNEL_TYPES = channel_types
+
+    port_name = args.port
+    if port_name == '' and config.DEVICE_PORTS is None:
+        if len(port_names) == 0:
+            print("No serial port found")
+            return 1
+        port_name = port_names[0]
+    if not engine.connectPort(port_name, baudrate):
+        print("Serial port could not get connected:", port_name)
+        return 1
+    print("Serial port is now connected:", engine.ser)
+
+    recorder = Recorder(channels, config.RECORD_QUEUE_SIZE, config.RECORD_FLUSH_INTERVAL_MS, config.RECORD_FSYNC_INTERVAL_MS,
+                        file_format=config.RECORD_FORMAT, binary_dtype=config.RECORD_BINARY_DTYPE,
+                        header={"channel_types": channel_types, "fs": config.SAMPLING_RATE},
+                        segment_duration_s=config.RECORD_SEGMENT_DURATION_S, segment_size_mb=config.RECORD_SEGMENT_SIZE_MB,
+                        compression=config.RECORD_COMPRESSION, delta_encoding=config.RECORD_DELTA_ENCODING,
+                        event_column=config.RECORD_EVENT_COLUMN)
+    record_stopped = threading.Event()
+    engine.subscribe("data", recorder.write)
+    engine.subscribe("log", print)
+    engine.subscribe("record_stopped", lambda stopped: record_stopped.set())
+    if not args.quiet:
+        engine.subscribe("health", lambda health_report: print_health(health_report, recorder.stats()))
+
+    config.LIVE_ACQUISITION_FLAG = True
+    config.HOLD_ACQUISITION_THREAD = False
+    acquisition_thread = threading.Thread(target=engine.run, daemon=True)
+    acquisition_thread.start()
+
+    sync_thread = None
+    utc_sec = utc_seconds_str(datetime.now())
+    try:
+        if bool(sw_config_dict["external_sync"]["enable"]):
+            sync_thread = wait_for_external_sync(sw_config_dict)
+
+        record_start_time = datetime.now()
+        utc_sec = utc_seconds_str(record_start_time)
+        recorder.start_recording({"pid": args.pid, "study": exp_name, "condition": exp_condition,
+                                  "start_time": record_start_time.isoformat(), "utc_sec": utc_sec, "data_root_dir": data_root_dir})
+        engine.start_recording(duration * 1000.0 if duration is not None else None)
+        if duration is not None:
+            print("Timed Recording started for: Exp - " + exp_name + "; Condition - " + exp_condition + "; Max-Time: " + str(duration))
+        else:
+            print("Recording started for: Exp - " + exp_name + "; Condition - " + exp_condition + "; Press Ctrl+C to stop")
+        while not record_stopped.wait(0.2):
+            if not acquisition_thread.is_alive():
+                break
+    except KeyboardInterrupt:
+        pass
+
+    engine.stop_recording()
+    engine.stop_flag = True
+    acquisition_thread.join(timeout=5)
+    engine.disconnectPort()
+    if sync_thread is not None:
+        sync_thread.stop_flag = True
+
+    save_file_path = recording_path(data_root_dir, args.pid, exp_name, exp_condition, utc_sec, recorder.extension)
+    if recorder.save(save_file_path, engine.health):
+        print("Recording stopped and data saved to:", save_file_path)
+        recorder.stop()
+        return 0
+    recorder.stop()
+    if not recorder.degraded:
+        print("Error saving data")
+    return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
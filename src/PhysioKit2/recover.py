@@ -0,0 +1,115 @@
+import argparse
+import glob
+import os
+import shutil
+import sys
+
+from PhysioKit2.utils.binary_recording import EXTENSION as BINARY_EXTENSION
+from PhysioKit2.utils.compression import CSV_EXTENSIONS, csv_codec, trim_compressed_csv
+from PhysioKit2.utils.events import events_path, write_events
+from PhysioKit2.utils.recorder import recording_path
+from PhysioKit2.utils.segments import read_manifest, session_in_use, session_segments, trim_csv_segment, merge_segments, \
+    recording_samples
+
+
+def find_sessions(directory, skip_in_use=True):
+    """
+        Recordings left unsaved in directory: session directories, and temporary files of earlier versions.
+        Sessions still recorded to by a running process are left out, unless skip_in_use is False
+    """
+    sessions = [path for path in glob.glob(os.path.join(directory, "*_temp")) if os.path.isdir(path)]
+    if skip_in_use:
+        sessions = [path for path in sessions if not session_in_use(path)]
+    return sorted(sessions + glob.glob(os.path.join(directory, "*_temp.csv")) + glob.glob(os.path.join(directory, "*_temp" + BINARY_EXTENSION)))
+
+
+def recover_session(session_path, data_root_dir=None):
+    """
+        Rebuilds a recording, and its event table, from the segments of an unsaved session, dropping any incomplete last row or chunk.
+        The recording is saved in data_root_dir, or in the data directory of the session when known, under the name it
+        would have been saved with. The session directory is only removed once the recording is found to hold all the samples
+        of the segments. Returns the path of the recording, or None if there was nothing to recover.
+    """
+    metadata = {}
+    header = {}
+    events = []
+    if os.path.isdir(session_path):
+        manifest = read_manifest(session_path)
+        segment_paths = session_segments(session_path, manifest)
+        if manifest is not None:
+            metadata = manifest["metadata"]
+            header = dict(manifest["header"], **metadata)
+            events = manifest.get("events", [])
+    else:
+        segment_paths = [session_path]
+    if len(segment_paths) == 0:
+        return None
+
+    binary = segment_paths[0].endswith(BINARY_EXTENSION)
+    extension = BINARY_EXTENSION if binary else CSV_EXTENSIONS[csv_codec(segment_paths[0])]
+    if not binary:
+        for path in segment_paths:
+            if csv_codec(path) == "none":
+                trim_csv_segment(path)
+            else:
+                trim_compressed_csv(path)
+
+    if data_root_dir is None:
+        data_root_dir = metadata.get("data_root_dir", '.')
+    if not os.path.exists(data_root_dir):
+        os.makedirs(data_root_dir)
+    if all(name in metadata for name in ["pid", "study", "condition", "utc_sec"]):
+        save_path = recording_path(data_root_dir, metadata["pid"], metadata["study"], metadata["condition"], metadata["utc_sec"], extension)
+    else:
+        name = os.path.basename(os.path.normpath(session_path))
+        save_path = os.path.join(data_root_dir, name.rsplit('.', 1)[0] if not os.path.isdir(session_path) else name) + "_recovered" + extension
+
+    n_samples = sum(recording_samples(path) for path in segment_paths)
+    # binary recordings are always rewritten, to add the index missing after a crash
+    merge_segments(segment_paths, save_path, binary, header if binary else None)
+    n_saved = recording_samples(save_path)
+    if n_saved != n_samples:
+        raise ValueError("recording saved to " + save_path + " has " + str(n_saved) + " of the " + str(n_samples) + " samples, session kept")
+    if len(events) > 0:
+        write_events(events_path(save_path), events)
+    if os.path.isdir(session_path):
+        shutil.rmtree(session_path)
+    return save_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild PhysioKit recordings left unsaved by an interrupted session")
+    parser.add_argument('sessions', nargs='*', help="session directories or temporary files, default: all found in the working directory")
+    parser.add_argument('--datapath', default=None, help="directory to save the recordings, default: data directory of the session")
+    parser.add_argument('--list', action='store_true', help="list the unsaved sessions and exit")
+    parser.add_argument('--force', action='store_true', help="also recover sessions that seem to be recorded to by a running process")
+    args = parser.parse_args(argv)
+
+    sessions = args.sessions if len(args.sessions) > 0 else find_sessions('.', skip_in_use=not args.force)
+    if len(sessions) == 0:
+        print("No unsaved session found")
+        return 0
+    if args.list:
+        for session_path in sessions:
+            print(session_path)
+        return 0
+
+    failed = 0
+    for session_path in sessions:
+        if not args.force and os.path.isdir(session_path) and session_in_use(session_path):
+            print("Skipped, recorded to by a running process:", session_path)
+            continue
+        try:
+            save_path = recover_session(session_path, args.datapath)
+            if save_path is None:
+                print("Nothing to recover in:", session_path)
+            else:
+                print("Recovered", session_path, "to:", save_path)
+        except Exception as e:
+            failed += 1
+            print("Error recovering " + session_path + ":", e)
+    return 1 if failed > 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import os
+import sys
+import argparse
+import json
+import time
+import numpy as np
+
+import torch
+from importlib.resources import files
+
+from PhysioKit2.sqa.model.SQAPhysMD import Model as sqPPG
+from PhysioKit2.sqa.backend_config import ckpt_path, torchscript_path, int8_path, select_backend
+
+QUANTIZED_ENGINES = ["x86", "fbgemm", "qnnpack"]
+
+
+def select_quantized_engine():
+    # the first supported engine, the same order is used to quantize and to load the int8 model
+    for engine in QUANTIZED_ENGINES:
+        if engine in torch.backends.quantized.supported_engines:
+            torch.backends.quantized.engine = engine
+            break
+    return torch.backends.quantized.engine
+
+
+def load_eager_model(model_config, device):
+    """
+        SQAPhysMD model with the weights of the checkpoint, in eval mode, or None if there is no checkpoint
+    """
+    model = sqPPG(device, model_config).to(device)
+    path = ckpt_path(model_config["ckpt_name"])
+    if not os.path.exists(path):
+        print("No checkpoint found:", path)
+        return None
+    checkpoint = torch.load(path, map_location=device)
+    if "model_state_dict" in checkpoint:
+        model.load_state_dict(checkpoint['model_state_dict'], strict=False)
+    else:
+        model.load_state_dict(checkpoint, strict=False)
+    model.eval()
+    return model
+
+
+def load_model(model_config, device):
+    """
+        Loads the model of the backend set in the inference section of the model config: "eager" (default), "torchscript"
+        for the frozen model exported next to the checkpoint, or "int8" for the quantized model, which both run on the CPU.
+        Returns the model and its device, falling back to the eager model if the model of the backend has not been exported
+        (backend_config.select_backend)
+    """
+    backend, path = select_backend(model_config)
+    if backend == "eager":
+        return load_eager_model(model_config, device), device
+    if backend == "int8":
+        select_quantized_engine()
+    device = torch.device("cpu")
+    return torch.jit.load(path, map_location=device), device
+
+
+def max_abs_diff(eager, scripted, input_vec, seed=0):
+    # both models get the same random NMF bases by seeding the random generator before each call
+    with torch.no_grad():
+        torch.manual_seed(seed)
+        _, eager_sq = eager(input_vec)
+        torch.manual_seed(seed)
+        _, scripted_sq = scripted(input_vec)
+    return float(torch.max(torch.abs(eager_sq - scripted_sq))) if eager_sq.shape == scripted_sq.shape else float("inf")
+
+
+def export_torchscript(model_config, output_path=None, example_batch_size=2, check_batch_sizes=(1, 8, 64), tolerance=1e-4):
+    """
+        Traces the eager model on the CPU, then freezes and optimizes it for CPU inference. The NMF steps of the
+        factorization module are unrolled by tracing, and the shapes of the model follow the batch size of its input.
+        The model is only saved if it gives the signal quality of the eager model, within tolerance, for batches of each
+        of check_batch_sizes windows. Returns the path of the saved model, or None
+    """
+    device = torch.device("cpu")
+    model = load_eager_model(model_config, device)
+    if model is None:
+        return None
+    total_samples = int(model_config["data"]["window_len_sec"] * model_config["data"]["target_fs"])
+    example = torch.rand((example_batch_size, 1, total_samples))
+    with torch.no_grad():
+        # check_trace would compare outputs computed with different random NMF bases: the trace is checked below instead,
+        # with the same bases for both models
+        traced = torch.jit.trace(model, example, check_trace=False)
+        frozen = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    for batch_size in check_batch_sizes:
+        try:
+            max_diff = max_abs_diff(model, frozen, torch.rand((batch_size, 1, total_samples)))
+        except RuntimeError as e:
+            print("TorchScript model failed with batch size " + str(batch_size) + ":", e)
+            return None
+        if not max_diff <= tolerance:
+            print("TorchScript model differs from the eager model by " + str(max_diff) + " with batch size " + str(batch_size) + ", not saved")
+            return None
+    if output_path is None:
+        output_path = torchscript_path(model_config)
+    frozen.save(output_path)
+    return output_path
+
+
+def forward_time(model, input_vec, repeats):
+    with torch.no_grad():
+        for _ in range(3):
+            model(input_vec)
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model(input_vec)
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def compare(model_config, batch_sizes=(1, 8, 64), repeats=50, seed=0):
+    """
+        Parity and latency of the TorchScript model against the eager model, on random windows of each batch size, with
+        the same random NMF bases for both models
+    """
+    device = torch.device("cpu")
+    eager = load_eager_model(model_config, device)
+    scripted = torch.jit.load(torchscript_path(model_config), map_location=device)
+    total_samples = int(model_config["data"]["window_len_sec"] * model_config["data"]["target_fs"])
+    results = []
+    for batch_size in batch_sizes:
+        input_vec = torch.rand((batch_size, 1, total_samples))
+        try:
+            max_diff = max_abs_diff(eager, scripted, input_vec, seed)
+        except RuntimeError as e:
+            print("TorchScript model failed with batch size " + str(batch_size) + ":", e)
+            results.append({"batch_size": batch_size, "max_abs_diff": float("inf"), "eager_ms": float("nan"),
+                            "torchscript_ms": float("nan")})
+            continue
+        eager_ms = forward_time(eager, input_vec, repeats)
+        scripted_ms = forward_time(scripted, input_vec, repeats)
+        results.append({"batch_size": batch_size, "max_abs_diff": max_diff, "eager_ms": eager_ms, "torchscript_ms": scripted_ms})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export SQAPhysMD as a frozen TorchScript model and compare it with the eager model")
+    parser.add_argument('--model_config', type=str, dest='model_config', help='Config file for model',
+                        default=str(files('PhysioKit2.sqa.config').joinpath('SQAPhysMD.json')))
+    parser.add_argument('--output', type=str, dest='output', help='Path of the exported model, default: next to the checkpoint', default=None)
+    parser.add_argument('--compare', action='store_true', help='only compare the exported model with the eager model')
+    parser.add_argument('--tolerance', type=float, dest='tolerance', help='maximum absolute difference of the signal quality', default=1e-4)
+    args = parser.parse_args()
+
+    with open(args.model_config) as json_file:
+        model_config = json.load(json_file)
+    if args.output is not None:
+        model_config.setdefault("inference", {})["torchscript_name"] = os.path.abspath(args.output)
+
+    if not args.compare:
+        output_path = export_torchscript(model_config, torchscript_path(model_config), tolerance=args.tolerance)
+        if output_path is None:
+            return 1
+        print("Exported:", output_path)
+
+    failed = False
+    print("{:>10} {:>14} {:>10} {:>16} {:>8}".format("batch", "max abs diff", "eager ms", "torchscript ms", "speedup"))
+    for result in compare(model_config):
+        failed = failed or not np.isfinite(result["max_abs_diff"]) or result["max_abs_diff"] > args.tolerance
+        print("{:>10} {:>14.2e} {:>10.2f} {:>16.2f} {:>7.2f}x".format(result["batch_size"], result["max_abs_diff"], result["eager_ms"],
+                                                                      result["torchscript_ms"], result["eager_ms"] / result["torchscript_ms"]))
+    if failed:
+        print("TorchScript model differs from the eager model by more than", args.tolerance)
+        if not args.compare:
+            # not left for the torchscript backend, which then uses the eager model
+            os.remove(torchscript_path(model_config))
+            print("Removed:", torchscript_path(model_config))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+import os
+from importlib.resources import files
+
+BACKENDS = ["eager", "torchscript", "int8"]
+
+
+def ckpt_path(file_name):
+    return str(files('PhysioKit2.sqa.ckpt').joinpath(file_name))
+
+
+def torchscript_path(model_config):
+    file_name = model_config.get("inference", {}).get("torchscript_name", "SQAPhysMD_frozen.pt")
+    return file_name if os.path.isabs(file_name) else ckpt_path(file_name)
+
+
+def int8_path(model_config):
+    file_name = model_config.get("inference", {}).get("int8_name", "SQAPhysMD_int8.pt")
+    return file_name if os.path.isabs(file_name) else ckpt_path(file_name)
+
+
+def select_backend(model_config):
+    """
+        Backend set in the inference section of the model config, and the path of its exported model: "eager" (default)
+        and None, "torchscript" for the frozen model exported next to the checkpoint, or "int8" for the quantized model.
+        Falls back to "eager" if the backend is unknown or its model has not been exported
+    """
+    backend = model_config.get("inference", {}).get("backend", "eager")
+    if backend == "torchscript" or backend == "int8":
+        path = torchscript_path(model_config) if backend == "torchscript" else int8_path(model_config)
+        if os.path.exists(path):
+            return backend, path
+        tool = "PhysioKit2.sqa.backend" if backend == "torchscript" else "PhysioKit2.sqa.quantize"
+        print("No " + backend + " model found at " + path + ", using the eager model instead. It is created with: python -m " + tool)
+    elif backend not in BACKENDS:
+        print("Unknown SQA backend, using the eager model:", backend)
+    return "eager", None
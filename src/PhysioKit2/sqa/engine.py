@@ -0,0 +1,174 @@
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+import numpy as np
+
+import torch
+
+from PhysioKit2.sqa.backend import load_model
+
+WARMUP_PASSES = 2
+
+
+class SQA_Engine(object):
+    """
+        Signal quality model shared by the live assessment and the analysis: the weights are loaded once and warmed up
+        on a worker thread when the engine starts, which then serves the queued requests. The windows of the requests
+        queued within latency_budget_ms of the oldest one are run together, in batches of at most max_batch_size windows
+    """
+    def __init__(self, model_config, device=None, max_batch_size=None, latency_budget_ms=None):
+        self.model_config = model_config
+        inference_config = model_config.get("inference", {})
+        self.max_batch_size = max(int(max_batch_size if max_batch_size is not None else inference_config.get("max_batch_size", 64)), 1)
+        self.latency_budget = (latency_budget_ms if latency_budget_ms is not None else inference_config.get("latency_budget_ms", 5)) / 1000.0
+        self.total_samples = int(model_config["data"]["window_len_sec"] * model_config["data"]["target_fs"])
+        if device is None:
+            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+            print(f"Using {device} device")
+        self.device = device
+        self.model = None
+        self.requests = queue.Queue()
+        self.ready = threading.Event()
+        # held while the model runs, by the worker thread and by the streaming assessment
+        self.model_lock = threading.Lock()
+        self.thread = None
+        self.stats = {"requests": 0, "windows": 0, "batches": 0, "load_ms": 0.0, "warmup_ms": 0.0}
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def wait_ready(self, timeout=None):
+        """
+            Waits for the model to be loaded and warmed up, returns False if it could not be loaded
+        """
+        self.ready.wait(timeout)
+        return self.model is not None
+
+    def load(self):
+        start = time.perf_counter()
+        self.model, self.device = load_model(self.model_config, self.device)
+        self.stats["load_ms"] = (time.perf_counter() - start) * 1000
+        if self.model is None:
+            return
+        start = time.perf_counter()
+        with torch.no_grad(), self.model_lock:
+            for batch_size in sorted(set([1, self.max_batch_size])):
+                input_vec = torch.zeros((batch_size, 1, self.total_samples), device=self.device)
+                for _ in range(WARMUP_PASSES):
+                    self.model(input_vec)
+        self.stats["warmup_ms"] = (time.perf_counter() - start) * 1000
+
+    def submit(self, windows):
+        """
+            Queues (n_windows, total_samples) normalized windows, returns a Future of their (n_windows, total_samples)
+            signal quality
+        """
+        future = Future()
+        self.requests.put((time.monotonic(), np.asarray(windows, dtype=np.float32).reshape(-1, self.total_samples), future))
+        return future
+
+    def infer(self, windows, timeout=None):
+        return self.submit(windows).result(timeout)
+
+    def run_streaming(self, stream_encoder, windows, shift, reset):
+        """
+            Signal quality of the (n_windows, total_samples) windows of a Streaming_Encoder of the model, which moved by
+            shift samples since its previous call, run on the calling thread while holding the model
+        """
+        with torch.no_grad(), self.model_lock:
+            input_vec = torch.tensor(windows, dtype=torch.float).unsqueeze(1).to(self.device)
+            embeddings = stream_encoder(input_vec, shift, reset)
+            # the factorization of the head spans the whole window, it is run in full at every step
+            sqa_vecs = self.model.sqa_head(embeddings)
+            if isinstance(sqa_vecs, tuple):
+                sqa_vecs = sqa_vecs[0]
+        return sqa_vecs.cpu().numpy()
+
+    def next_batch(self):
+        # the oldest request and those queued until its latency budget runs out or the batch is full
+        request = self.requests.get()
+        if request is None:
+            return None
+        batch = [request]
+        n_windows = len(request[1])
+        deadline = request[0] + self.latency_budget
+        while n_windows < self.max_batch_size:
+            try:
+                request = self.requests.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if request is None:
+                self.requests.put(None)
+                break
+            batch.append(request)
+            n_windows += len(request[1])
+        return batch
+
+    def run_batch(self, batch):
+        windows = np.concatenate([request[1] for request in batch])
+        sqa_vecs = []
+        with torch.no_grad():
+            for start in range(0, len(windows), self.max_batch_size):
+                input_vec = torch.from_numpy(windows[start: start + self.max_batch_size]).unsqueeze(1).to(self.device)
+                with self.model_lock:
+                    _, sqa_vec = self.model(input_vec)
+                sqa_vecs.append(sqa_vec.cpu().numpy().squeeze(1))
+                self.stats["batches"] += 1
+        sqa_vecs = np.concatenate(sqa_vecs)
+        start = 0
+        for _, request_windows, future in batch:
+            future.set_result(sqa_vecs[start: start + len(request_windows)])
+            start += len(request_windows)
+        self.stats["requests"] += len(batch)
+        self.stats["windows"] += len(windows)
+
+    def run(self):
+        try:
+            self.load()
+        except Exception as e:
+            print("Error loading the signal quality model:", e)
+            self.model = None
+        self.ready.set()
+
+        while True:
+            batch = self.next_batch()
+            if batch is None:
+                break
+            if self.model is None:
+                for request in batch:
+                    request[2].set_exception(RuntimeError("Signal quality model not loaded"))
+                continue
+            try:
+                self.run_batch(batch)
+            except Exception as e:
+                for request in batch:
+                    if not request[2].done():
+                        request[2].set_exception(e)
+
+
+engines = {}
+engines_lock = threading.Lock()
+
+
+def get_engine(model_config_path):
+    """
+        Returns the started engine of the model config at model_config_path, created on first use in the process
+    """
+    key = str(model_config_path)
+    with engines_lock:
+        if key not in engines:
+            with open(key) as json_file:
+                model_config = json.load(json_file)
+            engines[key] = SQA_Engine(model_config)
+            engines[key].start()
+        return engines[key]
@@ -9,19 +9,13 @@ import torch.nn as nn
 import matplotlib.pyplot as plt
 from scipy import signal
 
-from PhysioKit2.sqa.model.SQAPhysMD import Model as sqPPG
-from importlib.resources import files
+from PhysioKit2.sqa.engine import get_engine
 
 class sqaPPGInference(object):
     """
         The class to infer signal quality for BVP signal
     """
-    def __init__(self, model_config, debug=False) -> None:
-
-        # Get cpu, gpu or mps device for inference.
-        device = ("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"Using {device} device")
-        self.device = torch.device(device)
+    def __init__(self, model_config, debug=False, max_batch_size=None) -> None:
 
         if os.path.exists(model_config):
             with open(model_config) as json_file:
@@ -38,43 +32,43 @@ class sqaPPGInference(object):
         self.total_samples = int((self.seq_len) * self.target_fs)
 
         self.sq_resolution = self.model_config["data"]["sq_resolution_sec"]
+        # windows per forward pass
+        if max_batch_size is None:
+            max_batch_size = self.model_config.get("inference", {}).get("max_batch_size", 64)
+        self.max_batch_size = max(int(max_batch_size), 1)
 
-        self.sqPPG_model = sqPPG(self.device, self.model_config).to(self.device)
-        ckpt_path = files('PhysioKit2.sqa.ckpt').joinpath(self.model_config["ckpt_name"])
-        if os.path.exists(ckpt_path):
-            checkpoint = torch.load(ckpt_path, map_location=self.device)
-            self.sqPPG_model.load_state_dict(checkpoint['model_state_dict'])
-            # optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
-        else:
-            print("No checkpoint found, existing...")
-            # exit()
-            return -1
+        # model shared with the other consumers of the process, loaded and warmed up on its own thread
+        self.engine = get_engine(model_config)
 
         # self.sos = signal.butter(0, (0.5, 5.0), 'bandpass', fs=self.target_fs, output='sos')
-        self.sqPPG_model.eval()
 
     def run_inference(self, bvp_vec, axis=0):
+        """
+            Signal quality of a batch of windows: bvp_vec holds one window per row when axis is 1 (n_windows, n_samples),
+            or per column when axis is 0. Each window is resampled and min-max normalized on its own, and the batch is run
+            by the shared engine in requests of at most max_batch_size windows. Returns the (n_windows, total_samples)
+            signal quality
+        """
         with torch.no_grad():
             if self.debug:
                 t0 = time.time()
+            bvp_vec = np.asarray(bvp_vec, dtype=float)
+            if bvp_vec.ndim == 1:
+                bvp_vec = bvp_vec.reshape(1, -1)
+            elif axis == 0:
+                bvp_vec = bvp_vec.T
             # bvp_vec = signal.sosfilt(self.sos, bvp_vec) # bvp_vec needs to be filtered in the same range            
-            bvp_vec = signal.resample(bvp_vec, self.total_samples, axis=axis)
+            bvp_vec = signal.resample(bvp_vec, self.total_samples, axis=1)
 
-            min_r_ppg = np.min(bvp_vec)
-            max_r_ppg = np.max(bvp_vec)
+            min_r_ppg = np.min(bvp_vec, axis=1, keepdims=True)
+            max_r_ppg = np.max(bvp_vec, axis=1, keepdims=True)
             bvp_vec = (bvp_vec - min_r_ppg)/ (max_r_ppg - min_r_ppg)
             # print("bvp_vec.shape", bvp_vec.shape)
 
-            input_vec = torch.tensor(bvp_vec, dtype=torch.float)
-            input_vec = input_vec.unsqueeze(1)
-            # print("input_vec.shape", input_vec.shape)
-            # exit()
-
-            input_vec = input_vec.to(self.device)        
-
-            # print("input_vec.shape", input_vec.shape)
-            sqa_vec = self.sqPPG_model(input_vec)
-            sqa_vec = sqa_vec.cpu().numpy().squeeze(1)
+            # requests of at most max_batch_size windows, batched by the engine with those of the other consumers
+            requests = [self.engine.submit(bvp_vec[start: start + self.max_batch_size])
+                        for start in range(0, bvp_vec.shape[0], self.max_batch_size)]
+            sqa_vec = np.concatenate([request.result() for request in requests])
             # print("sqa_vec.shape", sqa_vec.shape)
 
             if self.debug:
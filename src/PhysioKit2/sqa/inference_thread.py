@@ -1,14 +1,16 @@
 import os
 import json
+from collections import deque
 import numpy as np
 import time
 
 import torch
 from scipy import signal
 from PySide6.QtCore import Signal, QThread, Signal
-from importlib.resources import files
 
-from PhysioKit2.sqa.model.SQAPhysMD import Model as sqPPG
+from PhysioKit2.sqa.engine import get_engine
+from PhysioKit2.sqa.streaming import Streaming_Encoder
+from PhysioKit2.utils.streaming_filters import Circular_Buffer, Streaming_Resampler
 
 class sqaPPGInference(QThread):
     """
@@ -19,11 +21,6 @@ class sqaPPGInference(QThread):
     def __init__(self, model_config, fs, nCh, axis, parent):
         super(sqaPPGInference, self).__init__(parent=parent)
 
-        # Get cpu, gpu or mps device for inference.
-        device = ("cuda" if torch.cuda.is_available() else "cpu")
-        print(f"Using {device} device")
-        self.device = torch.device(device)
-
         if os.path.exists(model_config):
             with open(model_config) as json_file:
                 self.model_config = json.load(json_file)
@@ -51,14 +48,23 @@ class sqaPPGInference(QThread):
         self.process_flag = False
         self.model_loaded = False
 
-        if self.nCh == 1:
-            self.bvp_vec_1 = np.zeros(self.win_samples)
-        elif self.nCh ==2:
-            self.bvp_vec_1 = np.zeros(self.win_samples)
-            self.bvp_vec_2 = np.zeros(self.win_samples)
-        else:
-            print("Currenly the application only handles 2 PPG channels for signal quality")
-            return
+        self.bvp_buffer = Circular_Buffer(self.win_samples, self.nCh, fill_value=0)
+
+        # the model starts loading and warming up on the engine thread while the acquisition starts
+        self.engine = get_engine(model_config)
+
+        # experimental streaming assessment, off by default: the model input is resampled as the samples arrive, and
+        # the encoder only computes the activations that change as the window moves
+        inference_config = self.model_config.get("inference", {})
+        self.streaming = inference_config.get("streaming", False)
+        self.norm_tolerance = inference_config.get("streaming_norm_tolerance", 0.0)
+        self.pending = deque()
+        self.resampler = Streaming_Resampler(self.fs, self.target_fs, self.nCh)
+        self.input_buffer = Circular_Buffer(self.total_samples, self.nCh, fill_value=0)
+        self.input_pending = np.zeros((0, self.nCh))
+        self.n_input = 0
+        self.norm_range = None
+        self.stream_encoder = None
 
 
     def stop(self):
@@ -68,21 +74,27 @@ class sqaPPGInference(QThread):
 
 
     def add_sq_data(self, sig_vals):
-        sig_val_1, sig_val_2 = sig_vals 
-        self.bvp_vec_1 = np.roll(self.bvp_vec_1, -1)
-        self.bvp_vec_1[-1] = sig_val_1
-
-        if self.nCh > 1:
-            self.bvp_vec_2 = np.roll(self.bvp_vec_2, -1)
-            self.bvp_vec_2[-1] = sig_val_2
+        if isinstance(sig_vals, np.ndarray):
+            # block of samples: (n_samples, nCh)
+            n_new = sig_vals.shape[0]
+            if n_new == 0:
+                return
+            self.bvp_buffer.extend(sig_vals[:, :self.nCh])
+            if self.streaming:
+                self.pending.append(np.array(sig_vals[:, :self.nCh], dtype=float))
+        else:
+            n_new = 1
+            self.bvp_buffer.append(sig_vals[:self.nCh])
+            if self.streaming:
+                self.pending.append(np.array(sig_vals[:self.nCh], dtype=float).reshape(1, -1))
 
         if not self.init_window_filled:
-            self.count_init_window += 1
+            self.count_init_window += n_new
             if self.count_init_window >= self.win_samples:
                 self.init_window_filled = True
                 self.process_flag = True
         else:
-            self.count_step += 1
+            self.count_step += n_new
             if self.count_step >= self.step_samples:
                 self.process_flag = True
                 self.count_step = 0
@@ -93,66 +105,100 @@ class sqaPPGInference(QThread):
         while not self.stop_flag:
 
             if not self.model_loaded:
-                self.sqPPG_model = sqPPG(self.device, self.model_config).to(self.device)
-                ckpt_path = files('PhysioKit2.sqa.ckpt').joinpath(self.model_config["ckpt_name"])
-                if os.path.exists(ckpt_path):
-                    checkpoint = torch.load(ckpt_path, map_location=self.device)
-                    if "model_state_dict" in checkpoint:
-                        self.sqPPG_model.load_state_dict(checkpoint['model_state_dict'], strict=False)
-                    else:
-                        self.sqPPG_model.load_state_dict(checkpoint, strict=False)
-                    # optimizer.load_state_dict(checkpoint['optimizer_state_dict'])
-                else:
+                if not self.engine.wait_ready():
                     print("No checkpoint found, existing...")
                     # exit()
                     return -1
 
                 # self.sos = signal.butter(0, (0.5, 5.0), 'bandpass', fs=self.target_fs, output='sos')
-                self.sqPPG_model.eval()
-                
+
+                if self.streaming:
+                    self.start_streaming()
                 self.model_loaded = True
 
+            elif self.streaming:
+                if not self.stream_step():
+                    time.sleep(self.sleep_time)
+
             elif self.process_flag:
                 self.process_flag = False
 
                 with torch.no_grad():
-                    bvp_vec_1 = self.bvp_vec_1.reshape(1, -1)
-                    bvp_vec_1 = signal.resample(bvp_vec_1, self.total_samples, axis=self.axis)
+                    # all the PPG channels as one (nCh, total_samples) request to the shared engine
+                    bvp_vecs = self.bvp_buffer.get().T
+                    bvp_vecs = signal.resample(bvp_vecs, self.total_samples, axis=self.axis)
 
-                    min_r_ppg = np.min(bvp_vec_1)
-                    max_r_ppg = np.max(bvp_vec_1)
-                    bvp_vec_1 = (bvp_vec_1 - min_r_ppg)/ (max_r_ppg - min_r_ppg)
-                    bvp_vec_1 = 2*bvp_vec_1 - 1
+                    min_r_ppg = np.min(bvp_vecs, axis=self.axis, keepdims=True)
+                    max_r_ppg = np.max(bvp_vecs, axis=self.axis, keepdims=True)
+                    bvp_vecs = (bvp_vecs - min_r_ppg)/ (max_r_ppg - min_r_ppg)
+                    bvp_vecs = 2*bvp_vecs - 1
 
-                    input_vec = torch.tensor(bvp_vec_1, dtype=torch.float)
-                    input_vec = input_vec.unsqueeze(1)
+                    sqa_vecs = self.engine.infer(bvp_vecs)[:, np.newaxis, :]
 
-                    input_vec = input_vec.to(self.device)        
-                    _, sqa_vec_1 = self.sqPPG_model(input_vec)
-                    sqa_vec_1 = sqa_vec_1.cpu().numpy().squeeze(1)
-
-                    if self.nCh > 1:
-                        bvp_vec_2 = self.bvp_vec_2.reshape(1, -1)
-                        bvp_vec_2 = signal.resample(bvp_vec_2, self.total_samples, axis=self.axis)
-
-                        min_r_ppg = np.min(bvp_vec_2)
-                        max_r_ppg = np.max(bvp_vec_2)
-                        bvp_vec_2 = (bvp_vec_2 - min_r_ppg)/ (max_r_ppg - min_r_ppg)
-                        bvp_vec_2 = 2*bvp_vec_2 - 1
-
-                        input_vec = torch.tensor(bvp_vec_2, dtype=torch.float)
-                        input_vec = input_vec.unsqueeze(1)
-
-                        input_vec = input_vec.to(self.device)        
-                        sqa_vec_2 = self.sqPPG_model(input_vec)
-                        sqa_vec_2 = sqa_vec_2.cpu().numpy().squeeze(1)
-
-                        sq_vec = [sqa_vec_1, sqa_vec_2]
-                    else:
-                        sq_vec = [sqa_vec_1]
-
-                    # print(sq_vec[0].shape)
+                    # one (1, total_samples) signal quality vector per channel
+                    sq_vec = list(sqa_vecs)
                     self.update_sq_vec.emit(sq_vec) # emit
             
             else:
-                time.sleep(self.sleep_time)
\ No newline at end of file
+                time.sleep(self.sleep_time)
+
+
+    def start_streaming(self):
+        try:
+            self.stream_encoder = Streaming_Encoder(self.engine.model, self.total_samples)
+        except ValueError as e:
+            print("Streaming signal quality assessment is not supported by the model, assessing whole windows:", e)
+            self.streaming = False
+            return
+        # hop of the window in model input samples, a multiple of the pooling strides of the encoder
+        alignment = self.stream_encoder.alignment
+        step = self.step_samples * self.target_fs / float(self.fs)
+        self.hop = max(int(round(step / alignment)) * alignment, alignment)
+
+
+    def stream_step(self):
+        # resamples the samples received since the last call, returns True if the window was assessed
+        blocks = []
+        while self.pending:
+            blocks.append(self.pending.popleft())
+        if len(blocks) > 0:
+            resampled = self.resampler.resample_block(np.concatenate(blocks))
+            self.input_pending = np.concatenate([self.input_pending, resampled])
+
+        # the window moves by a multiple of the alignment, the other samples are kept for the next step
+        filled = self.n_input >= self.total_samples
+        n_new = (self.input_pending.shape[0] // self.stream_encoder.alignment) * self.stream_encoder.alignment
+        if n_new == 0 or (filled and n_new < self.hop):
+            return False
+        self.input_buffer.extend(self.input_pending[:n_new])
+        self.input_pending = self.input_pending[n_new:]
+        self.n_input += n_new
+        if self.n_input < self.total_samples:
+            return False
+
+        self.assess_window(n_new if filled else None)
+        return True
+
+
+    def assess_window(self, shift):
+        bvp_vecs = self.input_buffer.get().T
+        min_r_ppg = np.min(bvp_vecs, axis=1, keepdims=True)
+        max_r_ppg = np.max(bvp_vecs, axis=1, keepdims=True)
+
+        # channels whose range changed beyond the tolerance are computed in full with the range of the new window,
+        # the others keep the normalization of their cached activations
+        reset = np.ones(self.nCh, dtype=bool)
+        if shift is not None and self.norm_range is not None:
+            cached_min, cached_max = self.norm_range
+            tolerance = self.norm_tolerance * (cached_max - cached_min)
+            reset = ((np.abs(min_r_ppg - cached_min) > tolerance) | (np.abs(max_r_ppg - cached_max) > tolerance)).ravel()
+            min_r_ppg = np.where(reset[:, np.newaxis], min_r_ppg, cached_min)
+            max_r_ppg = np.where(reset[:, np.newaxis], max_r_ppg, cached_max)
+        self.norm_range = (min_r_ppg, max_r_ppg)
+        bvp_vecs = (bvp_vecs - min_r_ppg)/ (max_r_ppg - min_r_ppg)
+        bvp_vecs = 2*bvp_vecs - 1
+
+        sqa_vecs = self.engine.run_streaming(self.stream_encoder, bvp_vecs, shift, reset.tolist())
+
+        # one (1, total_samples) signal quality vector per channel
+        self.update_sq_vec.emit(list(sqa_vecs))
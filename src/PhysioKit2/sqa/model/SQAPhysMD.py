@@ -61,7 +61,7 @@ class _MatrixDecompositionBase(nn.Module):
         # print('eta', self.eta)
         # print('rand_init', self.rand_init)
 
-    def _build_bases(self, B, S, D, R):
+    def _build_bases(self, B, S, D, R, like=None):
         raise NotImplementedError
 
     def local_step(self, x, bases, coef):
@@ -95,19 +95,19 @@ class _MatrixDecompositionBase(nn.Module):
             D = T // self.S
             N = C * H * W 
 
-            x = x.view(B * self.S, D, N)
+            x = x.view(-1, D, N)
 
         elif self.dim == "2D":      # (B, C, H, W) -> (B * S, D, N)
             B, C, H, W = x.shape
             D = C // self.S
             N = H * W
-            x = x.view(B * self.S, D, N)
+            x = x.view(-1, D, N)
 
         elif self.dim == "1D":                       # (B, C, L) -> (B * S, D, N)
             B, C, L = x.shape
             D = L // self.S
             N = C
-            x = x.view(B * self.S, D, N)
+            x = x.view(-1, D, N)
 
         else:
             print("Dimension not supported")
@@ -128,8 +128,9 @@ class _MatrixDecompositionBase(nn.Module):
             self.register_buffer('bases', bases)
 
         # (S, D, R) -> (B * S, D, R)
+        # the batch dimension is taken from the shape of x, so that a traced model runs with any batch size
         if self.rand_init:
-            bases = self._build_bases(B, self.S, D, self.R)
+            bases = self._build_bases(B, self.S, D, self.R, like=x)
         else:
             bases = self.bases.repeat(B, 1, 1).to(self.device)
 
@@ -143,13 +144,13 @@ class _MatrixDecompositionBase(nn.Module):
 
         if self.dim == "3D":
             # (B * S, D, N) -> (B, C, H, W)
-            x = x.view(B, C, T, H, W)
+            x = x.view(-1, C, T, H, W)
         elif self.dim == "2D":
             # (B * S, D, N) -> (B, C, H, W)
-            x = x.view(B, C, H, W)
+            x = x.view(-1, C, H, W)
         else:
             # (B * S, D, N) -> (B, C, L)
-            x = x.view(B, C, L)
+            x = x.view(-1, C, L)
 
             # # smoothening the temporal dimension
             # # print("Intermediate-1 x", x.shape)
@@ -162,7 +163,7 @@ class _MatrixDecompositionBase(nn.Module):
             # x = (x - x.min())/x.std()
 
         # (B * L, D, R) -> (B, L, N, D)
-        bases = bases.view(B, self.S, D, self.R)
+        bases = bases.view(-1, self.S, D, self.R)
 
         if not self.rand_init and not self.training and not return_bases:
             self.online_update(bases)
@@ -186,8 +187,12 @@ class NMF(_MatrixDecompositionBase):
         self.device = device
         self.inv_t = 1
 
-    def _build_bases(self, B, S, D, R):
-        bases = torch.rand((B * S, D, R)).to(self.device)
+    def _build_bases(self, B, S, D, R, like=None):
+        if like is not None:
+            # (B * S, D, N) -> (B * S, D, R)
+            bases = torch.rand_like(like[:, :, :1].expand(-1, -1, R))
+        else:
+            bases = torch.rand((B * S, D, R)).to(self.device)
         # bases = torch.ones((B * S, D, R)).to(self.device)
         bases = F.normalize(bases, dim=1)
 
@@ -227,8 +232,12 @@ class VQ(_MatrixDecompositionBase):
         super().__init__(device, md_config, debug=debug, dim=dim)
         self.device = device
 
-    def _build_bases(self, B, S, D, R):
-        bases = torch.randn((B * S, D, R)).to(self.device)
+    def _build_bases(self, B, S, D, R, like=None):
+        if like is not None:
+            # (B * S, D, N) -> (B * S, D, R)
+            bases = torch.randn_like(like[:, :, :1].expand(-1, -1, R))
+        else:
+            bases = torch.randn((B * S, D, R)).to(self.device)
         # bases = torch.ones((B * S, D, R)).to(self.device)
         bases = F.normalize(bases, dim=1)
         return bases
@@ -565,7 +574,9 @@ class SQ_Head(nn.Module):
             print("     signal_embeddings.shape", signal_embeddings.shape)
 
         if self.use_fsam:
-            att_mask, appx_error = self.fsam(signal_embeddings - signal_embeddings.min())
+            # minimum of each window, so that the windows of a batch are independent of each other
+            embeddings_min = signal_embeddings.amin(dim=(1, 2), keepdim=True)
+            att_mask, appx_error = self.fsam(signal_embeddings - embeddings_min)
 
             if self.debug:
                 print("att_mask.shape", att_mask.shape)
@@ -582,7 +593,7 @@ class SQ_Head(nn.Module):
             # factorized_embeddings = self.fsam_norm(x)
 
             # # Multiplication with Residual connection
-            x = torch.mul(signal_embeddings - signal_embeddings.min() + self.bias1, att_mask - att_mask.min() + self.bias1)
+            x = torch.mul(signal_embeddings - embeddings_min + self.bias1, att_mask - att_mask.amin(dim=(1, 2), keepdim=True) + self.bias1)
             factorized_embeddings = signal_embeddings + self.fsam_norm(x)
 
             # # # Concatenate
@@ -0,0 +1,165 @@
+import os
+import sys
+import argparse
+import copy
+import glob
+import io
+import json
+import numpy as np
+from scipy import signal
+
+import torch
+import torch.nn as nn
+from importlib.resources import files
+
+from PhysioKit2.sqa.backend import load_eager_model, int8_path, forward_time, select_quantized_engine
+from PhysioKit2.utils.load_data import read_csv_columns
+
+# Conv1d, BatchNorm1d, ReLU of the encoder fused before quantization
+ENCODER_FUSED_MODULES = [["1", "2", "3"], ["6", "7", "8"], ["11", "12", "13"], ["16", "17", "18"]]
+
+
+def recording_windows(datapath, fs, window_len_sec, total_samples):
+    """
+        Windows of window_len_sec of the PPG channels (by header name) of the CSV recordings in datapath, band-pass
+        filtered and resampled to total_samples. Returns a list of (n_windows, total_samples) arrays, one per recording
+    """
+    sos = signal.butter(2, (0.5, 5.0), 'bandpass', fs=fs, output='sos')
+    window_samples = int(window_len_sec * fs)
+    windows = []
+    for filepath in sorted(glob.glob(os.path.join(datapath, "**", "*.csv*"), recursive=True)):
+        if filepath.endswith("_events.csv"):
+            continue
+        names, values, _ = read_csv_columns(filepath)
+        for name, ppg in zip(names, values):
+            if "ppg" not in name.lower() or len(ppg) < window_samples:
+                continue
+            ppg = -1 * signal.sosfilt(sos, ppg)
+            n_windows = len(ppg) // window_samples
+            segs = ppg[:n_windows * window_samples].reshape(n_windows, window_samples)
+            windows.append(signal.resample(segs, total_samples, axis=1))
+    return windows
+
+
+def normalize(windows, signed=False):
+    # min-max normalization of each window, to [0, 1] as in the analysis, or to [-1, 1] as in the live assessment
+    min_r_ppg = np.min(windows, axis=1, keepdims=True)
+    max_r_ppg = np.max(windows, axis=1, keepdims=True)
+    windows = (windows - min_r_ppg) / (max_r_ppg - min_r_ppg)
+    windows = windows[np.all(np.isfinite(windows), axis=1)]
+    return 2 * windows - 1 if signed else windows
+
+
+def model_inputs(windows):
+    return torch.tensor(np.concatenate([normalize(windows), normalize(windows, signed=True)]), dtype=torch.float).unsqueeze(1)
+
+
+def quantize_int8(model, calibration_inputs, batch_size=64):
+    """
+        Static int8 quantization of the convolutional encoder of a float model, which holds most of its compute,
+        calibrated on calibration_inputs. The factorization module and decoder stay in float
+    """
+    engine = select_quantized_engine()
+    qmodel = copy.deepcopy(model).cpu().eval()
+    encoder = qmodel.encoder.encoder
+    for index, module in enumerate(encoder):
+        if isinstance(module, nn.Dropout1d):
+            encoder[index] = nn.Identity()
+    torch.ao.quantization.fuse_modules(encoder, ENCODER_FUSED_MODULES, inplace=True)
+    qmodel.encoder.encoder = nn.Sequential(torch.ao.quantization.QuantStub(), encoder, torch.ao.quantization.DeQuantStub())
+    qmodel.encoder.encoder.qconfig = torch.ao.quantization.get_default_qconfig(engine)
+    torch.ao.quantization.prepare(qmodel, inplace=True)
+    with torch.no_grad():
+        for start in range(0, calibration_inputs.shape[0], batch_size):
+            qmodel(calibration_inputs[start: start + batch_size])
+    torch.ao.quantization.convert(qmodel, inplace=True)
+    return qmodel
+
+
+def model_size(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+def signal_quality(model, inputs, batch_size=64, seed=0):
+    # the same seed gives both models the same random NMF bases
+    torch.manual_seed(seed)
+    sq_vecs = []
+    with torch.no_grad():
+        for start in range(0, inputs.shape[0], batch_size):
+            _, sq_vec = model(inputs[start: start + batch_size])
+            sq_vecs.append(sq_vec.squeeze(1).numpy())
+    return np.concatenate(sq_vecs)
+
+
+def accuracy_report(float_sq, int8_sq, threshold):
+    # signal quality per window as in the analysis: 1 - median of the model output
+    float_sqi = 1 - np.median(float_sq, axis=1)
+    int8_sqi = 1 - np.median(int8_sq, axis=1)
+    return {"windows": int(float_sq.shape[0]),
+            "mean_abs_diff": float(np.mean(np.abs(float_sq - int8_sq))),
+            "max_abs_diff": float(np.max(np.abs(float_sq - int8_sq))),
+            "window_sqi_mean_abs_diff": float(np.mean(np.abs(float_sqi - int8_sqi))),
+            "window_sqi_correlation": float(np.corrcoef(float_sqi, int8_sqi)[0, 1]) if len(float_sqi) > 1 else 1.0,
+            "window_sqi_agreement": float(np.mean((float_sqi > threshold) == (int8_sqi > threshold))),
+            "sqi_threshold": threshold}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quantize SQAPhysMD to int8, calibrated on PPG recordings, and report its accuracy, latency and size")
+    parser.add_argument('--model_config', type=str, dest='model_config', help='Config file for model',
+                        default=str(files('PhysioKit2.sqa.config').joinpath('SQAPhysMD.json')))
+    parser.add_argument('--datapath', type=str, dest='datapath', help='Directory of CSV recordings with PPG channels', default="sample_data")
+    parser.add_argument('--fs', type=float, dest='fs', help='Sampling rate of the recordings', default=250)
+    parser.add_argument('--output', type=str, dest='output', help='Path of the quantized model, default: next to the checkpoint', default=None)
+    parser.add_argument('--threshold', type=float, dest='threshold', help='Signal quality threshold for the agreement of windows', default=0.5)
+    args = parser.parse_args()
+
+    with open(args.model_config) as json_file:
+        model_config = json.load(json_file)
+    output_path = os.path.abspath(args.output) if args.output is not None else int8_path(model_config)
+    total_samples = int(model_config["data"]["window_len_sec"] * model_config["data"]["target_fs"])
+
+    model = load_eager_model(model_config, torch.device("cpu"))
+    if model is None:
+        return 1
+    windows = recording_windows(args.datapath, args.fs, model_config["data"]["window_len_sec"], total_samples)
+    if len(windows) < 2:
+        print("At least two PPG recordings are needed, found:", len(windows))
+        return 1
+    # recordings alternate between calibration and evaluation
+    calibration_inputs = model_inputs(np.concatenate(windows[0::2]))
+    evaluation_inputs = model_inputs(np.concatenate(windows[1::2]))
+    print("Calibration windows:", calibration_inputs.shape[0], "evaluation windows:", evaluation_inputs.shape[0])
+
+    qmodel = quantize_int8(model, calibration_inputs)
+    report = accuracy_report(signal_quality(model, evaluation_inputs), signal_quality(qmodel, evaluation_inputs), args.threshold)
+    report["float_size_mb"] = model_size(model) / 1e6
+    report["int8_size_mb"] = model_size(qmodel) / 1e6
+    report["latency_ms"] = []
+    for batch_size in [1, 8, 64]:
+        input_vec = evaluation_inputs[:batch_size]
+        report["latency_ms"].append({"batch_size": int(input_vec.shape[0]), "float": forward_time(model, input_vec, 50),
+                                     "int8": forward_time(qmodel, input_vec, 50)})
+
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(qmodel, evaluation_inputs[:2], check_trace=False))
+    traced.save(output_path)
+    report["engine"] = torch.backends.quantized.engine
+    report_path = os.path.splitext(output_path)[0] + "_report.json"
+    with open(report_path, 'w') as json_file:
+        json.dump(report, json_file, indent=4)
+
+    print("Saved:", output_path)
+    print("Windows on the same side of the threshold: {:.1%}, correlation of window signal quality: {:.4f}, mean abs diff: {:.4f}".format(
+        report["window_sqi_agreement"], report["window_sqi_correlation"], report["mean_abs_diff"]))
+    print("Model size: {:.2f} MB float, {:.2f} MB int8".format(report["float_size_mb"], report["int8_size_mb"]))
+    for latency in report["latency_ms"]:
+        print("Batch {:>3}: {:.2f} ms float, {:.2f} ms int8".format(latency["batch_size"], latency["float"], latency["int8"]))
+    print("Report:", report_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
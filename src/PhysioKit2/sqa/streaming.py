@@ -0,0 +1,202 @@
+import sys
+import argparse
+import json
+import time
+import numpy as np
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+from importlib.resources import files
+
+from PhysioKit2.sqa.backend import load_eager_model
+
+POINTWISE_MODULES = (nn.BatchNorm1d, nn.ReLU, nn.Dropout, nn.Dropout1d, nn.Identity)
+
+
+class Streaming_Encoder(object):
+    """
+        Incremental evaluation of the convolutional encoder of SQAPhysMD on a window sliding over a stream. The output
+        of every layer is cached, and when the window moves by `shift` samples only the positions whose receptive field
+        reaches the new samples, or the zero padding at either end of the window, are computed again. The other positions
+        are taken from the cache, so that the output is the same as that of the encoder run on the whole window.
+        shift shall be a multiple of `alignment`, the product of the pooling strides
+    """
+    def __init__(self, model, window_len):
+        encoder = getattr(getattr(model, "encoder", None), "encoder", None)
+        if isinstance(model, torch.jit.ScriptModule) or not isinstance(encoder, nn.Sequential):
+            raise ValueError("the encoder layers of the eager model are needed")
+        self.window_len = int(window_len)
+        self.layers = []
+        self.lengths = [self.window_len]
+        self.rates = [1]
+        for module in encoder:
+            if isinstance(module, nn.Conv1d):
+                if module.stride[0] != 1 or isinstance(module.padding, str) or module.padding_mode != "zeros" or \
+                        2 * module.padding[0] != module.dilation[0] * (module.kernel_size[0] - 1):
+                    raise ValueError("only stride 1 convolutions with same zero padding are supported")
+                self.layers.append((module, "conv", module.padding[0]))
+            elif isinstance(module, nn.MaxPool1d):
+                stride = module.stride if isinstance(module.stride, int) else module.stride[0]
+                if module.kernel_size != stride or module.padding != 0 or module.dilation != 1:
+                    raise ValueError("only pooling with kernel size equal to its stride is supported")
+                self.layers.append((module, "pool", stride))
+            elif isinstance(module, POINTWISE_MODULES):
+                self.layers.append((module, "point", 0))
+            else:
+                raise ValueError("unsupported encoder layer: " + type(module).__name__)
+            stride = self.layers[-1][2] if self.layers[-1][1] == "pool" else 1
+            self.lengths.append(self.lengths[-1] // stride)
+            self.rates.append(self.rates[-1] * stride)
+        self.alignment = self.rates[-1]
+        if self.window_len % self.alignment:
+            raise ValueError("the window length is not a multiple of the pooling strides")
+        self.caches = None
+        self.full_macs = sum(self.layer_macs(module, kind, self.lengths[nL + 1])
+                             for nL, (module, kind, _) in enumerate(self.layers))
+        self.stats = {"updates": 0, "full": 0, "macs": 0, "full_macs": 0}
+
+    def layer_macs(self, module, kind, n_positions):
+        if kind != "conv":
+            return 0
+        return module.out_channels * module.in_channels // module.groups * module.kernel_size[0] * n_positions
+
+    def run_layer(self, module, kind, size, prev, start, end):
+        # output positions [start, end) of the layer, from its full input prev
+        if kind == "conv":
+            in_len = prev.shape[2]
+            lo = start - size
+            hi = end + size
+            x = F.pad(prev[:, :, max(lo, 0): min(hi, in_len)], (max(-lo, 0), max(hi - in_len, 0)))
+            self.macs += self.layer_macs(module, kind, end - start) * prev.shape[0]
+            return F.conv1d(x, module.weight, module.bias, 1, 0, module.dilation, module.groups)
+        elif kind == "pool":
+            return module(prev[:, :, start * size: end * size])
+        # copy, as the activations may be computed in place
+        return module(prev[:, :, start: end].clone())
+
+    def __call__(self, x, shift=None, reset=None):
+        """
+            Encoder output for the (batch, 1, window_len) window x, which moved by shift samples since the previous call.
+            The windows of the rows set in reset, and all of them when shift is None, are computed in full
+        """
+        batch = x.shape[0]
+        if self.caches is None or self.caches[0].shape[0] != batch or shift is None or shift % self.alignment or \
+                shift >= self.window_len:
+            reset = [True] * batch
+        elif reset is None:
+            reset = [False] * batch
+        full_rows = [row for row in range(batch) if reset[row]]
+        stream_rows = [row for row in range(batch) if not reset[row]]
+
+        self.macs = 0
+        caches = []
+        prev = x
+        # positions at each end of the output of a layer that cannot be taken from the cache
+        left = 0
+        right = 0 if shift is None else shift
+        for nL, (module, kind, size) in enumerate(self.layers):
+            out_len = self.lengths[nL + 1]
+            if kind == "conv":
+                left += size
+                right += size
+            elif kind == "pool":
+                left = -(-left // size)
+                right = -(-right // size)
+
+            parts = []
+            if len(full_rows) > 0:
+                parts.append(self.run_layer(module, kind, size, prev[full_rows], 0, out_len))
+            if len(stream_rows) > 0:
+                stream_prev = prev[stream_rows]
+                if left + right >= out_len:
+                    parts.append(self.run_layer(module, kind, size, stream_prev, 0, out_len))
+                else:
+                    shift_out = shift // self.rates[nL + 1]
+                    cached = self.caches[nL][stream_rows]
+                    out = torch.empty_like(cached)
+                    out[:, :, left: out_len - right] = cached[:, :, left + shift_out: out_len - right + shift_out]
+                    if left > 0:
+                        out[:, :, :left] = self.run_layer(module, kind, size, stream_prev, 0, left)
+                    out[:, :, out_len - right:] = self.run_layer(module, kind, size, stream_prev, out_len - right, out_len)
+                    parts.append(out)
+
+            if len(parts) == 1:
+                prev = parts[0]
+            else:
+                prev = torch.empty((batch,) + tuple(parts[0].shape[1:]), dtype=parts[0].dtype, device=parts[0].device)
+                prev[full_rows] = parts[0]
+                prev[stream_rows] = parts[1]
+            caches.append(prev)
+
+        self.caches = caches
+        self.stats["updates"] += 1
+        self.stats["full"] += len(full_rows)
+        self.stats["macs"] += self.macs
+        self.stats["full_macs"] += self.full_macs * batch
+        return prev
+
+
+def compare(model, window_len, hop, n_updates=50, seed=0):
+    """
+        Difference between the streaming and full encoder outputs on a random walk signal, and the fraction of the
+        encoder multiply-accumulates computed and the time taken per update by the streaming encoder
+    """
+    rng = np.random.default_rng(seed)
+    stream = np.cumsum(rng.standard_normal(window_len + hop * n_updates))
+    # one normalization for the whole stream, so that every update can use the cache
+    stream = 2 * (stream - stream.min()) / (stream.max() - stream.min()) - 1
+    stream_encoder = Streaming_Encoder(model, window_len)
+    max_diff = 0.0
+    stream_time = 0.0
+    full_time = 0.0
+    with torch.no_grad():
+        for nUpdate in range(n_updates + 1):
+            x = torch.tensor(stream[nUpdate * hop: nUpdate * hop + window_len], dtype=torch.float).view(1, 1, -1)
+            start = time.perf_counter()
+            embeddings = stream_encoder(x, None if nUpdate == 0 else hop)
+            if nUpdate > 0:
+                stream_time += time.perf_counter() - start
+            start = time.perf_counter()
+            full_embeddings = model.encoder(x)
+            if nUpdate > 0:
+                full_time += time.perf_counter() - start
+            max_diff = max(max_diff, float(torch.max(torch.abs(embeddings - full_embeddings))))
+    # the first window is computed in full
+    macs_fraction = (stream_encoder.stats["macs"] - stream_encoder.full_macs) / float(stream_encoder.full_macs * n_updates)
+    return {"hop": hop, "max_abs_diff": max_diff, "macs_fraction": macs_fraction,
+            "streaming_ms": stream_time * 1000 / n_updates, "full_ms": full_time * 1000 / n_updates}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the streaming encoder of SQAPhysMD with the encoder run on whole windows")
+    parser.add_argument('--model_config', type=str, dest='model_config', help='Config file for model',
+                        default=str(files('PhysioKit2.sqa.config').joinpath('SQAPhysMD.json')))
+    parser.add_argument('--hop_sec', type=float, nargs='+', dest='hop_sec', help='Hops of the window in seconds', default=[0.5, 1.0, 2.0])
+    parser.add_argument('--tolerance', type=float, dest='tolerance', help='maximum absolute difference of the embeddings', default=1e-4)
+    args = parser.parse_args()
+
+    with open(args.model_config) as json_file:
+        model_config = json.load(json_file)
+    model = load_eager_model(model_config, torch.device("cpu"))
+    if model is None:
+        return 1
+    window_len = int(model_config["data"]["window_len_sec"] * model_config["data"]["target_fs"])
+    alignment = Streaming_Encoder(model, window_len).alignment
+
+    failed = False
+    print("{:>8} {:>14} {:>12} {:>14} {:>8}".format("hop", "max abs diff", "MACs", "streaming ms", "full ms"))
+    for hop_sec in args.hop_sec:
+        hop = max(int(round(hop_sec * model_config["data"]["target_fs"] / alignment)) * alignment, alignment)
+        result = compare(model, window_len, hop)
+        failed = failed or result["max_abs_diff"] > args.tolerance
+        print("{:>8} {:>14.2e} {:>11.1%} {:>14.3f} {:>8.3f}".format(hop, result["max_abs_diff"], result["macs_fraction"],
+                                                                  result["streaming_ms"], result["full_ms"]))
+    if failed:
+        print("Streaming encoder differs from the full encoder by more than", args.tolerance)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
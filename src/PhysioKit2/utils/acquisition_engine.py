@@ -0,0 +1,314 @@
+import time
+import numpy as np
+import serial
+import serial.tools.list_ports as lp
+
+from PhysioKit2.utils.acquisition_health import Acquisition_Health
+from PhysioKit2.utils.serial_reader import Serial_Reader
+from PhysioKit2.utils.multi_device import Multi_Device_Reader
+from PhysioKit2.utils.virtual_serial import Virtual_Serial, VIRTUAL_PORT_NAME
+
+# "data": raw samples while recording, "data_filt": filtered samples, "time": elapsed recording time (seconds),
+# "health": Acquisition_Health.report() dict, "log": status message, "record_stopped": timed recording completed
+TOPICS = ["data", "data_filt", "time", "health", "log", "record_stopped"]
+
+
+class Acquisition_Engine(object):
+    """
+        Qt free acquisition core: reads the serial port, filters the samples and publishes them to the subscribers of each topic.
+        Subscribers are called from the thread running run(), with a list per sample, or a numpy array per block when
+        config.BLOCK_MODE is set. The interface (Data_Acquisition_Thread) and physiokit_record are subscribers.
+        Samples are filtered only when there are subscribers to "data_filt".
+    """
+    def __init__(self, config):
+        self.config = config
+        self.subscribers = {topic: [] for topic in TOPICS}
+        self.stop_flag = False
+        self.filt_objs = {}
+        self.eda_moving_average_window_size = int(self.config.SAMPLING_RATE/4.0)
+
+        self.resp_lowcut = 0.1
+        self.resp_highcut = 0.5
+        self.ppg_lowcut = 0.5
+        self.ppg_highcut = 2.5
+        self.filt_order = 2
+
+        self.bf_out_flag = False
+        self.reader = None
+        self.record_flag = False
+        self.record_start_time = None
+        self.record_duration_ms = None
+        self.last_recorded = (0, None)   # number of samples recorded, and host time of the last one (ns)
+        self.prev_elapsed_time = 0
+        self.curr_elapsed_time = 0
+
+        self.ser = serial.Serial()
+        self.timeout = None  # specify timeout when using readline()
+        self.high_rate_timeout = 0.01   # bulk reads wait at most this long for data in high rate mode
+        self.health = Acquisition_Health(self.config.SAMPLING_RATE)
+        self.ports = lp.comports()
+
+
+    def subscribe(self, topic, callback):
+        self.subscribers[topic].append(callback)
+
+    def unsubscribe(self, topic, callback):
+        if callback in self.subscribers[topic]:
+            self.subscribers[topic].remove(callback)
+
+    def publish(self, topic, value):
+        for callback in self.subscribers[topic]:
+            callback(value)
+
+
+    def initialize_filters(self, channel_types):
+        # scipy is imported here, so that recording without filtering starts quickly
+        from PhysioKit2.utils.data_processing_lib import lFilter, lFilter_moving_average, lFilter_bank
+
+        for nCh in range(self.config.NCHANNELS):
+            if channel_types[nCh] == 'eda':
+                self.filt_objs[str(nCh)] = lFilter_moving_average(window_size=self.eda_moving_average_window_size)
+            elif channel_types[nCh] == 'resp':
+                self.filt_objs[str(nCh)] = lFilter(self.resp_lowcut, self.resp_highcut, self.config.SAMPLING_RATE, order=self.filt_order)
+            elif channel_types[nCh] == 'ppg':
+                self.filt_objs[str(nCh)] = lFilter(self.ppg_lowcut, self.ppg_highcut, self.config.SAMPLING_RATE, order=self.filt_order)
+
+        # block mode: one filter object per channel type, filtering all channels of that type at once
+        channel_types = list(channel_types[:self.config.NCHANNELS])
+        self.filt_bank = lFilter_bank(self.config.NCHANNELS)
+        if 'eda' in channel_types:
+            eda_channels = [nCh for nCh, ch_type in enumerate(channel_types) if ch_type == 'eda']
+            self.filt_bank.add_filter(lFilter_moving_average(window_size=self.eda_moving_average_window_size, nchannels=len(eda_channels)),
+                                      eda_channels)
+        if 'resp' in channel_types:
+            self.filt_bank.add_filter(lFilter(self.resp_lowcut, self.resp_highcut, self.config.SAMPLING_RATE, order=self.filt_order),
+                                      [nCh for nCh, ch_type in enumerate(channel_types) if ch_type == 'resp'])
+        if 'ppg' in channel_types:
+            self.filt_bank.add_filter(lFilter(self.ppg_lowcut, self.ppg_highcut, self.config.SAMPLING_RATE, order=self.filt_order),
+                                      [nCh for nCh, ch_type in enumerate(channel_types) if ch_type == 'ppg'])
+
+
+    def connectPort(self, port_name, baudrate=115200):
+        if self.config.DEVICE_PORTS is not None:
+            # several devices merged onto one timeline, configured in the "multi_device" section of SW config
+            if sum(self.config.DEVICE_NCHANNELS) != self.config.NCHANNELS:
+                print('Mismatch in the number of channels specified in JSON file and the total number of channels of the devices in SW config')
+                return False
+            self.ser = Multi_Device_Reader(self.config.DEVICE_PORTS, self.config.DEVICE_NCHANNELS, self.config.SAMPLING_RATE, baudrate,
+                                           self.config.SERIAL_PROTOCOL, self.health, timeout=self.high_rate_timeout,
+                                           replay_params=self.config.REPLAY_PARAMS)
+            self.reader = self.ser
+            return self.ser.open()
+
+        if port_name == VIRTUAL_PORT_NAME:
+            # hardware free replay of a recording or synthetic signals, configured in the "replay" section of SW config
+            self.ser = Virtual_Serial(fs=self.config.SAMPLING_RATE, nchannels=self.config.NCHANNELS, **self.config.REPLAY_PARAMS)
+        elif not isinstance(self.ser, serial.Serial):
+            self.ser = serial.Serial()
+        self.ser.port = port_name  # "/dev/cu.usbmodem14101" # 'COM3'  # Arduino serial port
+        self.ser.baudrate = baudrate
+        self.ser.timeout = self.high_rate_timeout if self.config.HIGH_RATE_MODE else self.timeout  # specify timeout when using readline()
+        self.ser.parity = serial.PARITY_NONE
+        self.ser.stopbits = serial.STOPBITS_ONE
+        # self.ser.bytesize = serial.EIGHTBITS
+        try:
+            self.ser.open()
+            self.reader = Serial_Reader(self.ser, self.config.NCHANNELS, self.config.SERIAL_PROTOCOL, self.health)
+            return self.ser.is_open
+        except serial.serialutil.SerialException:
+            return False
+
+        # self.ser.reset_input_buffer()
+        # self.ser.write(str.encode('1\r\n', 'UTF-8'))
+
+    def disconnectPort(self):
+        self.ser.close()
+        return
+
+
+    def add_bf_out_signal(self, val):
+        # self.bf_out_str = str(int(val))
+        self.bf_out_str = val
+        # print(self.bf_out_str)
+        self.bf_out_flag = True
+
+
+    def start_recording(self, duration_ms=None):
+        """
+            Starts publishing the raw samples on the "data" topic, for duration_ms from the first sample recorded or until stop_recording()
+        """
+        self.health.start_recording()
+        self.record_duration_ms = duration_ms
+        self.prev_elapsed_time = 0
+        self.curr_elapsed_time = 0
+        self.record_start_time = None
+        self.last_recorded = (0, None)
+        self.record_flag = True
+
+    def stop_recording(self):
+        self.record_flag = False
+
+
+    def mark_event(self):
+        """
+            Returns the (sample_index, host_monotonic_ns) of an event marked now: the index in the recording of the sample
+            acquired at this time, from the host time of the last recorded sample and the sampling rate, and at least the
+            index of the next sample to be recorded
+        """
+        host_monotonic_ns = time.monotonic_ns()
+        n_recorded, last_ns = self.last_recorded
+        sample_index = n_recorded
+        if last_ns is not None:
+            sample_index = max(n_recorded - 1 + int(round((host_monotonic_ns - last_ns) * self.config.SAMPLING_RATE / 1e9)), n_recorded)
+        return sample_index, host_monotonic_ns
+
+
+    def update_health(self):
+        health_report = self.health.report(self.ser.in_waiting)
+        if health_report is not None:
+            self.publish("health", health_report)
+
+
+    def idle(self, duration_s):
+        # called in place of reading the serial port while acquisition is not live
+        time.sleep(duration_s)
+
+
+    def update_record_time(self):
+        """
+            Updates the elapsed recording time and returns True if the data received is to be recorded
+        """
+        if not self.record_flag:
+            self.prev_elapsed_time = 0
+            self.curr_elapsed_time = 0
+            return False
+
+        if self.record_start_time is None:
+            self.record_start_time = time.monotonic()
+        elapsed_time = (time.monotonic() - self.record_start_time)*1000
+        if self.record_duration_ms is not None and (elapsed_time >= self.record_duration_ms):
+            self.record_flag = False
+            self.prev_elapsed_time = 0
+            self.curr_elapsed_time = 0
+            self.publish("record_stopped", True)
+            return False
+
+        self.curr_elapsed_time = int(round(elapsed_time/1000.0, 0))
+        if self.prev_elapsed_time < self.curr_elapsed_time:
+            self.prev_elapsed_time = self.curr_elapsed_time
+            self.publish("time", self.curr_elapsed_time)
+        return True
+
+
+    def process_sample(self, serial_data):
+        value = [int(serial_data[nCh]) for nCh in range(self.config.NCHANNELS)]
+
+        if self.update_record_time():
+            record_ns = time.monotonic_ns()
+            self.publish("data", value)
+            self.last_recorded = (self.last_recorded[0] + 1, record_ns)
+
+        if len(self.subscribers["data_filt"]) > 0:
+            #filt value update can be done at lower rate to optimize performance in future
+            value_filt = [self.filt_objs[str(nCh)].lfilt(value[nCh]) for nCh in range(self.config.NCHANNELS)]
+            self.publish("data_filt", value_filt)
+
+
+    def process_block(self, values, values_filt=None):
+        """
+            Filters a (n_samples, NCHANNELS) block, unless already filtered, and publishes it once per topic
+        """
+        if self.update_record_time():
+            record_ns = time.monotonic_ns()
+            self.publish("data", values)
+            self.last_recorded = (self.last_recorded[0] + len(values), record_ns)
+
+        if len(self.subscribers["data_filt"]) > 0:
+            self.publish("data_filt", self.filt_bank.lfilt(values) if values_filt is None else values_filt)
+
+
+    def run(self):
+        serial_samples = []
+        serial_data = []
+        block_parts = []
+        block_len = 0
+        block_start_time = time.monotonic()
+        self.health.reset(self.config.SAMPLING_RATE)
+        self.prev_elapsed_time = 0
+        self.curr_elapsed_time = 0
+
+        while not self.stop_flag:
+            if self.config.LIVE_ACQUISITION_FLAG and self.ser.is_open:
+                #Read data from serial port
+                try:
+                    if self.reader.protocol is None:
+                        self.reader.detect_protocol(lambda: self.stop_flag)
+
+                    if self.bf_out_flag:
+                        # if "win" in self.config.OS_NAME:
+                        #     bf_key = 'o'
+                        #     if self.bf_out_str != '0':
+                        #         bf_key = 'i'
+                        #     else:
+                        #         bf_key = 'o'
+                        #     # print(self.bf_out_str)
+                        #     keyboard.write(bf_key)
+                        self.ser.write(self.bf_out_str.encode())
+                        self.bf_out_flag = False
+
+                    if self.config.BLOCK_MODE:
+                        serial_block = self.reader.read_block()
+                        if len(serial_block) > 0:
+                            block_parts.append(serial_block)
+                            block_len += len(serial_block)
+                        serial_samples = []
+                    else:
+                        serial_samples = self.reader.read_samples()
+                except Exception as e:
+                    serial_samples = []
+                    self.health.add_read_error()
+                    print("Exception:", e)
+                    time.sleep(0.1)
+
+                try:
+                    if self.config.BLOCK_MODE:
+                        block_elapsed_ms = (time.monotonic() - block_start_time) * 1000
+                        if block_len > 0 and ((self.config.BLOCK_SAMPLES > 0 and block_len >= self.config.BLOCK_SAMPLES) or
+                                              (self.config.BLOCK_SAMPLES <= 0 and block_elapsed_ms >= self.config.BLOCK_DURATION_MS)):
+                            serial_data = np.concatenate(block_parts)
+                            block_parts = []
+                            block_len = 0
+                            block_start_time = time.monotonic()
+                            self.process_block(serial_data)
+
+                    for serial_data in serial_samples:
+                        self.process_sample(serial_data)
+
+                    self.update_health()
+                    if not self.config.HIGH_RATE_MODE:
+                        # in high rate mode, read_block() waits for data instead
+                        time.sleep(0.001)
+
+                except Exception as e:
+                    # malformed data is skipped by the decoders, the serial buffers are kept as they are
+                    self.health.add_processing_error()
+                    print('Serial data', serial_data)
+                    print("Exception:", e)
+                    time.sleep(0.1)
+
+            else:
+                if self.ser.is_open:
+                    self.ser.reset_output_buffer()
+                    self.ser.reset_input_buffer()
+                    if self.reader is not None:
+                        self.reader.reset()
+                block_parts = []
+                block_len = 0
+                self.health.clear_last_read()
+                if self.record_flag:
+                     self.publish("log", "Data not recording. Check serial port connection and retry...")
+
+                if not self.config.HOLD_ACQUISITION_THREAD:
+                    break
+                else:
+                    self.idle(1)
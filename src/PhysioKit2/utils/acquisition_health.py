@@ -0,0 +1,177 @@
+import json
+import time
+import numpy as np
+
+# bin edges (ms) for the deviation of the inter-sample interval from the nominal 1 / fs
+JITTER_BIN_EDGES_MS = [-np.inf, -2.0, -1.0, -0.5, -0.1, 0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 50.0, np.inf]
+COUNTER_NAMES = ["samples_received", "bytes_received", "corrupt_lines", "corrupt_frames", "bytes_skipped",
+                 "sequence_gaps", "samples_lost", "resyncs", "read_errors", "processing_errors"]
+ERROR_COUNTER_NAMES = ["corrupt_lines", "corrupt_frames", "sequence_gaps", "resyncs", "read_errors", "processing_errors"]
+RECORDING_EXTENSIONS = [".csv.gz", ".csv.xz", ".csv", ".pkb"]
+
+
+def sidecar_path(recording_path, suffix="_health.json"):
+    # <recording name><suffix>, next to the recording
+    for extension in RECORDING_EXTENSIONS:
+        if recording_path.endswith(extension):
+            return recording_path[:-len(extension)] + suffix
+    return recording_path.rsplit('.', 1)[0] + suffix
+
+
+class Acquisition_Health(object):
+    """
+        Per-session counters of the serial acquisition: samples and bytes received, inter-sample interval jitter,
+        corrupt lines / frames and the gaps they leave in the sample stream, or the resyncs when their size is unknown.
+        Samples arriving in one read share the mean interval since the previous read.
+        The health of each device merged into the stream can be added to devices, with details in device_info.
+    """
+    def __init__(self, fs, report_interval=1.0, max_gap_records=10000):
+        self.report_interval = report_interval
+        self.max_gap_records = max_gap_records
+        self.devices = {}
+        self.device_info = {}
+        self.reset(fs)
+
+    def reset(self, fs=None):
+        if fs is not None:
+            self.fs = float(fs)
+            self.nominal_interval_ms = 1000.0 / self.fs
+        self.start_time = time.monotonic()
+        self.last_read_time = None
+        self.counters = dict.fromkeys(COUNTER_NAMES, 0)
+        self.gaps = []      # [sample index, number of samples missing before it]
+        self.jitter_hist = np.zeros(len(JITTER_BIN_EDGES_MS) - 1, dtype=np.int64)
+        self.interval_weight = 0
+        self.interval_mean = 0.0
+        self.interval_m2 = 0.0
+        self.report_time = self.start_time
+        self.report_counters = dict(self.counters)
+        self.recording_start = None
+
+    def clear_last_read(self):
+        # the next read does not contribute an interval, e.g. after acquisition is paused
+        self.last_read_time = None
+
+    def add_samples(self, n_samples, n_bytes, read_time=None):
+        if read_time is None:
+            read_time = time.monotonic()
+        self.counters["bytes_received"] += n_bytes
+        if n_samples <= 0:
+            return
+        self.counters["samples_received"] += n_samples
+
+        if self.last_read_time is not None:
+            interval_ms = 1000.0 * (read_time - self.last_read_time) / n_samples
+            bin_index = np.searchsorted(JITTER_BIN_EDGES_MS, interval_ms - self.nominal_interval_ms, side='right') - 1
+            self.jitter_hist[bin_index] += n_samples
+
+            # weighted running mean and variance of the interval
+            self.interval_weight += n_samples
+            delta = interval_ms - self.interval_mean
+            self.interval_mean += delta * n_samples / self.interval_weight
+            self.interval_m2 += n_samples * delta * (interval_ms - self.interval_mean)
+        self.last_read_time = read_time
+
+    def add_corrupt_lines(self, n_lines):
+        self.counters["corrupt_lines"] += n_lines
+
+    def add_corrupt_frames(self, n_frames, n_bytes_skipped):
+        self.counters["corrupt_frames"] += n_frames
+        self.counters["bytes_skipped"] += n_bytes_skipped
+
+    def add_gaps(self, positions, n_missing):
+        """
+            Records samples missing before the given positions of the next block passed to add_samples()
+        """
+        if len(positions) == 0:
+            return
+        self.counters["sequence_gaps"] += len(positions)
+        self.counters["samples_lost"] += int(np.sum(n_missing))
+        n_records = max(self.max_gap_records - len(self.gaps), 0)
+        sample_index = self.counters["samples_received"]
+        self.gaps.extend([int(sample_index + pos), int(n_miss)] for pos, n_miss in zip(positions[:n_records], n_missing[:n_records]))
+
+    def add_resyncs(self, n_resyncs):
+        # jumps of the sample stream whose number of missing samples is unknown
+        self.counters["resyncs"] += n_resyncs
+
+    def add_read_error(self):
+        self.counters["read_errors"] += 1
+
+    def add_processing_error(self):
+        self.counters["processing_errors"] += 1
+
+    def interval_std(self):
+        return float(np.sqrt(self.interval_m2 / self.interval_weight)) if self.interval_weight > 0 else 0.0
+
+    def snapshot(self):
+        elapsed = time.monotonic() - self.start_time
+        stats = dict(self.counters)
+        stats["elapsed_sec"] = elapsed
+        stats["nominal_fs"] = self.fs
+        stats["effective_fs"] = self.counters["samples_received"] / elapsed if elapsed > 0 else 0.0
+        stats["interval_mean_ms"] = self.interval_mean
+        stats["interval_std_ms"] = self.interval_std()
+        # the open ended first and last bins have null edges, as JSON has no infinity
+        stats["jitter_bin_edges_ms"] = [float(edge) if np.isfinite(edge) else None for edge in JITTER_BIN_EDGES_MS]
+        stats["jitter_hist"] = self.jitter_hist.tolist()
+        if len(self.devices) > 0:
+            stats["devices"] = {name: dict(health.snapshot(), **self.device_info.get(name, {})) for name, health in self.devices.items()}
+        return stats
+
+    def report(self, bytes_pending=0):
+        """
+            Returns a snapshot with the rates over the last report_interval, or None if the interval has not elapsed
+        """
+        curr_time = time.monotonic()
+        interval = curr_time - self.report_time
+        if interval < self.report_interval:
+            return None
+        stats = self.snapshot()
+        stats["samples_per_sec"] = (self.counters["samples_received"] - self.report_counters["samples_received"]) / interval
+        stats["bytes_per_sec"] = (self.counters["bytes_received"] - self.report_counters["bytes_received"]) / interval
+        stats["bytes_pending"] = bytes_pending
+        stats["degraded"] = any(self.counters[name] > self.report_counters[name] for name in ERROR_COUNTER_NAMES)
+        self.report_time = curr_time
+        self.report_counters = dict(self.counters)
+        return stats
+
+    def start_recording(self):
+        self.recording_start = (time.monotonic(), dict(self.counters), self.jitter_hist.copy(), len(self.gaps))
+        for health in self.devices.values():
+            health.start_recording()
+
+    def recording_summary(self):
+        """
+            Returns the counters accumulated since start_recording()
+        """
+        stats = self.snapshot()
+        if self.recording_start is None:
+            return stats
+        start_time, start_counters, start_hist, start_gaps = self.recording_start
+        stats["elapsed_sec"] = time.monotonic() - start_time
+        for name in COUNTER_NAMES:
+            stats[name] = self.counters[name] - start_counters[name]
+        stats["effective_fs"] = stats["samples_received"] / stats["elapsed_sec"] if stats["elapsed_sec"] > 0 else 0.0
+        stats["jitter_hist"] = (self.jitter_hist - start_hist).tolist()
+        # sample indices are relative to the start of the recording (approximately the row in the recording)
+        start_index = start_counters["samples_received"]
+        stats["gaps"] = [[index - start_index, n_miss] for index, n_miss in self.gaps[start_gaps:]]
+        if len(self.devices) > 0:
+            stats["devices"] = {name: dict(health.recording_summary(), **self.device_info.get(name, {})) for name, health in self.devices.items()}
+        return stats
+
+    def write_sidecar(self, recording_path, extra=None):
+        """
+            Writes the recording summary, updated with extra, next to the recording, as <recording name>_health.json
+        """
+        health_path = sidecar_path(recording_path)
+        summary = self.recording_summary()
+        if extra is not None:
+            summary.update(extra)
+        try:
+            with open(health_path, 'w') as json_file:
+                json.dump(summary, json_file, indent=4)
+        except Exception as e:
+            print("Error writing acquisition health file:", e)
+        return health_path
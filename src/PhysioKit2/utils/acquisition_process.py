@@ -0,0 +1,262 @@
+import multiprocessing
+import queue
+import time
+
+from PhysioKit2.utils.acquisition_engine import Acquisition_Engine
+from PhysioKit2.utils.acquisition_health import Acquisition_Health, sidecar_path
+from PhysioKit2.utils.shared_ring_buffer import Shared_Ring_Buffer, Ring_Reader, LIVE_FLAG, STOP_FLAG
+
+# config values passed to the acquisition process, which does not share the config module of the interface
+CONFIG_NAMES = ["NCHANNELS", "CHANNEL_TYPES", "SAMPLING_RATE", "SERIAL_PROTOCOL", "BLOCK_MODE", "BLOCK_DURATION_MS", "BLOCK_SAMPLES",
+                "HIGH_RATE_MODE", "REPLAY_PARAMS", "DEVICE_PORTS", "DEVICE_NCHANNELS", "OS_NAME"]
+
+
+class Shared_Config(object):
+    """
+        config of the acquisition process: live acquisition follows the flag set in the ring buffer by the reading process
+    """
+    def __init__(self, config_values, ring):
+        self.__dict__.update(config_values)
+        self.ring = ring
+        self.HOLD_ACQUISITION_THREAD = True
+
+    @property
+    def LIVE_ACQUISITION_FLAG(self):
+        return bool(self.ring.control[LIVE_FLAG])
+
+
+class Ring_Acquisition_Engine(Acquisition_Engine):
+    """
+        Acquisition_Engine of the acquisition process: writes the raw and filtered blocks to the ring buffer,
+        sends health reports and log messages through status_queue and runs the commands received through command_queue
+    """
+    def __init__(self, config, ring, command_queue, status_queue, filter_samples):
+        self.ring = ring
+        super(Ring_Acquisition_Engine, self).__init__(config)
+        self.command_queue = command_queue
+        self.status_queue = status_queue
+        self.filter_samples = filter_samples
+        self.subscribe("health", lambda health_report: self.status_queue.put(("health", health_report)))
+        self.subscribe("log", lambda message: self.status_queue.put(("log", message)))
+
+    @property
+    def stop_flag(self):
+        return bool(self.ring.control[STOP_FLAG])
+
+    @stop_flag.setter
+    def stop_flag(self, stop):
+        self.ring.control[STOP_FLAG] = int(stop)
+
+    def process_block(self, values, values_filt=None):
+        self.ring.write(values, self.filt_bank.lfilt(values) if self.filter_samples else None)
+
+    def run_command(self, command):
+        if command[0] == "bf_out":
+            self.add_bf_out_signal(command[1])
+        elif command[0] == "start_recording":
+            self.health.start_recording()
+        elif command[0] == "write_sidecar":
+            self.health.write_sidecar(command[1], command[2])
+        elif command[0] == "recording_summary":
+            self.status_queue.put(("recording_summary", self.health.recording_summary()))
+
+    def run_commands(self):
+        while True:
+            try:
+                command = self.command_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.run_command(command)
+
+    def update_health(self):
+        # called once per iteration of the acquisition loop while acquisition is live
+        self.run_commands()
+        super(Ring_Acquisition_Engine, self).update_health()
+
+    def idle(self, duration_s):
+        # while acquisition is not live, the commands are run as they arrive
+        end_time = time.monotonic() + duration_s
+        while not self.stop_flag and time.monotonic() < end_time:
+            try:
+                command = self.command_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.run_command(command)
+
+
+def run_acquisition_process(config_values, port_name, baudrate, ring_name, capacity, command_queue, status_queue, filter_samples):
+    ring = Shared_Ring_Buffer(config_values["NCHANNELS"], capacity, name=ring_name)
+    engine = Ring_Acquisition_Engine(Shared_Config(config_values, ring), ring, command_queue, status_queue, filter_samples)
+    if filter_samples:
+        engine.initialize_filters(config_values["CHANNEL_TYPES"])
+    connected = engine.connectPort(port_name, baudrate)
+    status_queue.put(("connected", connected))
+    if connected:
+        engine.run()
+        # commands sent before the process was stopped
+        engine.run_commands()
+        engine.disconnectPort()
+    ring.close()
+
+
+class Process_Health(Acquisition_Health):
+    """
+        Acquisition_Health of the interface when acquisition runs in a child process:
+        the counters are kept by the acquisition process, which also writes the recording sidecar.
+        The last recording summary of the acquisition process is kept once it has stopped.
+    """
+    def __init__(self, fs):
+        super(Process_Health, self).__init__(fs)
+        self.command_queue = None
+        self.final_summary = None
+
+    def recording_summary(self):
+        if self.final_summary is not None:
+            return self.final_summary
+        return super(Process_Health, self).recording_summary()
+
+    def start_recording(self):
+        super(Process_Health, self).start_recording()
+        if self.command_queue is not None:
+            self.command_queue.put(("start_recording",))
+
+    def write_sidecar(self, recording_path, extra=None):
+        if self.command_queue is None:
+            return super(Process_Health, self).write_sidecar(recording_path, extra)
+        self.command_queue.put(("write_sidecar", recording_path, extra))
+        return sidecar_path(recording_path)
+
+
+class Process_Acquisition_Engine(Acquisition_Engine):
+    """
+        Runs the serial reader and filter bank in a child process (config.ACQUISITION_PROCESS), so that plotting, signal
+        quality inference and biofeedback in this process do not stall serial reads. The child writes the samples to a
+        Shared_Ring_Buffer; run() reads them with a Ring_Reader and publishes them like Acquisition_Engine, along with the
+        health reports of the child. Other threads can read the ring buffer without copying, with their own Ring_Reader.
+    """
+    def __init__(self, config):
+        super(Process_Acquisition_Engine, self).__init__(config)
+        self.health = Process_Health(self.config.SAMPLING_RATE)
+        self.mp_context = multiprocessing.get_context("spawn")
+        self.process = None
+        self.ring = None
+        self.ring_reader = None
+        self.connected = False
+        self.channel_types = None
+        self.idle_log_time = 0
+
+    def initialize_filters(self, channel_types):
+        # the filters are run by the acquisition process
+        self.channel_types = list(channel_types)
+
+    def connectPort(self, port_name, baudrate=115200):
+        # the port is opened here to check it, and opened again by the acquisition process when live acquisition starts
+        self.connected = super(Process_Acquisition_Engine, self).connectPort(port_name, baudrate)
+        if self.connected:
+            super(Process_Acquisition_Engine, self).disconnectPort()
+            self.port_name = port_name
+            self.baudrate = baudrate
+        return self.connected
+
+    def disconnectPort(self):
+        self.connected = False
+        self.stop_process()
+
+    def add_bf_out_signal(self, val):
+        if self.process is not None:
+            self.health.command_queue.put(("bf_out", val))
+
+    def start_process(self):
+        capacity = int(self.config.RING_BUFFER_SEC * self.config.SAMPLING_RATE)
+        self.ring = Shared_Ring_Buffer(self.config.NCHANNELS, capacity)
+        self.ring_reader = Ring_Reader(self.ring)
+        self.filter_samples = len(self.subscribers["data_filt"]) > 0 and self.channel_types is not None
+        config_values = {name: getattr(self.config, name) for name in CONFIG_NAMES}
+        config_values["CHANNEL_TYPES"] = self.channel_types
+        command_queue = self.mp_context.Queue()
+        self.status_queue = self.mp_context.Queue()
+        self.process = self.mp_context.Process(target=run_acquisition_process, daemon=True,
+                                               args=(config_values, self.port_name, self.baudrate, self.ring.name, capacity,
+                                                     command_queue, self.status_queue, self.filter_samples))
+        self.process.start()
+        self.health.command_queue = command_queue
+        self.health.final_summary = None
+        self.health.reset(self.config.SAMPLING_RATE)
+        self.report_overruns = 0
+
+    def stop_process(self):
+        if self.process is None:
+            return
+        if self.process.is_alive():
+            # keeps the counters of the acquisition process for the sidecar of a recording saved after it stops
+            self.health.command_queue.put(("recording_summary",))
+            deadline = time.monotonic() + 2.0
+            while self.health.final_summary is None and time.monotonic() < deadline:
+                time.sleep(0.05)
+                self.read_status()
+        self.ring.control[STOP_FLAG] = 1
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process = None
+        self.health.command_queue = None
+        self.ring_reader = None
+        self.ring.close()
+        self.ring = None
+
+    def read_status(self):
+        while True:
+            try:
+                status = self.status_queue.get_nowait()
+            except queue.Empty:
+                break
+            if status[0] == "health":
+                health_report = status[1]
+                health_report["ring_overruns"] = self.ring_reader.overruns
+                health_report["ring_samples_lost"] = self.ring_reader.samples_lost
+                health_report["ring_fill"] = self.ring_reader.available() / float(self.ring.capacity)
+                health_report["degraded"] = health_report["degraded"] or self.ring_reader.overruns > self.report_overruns
+                self.report_overruns = self.ring_reader.overruns
+                self.health.counters.update({name: health_report[name] for name in self.health.counters})
+                self.publish("health", health_report)
+            elif status[0] == "recording_summary":
+                self.health.final_summary = status[1]
+            elif status[0] == "log":
+                self.publish("log", status[1])
+            elif status[0] == "connected" and not status[1]:
+                self.publish("log", "Serial port could not get connected by the acquisition process: Please retry")
+
+    def run(self):
+        self.prev_elapsed_time = 0
+        self.curr_elapsed_time = 0
+        while not self.stop_flag:
+            live = self.config.LIVE_ACQUISITION_FLAG and self.connected
+            if live and self.process is None:
+                self.start_process()
+
+            if self.process is not None:
+                self.ring.control[LIVE_FLAG] = int(live)
+                if live:
+                    raw, filt = self.ring_reader.read()
+                    try:
+                        if len(raw) > 0:
+                            self.process_block(raw, filt if self.filter_samples else None)
+                    except Exception as e:
+                        self.health.add_processing_error()
+                        print("Exception:", e)
+                else:
+                    # samples written before live acquisition stopped are dropped
+                    self.ring_reader.read_views()
+                self.read_status()
+
+            if not live:
+                if self.record_flag and time.monotonic() - self.idle_log_time >= 1:
+                    self.idle_log_time = time.monotonic()
+                    self.publish("log", "Data not recording. Check serial port connection and retry...")
+                if not self.config.HOLD_ACQUISITION_THREAD:
+                    break
+                time.sleep(0.1)
+            else:
+                time.sleep(self.config.BLOCK_DURATION_MS / 1000.0)
+
+        self.stop_process()
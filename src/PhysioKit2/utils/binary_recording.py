@@ -0,0 +1,319 @@
+import json
+import os
+import struct
+import numpy as np
+from PhysioKit2.utils.compression import Compression_Stats, CODEC_IDS, codec_name, decompress, delta_encode, delta_decode
+
+# PhysioKit binary recording (.pkb):
+#   MAGIC, uint32 header length, JSON header (channels, channel_types, fs, study, condition, start time, dtype), padded to
+#   HEADER_SIZE so that it can be rewritten in place when the recording is saved
+#   records: CHUNK_MAGIC, uint32 n_samples, uint64 first sample index, (n_samples, nchannels) samples of the header dtype
+#            ZCHUNK_MAGIC, uint32 n_samples, uint64 first sample index, uint32 length, uint8 codec, compressed samples,
+#                          delta encoded if "delta" is set in the header
+#            EVENT_MAGIC, uint32 length, uint64 sample index, JSON event code
+#   index: JSON chunk index and event table, uint64 index offset, INDEX_MAGIC
+# A file without index, such as one left by an interrupted recording, is read by scanning its records.
+
+MAGIC = b'PKB1'
+CHUNK_MAGIC = b'PKBC'
+ZCHUNK_MAGIC = b'PKBZ'
+EVENT_MAGIC = b'PKBE'
+INDEX_MAGIC = b'PKBI'
+HEADER_SIZE = 4096
+RECORD_HEADER = struct.Struct('<4sIQ')
+ZCHUNK_HEADER = struct.Struct('<IB')
+INDEX_TRAILER = struct.Struct('<Q4s')
+EXTENSION = '.pkb'
+
+
+class Binary_Recording_Writer(object):
+    """
+        Writes (n_samples, nchannels) blocks as chunks of a binary recording, and the changes of event code as events.
+        Blocks are gathered into chunks of up to chunk_samples, written when full, when the event code changes and on flush().
+        Samples outside the range of dtype are clipped and counted in clipped_samples.
+        With compression "zlib", "gzip" or "lzma", each chunk is compressed, after delta encoding if delta is True.
+        The ratio and CPU time of compression are kept in compression_stats, which can be shared by several files.
+    """
+    def __init__(self, filepath, channels, dtype='int16', header=None, chunk_samples=1024, compression="none", delta=False,
+                 compression_stats=None):
+        self.filepath = filepath
+        self.dtype = np.dtype(dtype).newbyteorder('<')
+        self.header = {"format": "physiokit_binary", "version": 1, "channels": list(channels), "channel_types": [],
+                       "fs": None, "study": "", "condition": "", "start_time": "", "dtype": self.dtype.str,
+                       "compression": compression, "delta": bool(delta)}
+        if header is not None:
+            self.header.update(header)
+        self.compression = self.header["compression"]
+        self.delta = self.header["delta"] and self.dtype.kind in 'iu'
+        self.header["delta"] = self.delta
+        self.compression_stats = None
+        if self.compression != "none":
+            self.compression_stats = compression_stats if compression_stats is not None else Compression_Stats(self.compression)
+        self.nchannels = len(channels)
+        info = np.iinfo(self.dtype) if self.dtype.kind in 'iu' else None
+        self.value_range = (info.min, info.max) if info is not None else None
+        self.chunks = []        # [data offset, first sample index, n_samples] and for compressed chunks, [length, codec]
+        self.events = []        # [sample index, event code]
+        self.chunk_samples = chunk_samples
+        self.pending = []
+        self.n_pending = 0
+        self.n_samples = 0         # samples written to the file
+        self.clipped_samples = 0
+        self.bytes_written = 0
+        self.eventcode = ''
+        self.file = open(filepath, 'wb')
+        self.write_header()
+        self.file.seek(HEADER_SIZE)
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def write_header(self):
+        header = json.dumps(self.header).encode()
+        if len(MAGIC) + 4 + len(header) > HEADER_SIZE:
+            raise ValueError("Binary recording header is larger than " + str(HEADER_SIZE) + " bytes")
+        self.file.seek(0)
+        self.file.write(MAGIC + struct.pack('<I', len(header)) + header)
+
+    def write_event(self, eventcode):
+        self.eventcode = eventcode
+        event = json.dumps(eventcode).encode()
+        self.file.write(RECORD_HEADER.pack(EVENT_MAGIC, len(event), self.n_samples) + event)
+        self.events.append([self.n_samples, eventcode])
+        self.bytes_written += RECORD_HEADER.size + len(event)
+
+    def write_chunk(self):
+        if self.n_pending == 0:
+            return
+        values = np.concatenate(self.pending) if len(self.pending) > 1 else self.pending[0]
+        self.pending = []
+        self.n_pending = 0
+        if self.value_range is not None:
+            out_of_range = (values < self.value_range[0]) | (values > self.value_range[1])
+            if out_of_range.any():
+                self.clipped_samples += int(out_of_range.any(axis=1).sum())
+                values = np.clip(values, self.value_range[0], self.value_range[1])
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        offset = self.file.tell()
+        if self.compression_stats is None:
+            data = values.tobytes()
+            self.file.write(RECORD_HEADER.pack(CHUNK_MAGIC, len(values), self.n_samples) + data)
+            self.chunks.append([offset + RECORD_HEADER.size, self.n_samples, len(values)])
+            self.bytes_written += RECORD_HEADER.size + len(data)
+        else:
+            data = self.compression_stats.compress((delta_encode(values) if self.delta else values).tobytes())
+            codec_id = CODEC_IDS[self.compression]
+            self.file.write(RECORD_HEADER.pack(ZCHUNK_MAGIC, len(values), self.n_samples) + ZCHUNK_HEADER.pack(len(data), codec_id) + data)
+            self.chunks.append([offset + RECORD_HEADER.size + ZCHUNK_HEADER.size, self.n_samples, len(values), len(data), codec_id])
+            self.bytes_written += RECORD_HEADER.size + ZCHUNK_HEADER.size + len(data)
+        self.n_samples += len(values)
+
+    def write_block(self, values, eventcode=''):
+        """
+            Adds a (n_samples, nchannels) block, or a single sample, recorded with eventcode
+        """
+        values = np.asarray(values)
+        if values.ndim == 1:
+            values = values[np.newaxis, :]
+        if str(eventcode) != self.eventcode:
+            self.write_chunk()
+            self.write_event(str(eventcode))
+        if values.size == 0:
+            return
+        self.pending.append(values)
+        self.n_pending += len(values)
+        if self.n_pending >= self.chunk_samples:
+            self.write_chunk()
+
+    def flush(self):
+        self.write_chunk()
+        self.file.flush()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self, header=None):
+        """
+            Writes the chunk index and event table, and the header updated with header (study, condition, start time...)
+        """
+        if self.file.closed:
+            return
+        self.write_chunk()
+        index_offset = self.file.tell()
+        index = json.dumps({"n_samples": self.n_samples, "chunks": self.chunks, "events": self.events}).encode()
+        self.file.write(index + INDEX_TRAILER.pack(index_offset, INDEX_MAGIC))
+        if header is not None:
+            self.header.update(header)
+            self.write_header()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+
+
+def read_header(f):
+    f.seek(0)
+    magic, header_len = struct.unpack('<4sI', f.read(8))
+    if magic != MAGIC:
+        raise ValueError("Not a PhysioKit binary recording")
+    return json.loads(f.read(header_len).decode())
+
+
+def read_index(f, file_size):
+    # returns None when the file has no valid index
+    if file_size < HEADER_SIZE + INDEX_TRAILER.size:
+        return None
+    f.seek(file_size - INDEX_TRAILER.size)
+    index_offset, magic = INDEX_TRAILER.unpack(f.read(INDEX_TRAILER.size))
+    if magic != INDEX_MAGIC or not HEADER_SIZE <= index_offset < file_size:
+        return None
+    f.seek(index_offset)
+    try:
+        return json.loads(f.read(file_size - INDEX_TRAILER.size - index_offset).decode())
+    except ValueError:
+        return None
+
+
+def scan_records(f, file_size, row_bytes):
+    """
+        Rebuilds the chunk index and event table by reading the records one after the other,
+        up to the index or to the first incomplete record
+    """
+    chunks = []
+    events = []
+    n_samples = 0
+    offset = HEADER_SIZE
+    while offset + RECORD_HEADER.size <= file_size:
+        f.seek(offset)
+        magic, length, sample_index = RECORD_HEADER.unpack(f.read(RECORD_HEADER.size))
+        if magic == CHUNK_MAGIC:
+            end = offset + RECORD_HEADER.size + length * row_bytes
+            if end > file_size or sample_index != n_samples:
+                break
+            chunks.append([offset + RECORD_HEADER.size, sample_index, length])
+            n_samples += length
+        elif magic == ZCHUNK_MAGIC:
+            if offset + RECORD_HEADER.size + ZCHUNK_HEADER.size > file_size:
+                break
+            data_length, codec_id = ZCHUNK_HEADER.unpack(f.read(ZCHUNK_HEADER.size))
+            end = offset + RECORD_HEADER.size + ZCHUNK_HEADER.size + data_length
+            if end > file_size or sample_index != n_samples:
+                break
+            chunks.append([offset + RECORD_HEADER.size + ZCHUNK_HEADER.size, sample_index, length, data_length, codec_id])
+            n_samples += length
+        elif magic == EVENT_MAGIC:
+            end = offset + RECORD_HEADER.size + length
+            if end > file_size:
+                break
+            try:
+                events.append([sample_index, json.loads(f.read(length).decode())])
+            except ValueError:
+                break
+        else:
+            break
+        offset = end
+    return {"n_samples": n_samples, "chunks": chunks, "events": events, "end_offset": offset}
+
+
+class Binary_Recording(object):
+    """
+        Reader of a binary recording: the file is memory mapped once, on the first read, and read() returns views of
+        the chunks of the requested range of samples, or reads and decompresses them when compressed
+    """
+    def __init__(self, filepath):
+        self.filepath = filepath
+        file_size = os.path.getsize(filepath)
+        with open(filepath, 'rb') as f:
+            self.header = read_header(f)
+            self.dtype = np.dtype(self.header["dtype"])
+            self.channels = self.header["channels"]
+            self.nchannels = len(self.channels)
+            index = read_index(f, file_size)
+            self.complete = index is not None
+            if index is None:
+                index = scan_records(f, file_size, self.nchannels * self.dtype.itemsize)
+        self.chunks = index["chunks"]
+        self.events = index["events"]
+        self.n_samples = index["n_samples"]
+        self.chunk_starts = np.array([chunk[1] for chunk in self.chunks], dtype=np.int64)
+        self.delta = self.header.get("delta", False)
+        self.file_map = None
+
+    @property
+    def channel_types(self):
+        return self.header["channel_types"]
+
+    @property
+    def fs(self):
+        return self.header["fs"]
+
+    @property
+    def duration(self):
+        return self.n_samples / float(self.fs) if self.fs else None
+
+    def channel_indices(self, channels):
+        if channels is None:
+            return None
+        return [self.channels.index(ch) if isinstance(ch, str) else ch for ch in channels]
+
+    def read(self, start=0, end=None, channels=None):
+        """
+            Returns the samples [start, end) as a (n_samples, nchannels) array, of the channels given by name or index.
+            A range within one uncompressed chunk is returned as a read only memory mapped view, without reading the file.
+        """
+        end = self.n_samples if end is None else min(end, self.n_samples)
+        start = max(start, 0)
+        indices = self.channel_indices(channels)
+        if end <= start:
+            data = np.zeros((0, self.nchannels), dtype=self.dtype)
+            return data if indices is None else data[:, indices]
+
+        first = int(np.searchsorted(self.chunk_starts, start, side='right')) - 1
+        parts = []
+        f = open(self.filepath, 'rb') if self.header.get("compression", "none") != "none" else None
+        for chunk_index in self.chunks[first:]:
+            data_offset, first_sample, n_samples = chunk_index[:3]
+            if first_sample >= end:
+                break
+            if len(chunk_index) > 3:
+                chunk = self.read_compressed_chunk(f, *chunk_index)
+            else:
+                if self.file_map is None:
+                    self.file_map = np.memmap(self.filepath, dtype=np.uint8, mode='r')
+                data = self.file_map[data_offset: data_offset + n_samples * self.nchannels * self.dtype.itemsize]
+                chunk = data.view(self.dtype).reshape(n_samples, self.nchannels)
+            part = chunk[max(start - first_sample, 0): min(end - first_sample, n_samples)]
+            parts.append(part if indices is None else part[:, indices])
+        if f is not None:
+            f.close()
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def read_compressed_chunk(self, f, data_offset, first_sample, n_samples, data_length, codec_id):
+        f.seek(data_offset)
+        data = decompress(f.read(data_length), codec_name(codec_id))
+        chunk = np.frombuffer(data, dtype=self.dtype).reshape(n_samples, self.nchannels)
+        return delta_decode(chunk) if self.delta else chunk
+
+    def read_time(self, start_s=0, end_s=None, channels=None):
+        """
+            Returns the samples from start_s to end_s seconds of the recording
+        """
+        end = None if end_s is None else int(round(end_s * self.fs))
+        return self.read(int(round(start_s * self.fs)), end, channels)
+
+    def event_code(self, start=0, end=None):
+        """
+            Returns the event code of the samples [start, end), as recorded in the CSV files
+        """
+        end = self.n_samples if end is None else min(end, self.n_samples)
+        start = max(start, 0)
+        event_code = np.full(max(end - start, 0), '', dtype=object)
+        for nEv, (sample_index, code) in enumerate(self.events):
+            event_end = self.events[nEv + 1][0] if nEv + 1 < len(self.events) else self.n_samples
+            if sample_index < end and event_end > start:
+                event_code[max(sample_index, start) - start: min(event_end, end) - start] = code
+        return event_code
+
+    def close(self):
+        # the file stays mapped as long as views returned by read() are in use
+        self.file_map = None
@@ -2,6 +2,7 @@ import neurokit2 as nk
 import numpy as np
 from PySide6.QtCore import Signal, QThread, QObject
 import time
+from PhysioKit2.utils.streaming_filters import Circular_Buffer, Sliding_MinMax
 
 class BioFeedback_Signals(QObject):
     update_bf_vis_out_int = Signal(int)
@@ -36,7 +37,7 @@ class BioFeedback_Thread(QThread):
         self.signals = BioFeedback_Signals()
         self.win_samples = int(self.fs * self.window_len)
         self.step_samples = int(self.fs * self.step_len)
-        self.bf_signal = np.zeros(self.win_samples)
+        self.bf_signal = Circular_Buffer(self.win_samples, fill_value=0)
 
         self.count_step = 0
         self.count_init_window = 0
@@ -46,7 +47,7 @@ class BioFeedback_Thread(QThread):
 
         if self.bf_signal_type == "RSP":
             self.normalizing_samples = int(self.fs * 6)
-            self.norm_bf_signal = np.zeros(self.normalizing_samples)
+            self.norm_bf_minmax = Sliding_MinMax(self.normalizing_samples)
             self.bf_threshold = float(bf_dict["modulation_threshold"])
             self.max_bf_signal = 1
             self.min_bf_signal = 0
@@ -77,22 +78,26 @@ class BioFeedback_Thread(QThread):
 
 
     def add_bf_data(self, sig_val):
-        self.bf_signal = np.roll(self.bf_signal, -1)
-        self.bf_signal[-1] = sig_val
+        # sig_val is either a single sample or a block (1D array) of samples
+        sig_val = np.atleast_1d(sig_val)
+        n_new = len(sig_val)
+        if n_new == 0:
+            return
+
+        self.bf_signal.extend(sig_val)
 
         if self.bf_signal_type == "RSP":
-            self.norm_bf_signal = np.roll(self.norm_bf_signal, -1)
-            self.norm_bf_signal[-1] = sig_val
+            self.norm_bf_minmax.update_block(sig_val)
                 
         if not self.init_window_filled:
-            self.count_init_window += 1
+            self.count_init_window += n_new
             if self.count_init_window >= self.win_samples:
                 self.init_window_filled = True
                 self.process_flag = True
 
                 if self.bf_signal_type == "RSP":
-                    mx = np.max(self.norm_bf_signal)
-                    mn = np.min(self.norm_bf_signal)
+                    mx = self.norm_bf_minmax.get_max()
+                    mn = self.norm_bf_minmax.get_min()
                     if np.abs(mx - mn) > self.bf_threshold:
                         self.max_bf_signal = mx
                         self.min_bf_signal = mn
@@ -100,13 +105,13 @@ class BioFeedback_Thread(QThread):
                         self.max_bf_signal = self.bf_threshold
                         self.min_bf_signal = 0
         else:
-            self.count_step += 1
+            self.count_step += n_new
             if self.count_step >= self.step_samples:
                 self.process_flag = True
                 self.count_step = 0
                 if self.bf_signal_type == "RSP":
-                    mx = np.max(self.norm_bf_signal)
-                    mn = np.min(self.norm_bf_signal)
+                    mx = self.norm_bf_minmax.get_max()
+                    mn = self.norm_bf_minmax.get_min()
                     # print("mx-mn", mx - mn)
                     if np.abs(mx - mn) > self.bf_threshold:
                         self.max_bf_signal = mx
@@ -118,7 +123,7 @@ class BioFeedback_Thread(QThread):
                 self.process_flag = False
                 try:
                     if self.bf_signal_type == "PPG":
-                        ppg_info = nk.ppg_findpeaks(self.bf_signal, sampling_rate=self.fs)
+                        ppg_info = nk.ppg_findpeaks(self.bf_signal.get().ravel(), sampling_rate=self.fs)
                         if (np.max(ppg_info['PPG_Peaks'].shape) > 1):
                             hrv_indices = nk.hrv_time(ppg_info, sampling_rate=self.fs)
                             self.ppg_metrics[self.bf_metric] = hrv_indices[self.bf_metric][0]
@@ -168,7 +173,7 @@ class BioFeedback_Thread(QThread):
 
                     elif self.bf_signal_type == "RSP":
                         
-                        self.resp_val = np.mean(self.bf_signal)
+                        self.resp_val = np.mean(self.bf_signal.get())
                         # print("Max - Min", self.max_bf_signal - self.min_bf_signal)
                         self.resp_val = (self.resp_val - self.min_bf_signal)/ (self.max_bf_signal - self.min_bf_signal)
                         # self.resp_val = int(self.resp_val * 255)
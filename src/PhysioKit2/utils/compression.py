@@ -0,0 +1,174 @@
+import gzip
+import io
+import lzma
+import os
+import time
+import zlib
+import numpy as np
+
+# codecs of recording compression: binary recordings compress each chunk, CSV recordings are written as a series of
+# gzip (zlib, gzip) or xz (lzma) members, each holding complete rows, which standard tools read as one file
+CODECS = ["none", "zlib", "gzip", "lzma"]
+CODEC_IDS = {"zlib": 1, "gzip": 2, "lzma": 3}
+CSV_EXTENSIONS = {"none": ".csv", "zlib": ".csv.gz", "gzip": ".csv.gz", "lzma": ".csv.xz"}
+
+
+def compress(data, codec, level=6):
+    if codec == "zlib":
+        return zlib.compress(data, level)
+    elif codec == "gzip":
+        return gzip.compress(data, level, mtime=0)
+    elif codec == "lzma":
+        return lzma.compress(data, preset=level)
+    raise ValueError("Unknown compression: " + str(codec))
+
+
+def decompress(data, codec):
+    if codec == "zlib":
+        return zlib.decompress(data)
+    elif codec == "gzip":
+        return gzip.decompress(data)
+    elif codec == "lzma":
+        return lzma.decompress(data)
+    raise ValueError("Unknown compression: " + str(codec))
+
+
+def codec_name(codec_id):
+    return {val: key for key, val in CODEC_IDS.items()}[codec_id]
+
+
+def delta_encode(values):
+    """
+        Differences between consecutive samples of a (n_samples, nchannels) integer block, after its first sample.
+        Integer overflow wraps around, and is undone by delta_decode()
+    """
+    encoded = values.copy()
+    encoded[1:] = np.diff(values, axis=0)
+    return encoded
+
+
+def delta_decode(values):
+    return np.cumsum(values, axis=0, dtype=values.dtype)
+
+
+def csv_codec(filepath):
+    # compression of a CSV recording, from its extension
+    if filepath.endswith(".gz"):
+        return "gzip"
+    elif filepath.endswith(".xz"):
+        return "lzma"
+    return "none"
+
+
+def open_csv(filepath, binary=False):
+    """
+        Opens a CSV recording for reading as text, or as bytes if binary, decompressing it if needed
+    """
+    codec = csv_codec(filepath)
+    if codec == "gzip":
+        return gzip.open(filepath, 'rb') if binary else gzip.open(filepath, 'rt', newline='')
+    elif codec == "lzma":
+        return lzma.open(filepath, 'rb') if binary else lzma.open(filepath, 'rt', newline='')
+    return open(filepath, 'rb') if binary else open(filepath, newline='')
+
+
+def member_end(data, codec):
+    """
+        Returns the content of the first gzip / xz member of data and the offset of the next member,
+        or None if the member is incomplete
+    """
+    decompressor = zlib.decompressobj(31) if codec == "gzip" else lzma.LZMADecompressor()
+    try:
+        content = decompressor.decompress(data)
+    except (zlib.error, lzma.LZMAError, EOFError):
+        return None
+    if not decompressor.eof:
+        return None
+    return content, len(data) - len(decompressor.unused_data)
+
+
+def trim_compressed_csv(path):
+    """
+        Drops an incomplete last member of a compressed CSV segment, left by an interrupted write
+    """
+    codec = csv_codec(path)
+    with open(path, 'rb+') as f:
+        data = f.read()
+        offset = 0
+        while offset < len(data):
+            member = member_end(data[offset:], codec)
+            if member is None:
+                break
+            offset += member[1]
+        if offset < len(data):
+            f.truncate(offset)
+
+
+class Compression_Stats(object):
+    """
+        Ratio and CPU time of the compressed chunks
+    """
+    def __init__(self, codec):
+        self.codec = codec
+        self.chunks = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.cpu_time = 0.0
+        self.last_ratio = 0.0
+        self.last_cpu_ms = 0.0
+
+    def compress(self, data, level=6):
+        cpu_start = time.thread_time()
+        compressed = compress(data, self.codec, level)
+        self.last_cpu_ms = (time.thread_time() - cpu_start) * 1000
+        self.last_ratio = len(data) / float(max(len(compressed), 1))
+        self.chunks += 1
+        self.raw_bytes += len(data)
+        self.compressed_bytes += len(compressed)
+        self.cpu_time += self.last_cpu_ms / 1000.0
+        return compressed
+
+    def report(self):
+        return {"compression": self.codec, "compressed_chunks": self.chunks, "raw_bytes": self.raw_bytes,
+                "compressed_bytes": self.compressed_bytes,
+                "compression_ratio": self.raw_bytes / float(self.compressed_bytes) if self.compressed_bytes > 0 else 0.0,
+                "compression_cpu_ms_per_chunk": self.cpu_time * 1000 / self.chunks if self.chunks > 0 else 0.0,
+                "last_chunk_ratio": self.last_ratio, "last_chunk_cpu_ms": self.last_cpu_ms}
+
+
+class Compressed_CSV_File(object):
+    """
+        Binary file like writer of a compressed CSV recording: the rows written are compressed as one member once
+        chunk_bytes have been written, and on flush(). compression_stats can be shared by several files
+    """
+    def __init__(self, filepath, codec, chunk_bytes=65536, compression_stats=None):
+        self.file = open(filepath, 'wb')
+        self.stats = compression_stats if compression_stats is not None else Compression_Stats("lzma" if codec == "lzma" else "gzip")
+        self.chunk_bytes = chunk_bytes
+        self.pending = io.BytesIO()
+
+    @property
+    def closed(self):
+        return self.file.closed
+
+    def write_member(self):
+        if self.pending.tell() > 0:
+            self.file.write(self.stats.compress(self.pending.getvalue()))
+            self.pending = io.BytesIO()
+
+    def write(self, data):
+        self.pending.write(data)
+        if self.pending.tell() >= self.chunk_bytes:
+            self.write_member()
+
+    def flush(self):
+        self.write_member()
+        self.file.flush()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
@@ -13,6 +13,74 @@ NCHANNELS = 4                   #default
 CHANNEL_TYPES = ["eda", "resp", "ppg", "ppg"]
 MARKER_EVENT_STATUS = False
 SAMPLING_RATE = 250             #default
-CSVFILE_HANDLE = None
+SERIAL_PROTOCOL = "auto"        #"auto", "ascii" or "binary"
+BLOCK_MODE = False              #emit sample blocks instead of one signal per sample
+BLOCK_DURATION_MS = 40          #block size by time, used when BLOCK_SAMPLES <= 0
+BLOCK_SAMPLES = 0               #block size by number of samples
+HIGH_RATE_MODE = False          #bulk reads without fixed sleep, for high sampling rates and channel counts (implies BLOCK_MODE)
+ACQUISITION_PROCESS = False     #serial reader and filter bank in a child process, sharing samples through a ring buffer (implies BLOCK_MODE)
+RING_BUFFER_SEC = 10            #capacity of the shared memory ring buffer in seconds, used with ACQUISITION_PROCESS
+RECORD_QUEUE_SIZE = 1000        #blocks / samples queued for the recording writer thread before write() waits
+RECORD_FLUSH_INTERVAL_MS = 1000 #recording file flush interval
+RECORD_FSYNC_INTERVAL_MS = 0    #recording checkpoint interval (fsync and session manifest update), 0 syncs only when segments are closed
+RECORD_FORMAT = "csv"           #"csv" or "binary" (utils/binary_recording.py)
+RECORD_BINARY_DTYPE = "int16"   #sample type of binary recordings
+RECORD_SEGMENT_DURATION_S = 0   #recording segment duration, 0 for no limit
+RECORD_SEGMENT_SIZE_MB = 0      #recording segment file size, 0 for no limit
+RECORD_COMPRESSION = "none"     #"none", "zlib", "gzip" or "lzma", per chunk of binary recordings or per block of CSV rows
+RECORD_DELTA_ENCODING = False   #delta encoding of binary recording chunks before compression
+RECORD_EVENT_COLUMN = True      #event_code column in CSV recordings, as in earlier versions, in addition to the event table saved next to them
+REPLAY_PARAMS = None            #virtual serial port settings, when enabled in SW config
+DEVICE_PORTS = None             #serial ports of the devices merged onto one timeline, when multi_device is enabled in SW config
+DEVICE_NCHANNELS = None         #number of channels of each device, in the order of DEVICE_PORTS
 ANIM_RUNNING = False
-TEMP_FILENAME = ""
+
+
+def apply_sw_config(sw_config_dict):
+    """
+        Sets the acquisition parameters from the "acq_params", "replay", "multi_device" and "recording" sections of SW config.
+        Returns the baudrate.
+    """
+    global SAMPLING_RATE, SERIAL_PROTOCOL, BLOCK_MODE, BLOCK_DURATION_MS, BLOCK_SAMPLES, HIGH_RATE_MODE, ACQUISITION_PROCESS
+    global REPLAY_PARAMS, DEVICE_PORTS, DEVICE_NCHANNELS, RECORD_QUEUE_SIZE, RECORD_FLUSH_INTERVAL_MS, RECORD_FSYNC_INTERVAL_MS
+    global RECORD_FORMAT, RECORD_BINARY_DTYPE, RECORD_SEGMENT_DURATION_S, RECORD_SEGMENT_SIZE_MB, RECORD_COMPRESSION, RECORD_DELTA_ENCODING
+    global RECORD_EVENT_COLUMN
+
+    acq_params = sw_config_dict["acq_params"]
+    SAMPLING_RATE = int(acq_params["fs"])
+    if "protocol" in acq_params:
+        SERIAL_PROTOCOL = acq_params["protocol"]
+    if "block_mode" in acq_params:
+        BLOCK_MODE = bool(acq_params["block_mode"])
+        BLOCK_DURATION_MS = float(acq_params["block_duration_ms"])
+        BLOCK_SAMPLES = int(acq_params["block_samples"])
+    if "high_rate_mode" in acq_params:
+        HIGH_RATE_MODE = bool(acq_params["high_rate_mode"])
+        if HIGH_RATE_MODE:
+            BLOCK_MODE = True
+    if "acquisition_process" in acq_params:
+        ACQUISITION_PROCESS = bool(acq_params["acquisition_process"])
+        if ACQUISITION_PROCESS:
+            BLOCK_MODE = True
+    if "replay" in sw_config_dict and bool(sw_config_dict["replay"]["enable"]):
+        REPLAY_PARAMS = {key: val for key, val in sw_config_dict["replay"].items() if key != "enable"}
+    if "multi_device" in sw_config_dict and bool(sw_config_dict["multi_device"]["enable"]):
+        DEVICE_PORTS = sw_config_dict["multi_device"]["ports"]
+        DEVICE_NCHANNELS = [int(nch) for nch in sw_config_dict["multi_device"]["nchannels"]]
+        BLOCK_MODE = True
+    if "recording" in sw_config_dict:
+        RECORD_QUEUE_SIZE = int(sw_config_dict["recording"]["queue_size"])
+        RECORD_FLUSH_INTERVAL_MS = float(sw_config_dict["recording"]["flush_interval_ms"])
+        RECORD_FSYNC_INTERVAL_MS = float(sw_config_dict["recording"]["fsync_interval_ms"])
+        if "format" in sw_config_dict["recording"]:
+            RECORD_FORMAT = sw_config_dict["recording"]["format"]
+            RECORD_BINARY_DTYPE = sw_config_dict["recording"]["binary_dtype"]
+        if "segment_duration_s" in sw_config_dict["recording"]:
+            RECORD_SEGMENT_DURATION_S = float(sw_config_dict["recording"]["segment_duration_s"])
+            RECORD_SEGMENT_SIZE_MB = float(sw_config_dict["recording"]["segment_size_mb"])
+        if "compression" in sw_config_dict["recording"]:
+            RECORD_COMPRESSION = sw_config_dict["recording"]["compression"]
+            RECORD_DELTA_ENCODING = bool(sw_config_dict["recording"]["delta_encoding"])
+        if "event_column" in sw_config_dict["recording"]:
+            RECORD_EVENT_COLUMN = bool(sw_config_dict["recording"]["event_column"])
+    return int(acq_params["baudrate"])
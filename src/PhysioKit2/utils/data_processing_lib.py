@@ -1,5 +1,6 @@
 import numpy as np
-from scipy.signal import butter, iirnotch	#, lfilter, periodogram
+from scipy.signal import butter, iirnotch, tf2sos, sosfilt	#, lfilter, periodogram
+from PhysioKit2.utils.streaming_filters import Moving_Average
 
 class lFilter(object):
 	def __init__(self, lowcut, highcut, sample_rate, order=2):
@@ -11,6 +12,8 @@ class lFilter(object):
 		self.coefB = b
 		self.order = len(self.coefA) - 1
 		self.z = [0] * self.order
+		self.sos = butter(order, [low, high], btype='band', output='sos')
+		self.zi = None
 
 	def lfilt(self, data):
 		y = (data * self.coefB[0]) + self.z[0]
@@ -21,6 +24,13 @@ class lFilter(object):
 				self.z[i] = (data * self.coefB[i+1]) - (self.coefA[i+1] * y)
 		return y
 
+	def lfilt_block(self, data):
+		# data: (n_samples, n_channels), filter state is carried across blocks
+		if self.zi is None:
+			self.zi = np.zeros((self.sos.shape[0], 2, data.shape[1]))
+		y, self.zi = sosfilt(self.sos, data, axis=0, zi=self.zi)
+		return y
+
 
 class lFilter_notch(object):
 	def __init__(self, remove_freq, quality_factor, sample_rate):
@@ -29,6 +39,8 @@ class lFilter_notch(object):
 		self.coefB = b
 		self.order = len(self.coefA) - 1
 		self.z = [0] * self.order
+		self.sos = tf2sos(b, a)
+		self.zi = None
 
 	def lfilt(self, data):
 		y = (data * self.coefB[0]) + self.z[0]
@@ -39,19 +51,37 @@ class lFilter_notch(object):
 				self.z[i] = (data * self.coefB[i+1]) - (self.coefA[i+1] * y)
 		return y
 
+	def lfilt_block(self, data):
+		# data: (n_samples, n_channels), filter state is carried across blocks
+		if self.zi is None:
+			self.zi = np.zeros((self.sos.shape[0], 2, data.shape[1]))
+		y, self.zi = sosfilt(self.sos, data, axis=0, zi=self.zi)
+		return y
+
+
+# moving average used for EDA (utils/streaming_filters.py)
+lFilter_moving_average = Moving_Average
+
+
+class lFilter_bank(object):
+    """
+        Filters (n_samples, n_channels) blocks of data. Channels sharing the same filter settings
+        are filtered together by a single filter object exposing lfilt_block()
+    """
+    def __init__(self, nchannels):
+        self.nchannels = nchannels
+        self.filters = []
+        self.channels = []
 
-class lFilter_moving_average(object):
-    def __init__(self, window_size):
-        self.window_size = window_size
-        self.values = []
-        self.sum = 0
+    def add_filter(self, filt_obj, channels):
+        self.filters.append(filt_obj)
+        self.channels.append(list(channels))
 
-    def lfilt(self, value):
-        self.values.append(value)
-        self.sum += value
-        if len(self.values) > self.window_size:
-            self.sum -= self.values.pop(0)
-        return float(self.sum) / len(self.values)
+    def lfilt(self, data):
+        y = np.array(data, dtype=np.float64)
+        for filt_obj, channels in zip(self.filters, self.channels):
+            y[:, channels] = filt_obj.lfilt_block(y[:, channels])
+        return y
 
 
 # def butter_bandpass_filter(data, lowcut, highcut, sample_rate, order=2):
@@ -0,0 +1,54 @@
+import csv
+import os
+import numpy as np
+from PhysioKit2.utils.acquisition_health import sidecar_path
+
+# sparse event table of a recording, saved next to it as <recording name>_events.csv: each event sets the event code
+# from its sample on, an empty code ends the marking
+EVENT_FIELDS = ["sample_index", "host_monotonic_ns", "code", "label"]
+
+
+def events_path(recording_path):
+    return sidecar_path(recording_path, "_events.csv")
+
+
+def write_events(filepath, events):
+    with open(filepath, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=EVENT_FIELDS)
+        writer.writeheader()
+        writer.writerows(events)
+
+
+def read_events(filepath):
+    """
+        Returns the event table as a dict of arrays: sample_index and host_monotonic_ns (int64), code and label (str)
+    """
+    with open(filepath, newline='') as csvfile:
+        rows = list(csv.DictReader(csvfile))
+    return {"sample_index": np.array([int(row["sample_index"]) for row in rows], dtype=np.int64),
+            "host_monotonic_ns": np.array([int(row["host_monotonic_ns"]) for row in rows], dtype=np.int64),
+            "code": np.array([row["code"] for row in rows], dtype=str),
+            "label": np.array([row["label"] for row in rows], dtype=str)}
+
+
+def read_recording_events(recording_path):
+    """
+        Returns the event table saved next to a recording, empty if no event was marked
+    """
+    filepath = events_path(recording_path)
+    if os.path.exists(filepath):
+        return read_events(filepath)
+    return {"sample_index": np.zeros(0, dtype=np.int64), "host_monotonic_ns": np.zeros(0, dtype=np.int64),
+            "code": np.zeros(0, dtype=str), "label": np.zeros(0, dtype=str)}
+
+
+def expand_events(events, n_samples):
+    """
+        Per-sample event code of n_samples, with -1 where no event is marked, as in the event_code column of the loaders
+    """
+    event_code = -1 * np.ones(n_samples)
+    for nEv in range(len(events["sample_index"])):
+        start = max(int(events["sample_index"][nEv]), 0)
+        end = int(events["sample_index"][nEv + 1]) if nEv + 1 < len(events["sample_index"]) else n_samples
+        event_code[start: end] = float(events["code"][nEv]) if events["code"][nEv] != '' else -1
+    return event_code
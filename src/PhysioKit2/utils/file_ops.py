@@ -1,10 +1,6 @@
 from PySide6.QtCore import Signal, QObject, QThread
 import time
-from datetime import datetime
-import csv
-import os
-import shutil
-import numpy as np
+from PhysioKit2.utils.recorder import Recorder, recording_path
 
 class Data_Signals(QObject):
     data_signal = Signal(list)
@@ -32,35 +28,26 @@ class File_IO(QThread):
         self.stop_recording = False
         self.reset_temp_file = False
 
-        temp_utc_sec = str((datetime.now() - datetime(1970, 1, 1)).total_seconds())
-        temp_utc_sec = temp_utc_sec.replace('.', '_') + '_' + str(round(np.random.rand(1)[0], 6)).replace('0.', '')
-        self.config.TEMP_FILENAME = temp_utc_sec + "_temp.csv"
-        self.csv_header = ['']
-        self.ui.write_eventcode = ''
-        self.config.CSVFILE_HANDLE = open(self.config.TEMP_FILENAME, 'w', encoding="utf", newline="")
-        self.writer = csv.writer(self.config.CSVFILE_HANDLE)
-
-        self.csv_header = self.ui.channels + ["event_code"]
-        self.writer.writerow(self.csv_header)
+        # the events marked are added to the recorder, and saved in the event table of the recording
+        self.recorder = Recorder(self.ui.channels, self.config.RECORD_QUEUE_SIZE,
+                                 self.config.RECORD_FLUSH_INTERVAL_MS, self.config.RECORD_FSYNC_INTERVAL_MS,
+                                 file_format=self.config.RECORD_FORMAT, binary_dtype=self.config.RECORD_BINARY_DTYPE,
+                                 header={"channel_types": self.ui.channel_types, "fs": self.config.SAMPLING_RATE},
+                                 segment_duration_s=self.config.RECORD_SEGMENT_DURATION_S, segment_size_mb=self.config.RECORD_SEGMENT_SIZE_MB,
+                                 compression=self.config.RECORD_COMPRESSION, delta_encoding=self.config.RECORD_DELTA_ENCODING,
+                                 event_column=self.config.RECORD_EVENT_COLUMN)
 
 
     def csvWrite_function(self, value):
         if not self.stop_flag:
-            try:
-                self.writer.writerow(value + [self.ui.write_eventcode])
-            except:
-                print("Error writing data:", value + [self.ui.write_eventcode])
+            self.recorder.write(value)
 
     def stop(self):
         self.stop_flag = True
         time.sleep(0.3)
         # On closing of the thread
-        if os.path.exists(self.config.TEMP_FILENAME):
-            if not self.config.CSVFILE_HANDLE.closed:
-                self.config.CSVFILE_HANDLE.close()
-                time.sleep(0.2)
-            os.remove(self.config.TEMP_FILENAME)
-            time.sleep(0.2)
+        self.recorder.stop()
+        time.sleep(0.2)
         self.terminate()
         print("FileIO thread terminated...")
 
@@ -90,11 +77,6 @@ class File_IO(QThread):
                 start_signal = True
                 self.signals.record_signal.emit(start_signal)
 
-                if not os.path.exists(self.config.TEMP_FILENAME):
-                    self.config.CSVFILE_HANDLE = open(self.config.TEMP_FILENAME, 'w', encoding="utf", newline="")
-                    self.writer = csv.writer(self.config.CSVFILE_HANDLE)
-                    self.writer.writerow(self.csv_header)
-
                 self.start_recording = False
                 time.sleep(0.1)
 
@@ -105,37 +87,23 @@ class File_IO(QThread):
                 # self.ui.pushButton_record_data.setEnabled(True)
                 self.ui.pushButton_sync.setEnabled(True)
 
-                if not self.config.CSVFILE_HANDLE.closed:
-                    time.sleep(0.1)
-                    self.config.CSVFILE_HANDLE.close()
-                    time.sleep(0.1)
-                self.save_file_path = os.path.join(self.ui.data_root_dir, self.ui.pid + "_" +
-                                                self.ui.curr_exp_name + '_' + self.ui.curr_exp_condition + '_' + 
-                                                self.ui.utc_sec + '_' + str(round(np.random.rand(1)[0], 6)).replace('0.', '') + '.csv')
-                if os.path.exists(self.config.TEMP_FILENAME):
-                    shutil.move(self.config.TEMP_FILENAME, self.save_file_path)
+                time.sleep(0.1)
+                self.save_file_path = recording_path(self.ui.data_root_dir, self.ui.pid, self.ui.curr_exp_name,
+                                                     self.ui.curr_exp_condition, self.ui.utc_sec, self.recorder.extension)
+                if self.recorder.save(self.save_file_path, self.ui.acq_health):
                     self.ui.label_status.setText("Recording stopped and data saved for: Exp - " + self.ui.curr_exp_name + "; Condition - " + self.ui.curr_exp_condition)
                     time.sleep(0.1)
+                elif self.recorder.degraded:
+                    self.ui.label_status.setText("Data saved with gaps, samples lost to write errors: Exp - " + self.ui.curr_exp_name + "; Condition - " + self.ui.curr_exp_condition)
                 else:
                     self.ui.label_status.setText("Error saving data")
 
-                # prepare for next recording
-                self.config.CSVFILE_HANDLE = open(self.config.TEMP_FILENAME, 'w', encoding="utf", newline="")
-                self.writer = csv.writer(self.config.CSVFILE_HANDLE)
-                self.writer.writerow(self.csv_header)
                 self.ui.pushButton_record_data.setEnabled(True)
                 
                 self.stop_recording = False
 
             elif self.reset_temp_file:
-                if os.path.exists(self.config.TEMP_FILENAME):
-                    if not self.config.CSVFILE_HANDLE.closed:
-                        self.config.CSVFILE_HANDLE.close()
-                    os.remove(self.config.TEMP_FILENAME)
-
-                self.config.CSVFILE_HANDLE = open(self.config.TEMP_FILENAME, 'w', encoding="utf", newline="")
-                self.writer = csv.writer(self.config.CSVFILE_HANDLE)
-                self.writer.writerow(self.csv_header)
+                self.recorder.discard()
                 self.reset_temp_file = False
                 time.sleep(0.1)
 
@@ -1,84 +1,118 @@
 import csv
+import os
 import numpy as np
+from PhysioKit2.utils.binary_recording import Binary_Recording
+from PhysioKit2.utils.compression import open_csv
+from PhysioKit2.utils.events import events_path, read_recording_events, expand_events
+from PhysioKit2.utils.recording_cache import get_cache
+
+# cached results of an earlier version of parse_csv_columns() are parsed again
+PARSER_VERSION = 2
+# header names of the channels of the recordings, by the names of the sensors in the experiment config
+CHANNELS = {"eda": "EDA", "resp": "Resp", "ppg1": "PPG Finger", "ppg2": "PPG Ear"}
+
 
 def load_numpy_data(filepath):
     data = np.load(filepath)
     return data
 
-def load_csv_data_ppg(filepath):
-    ppg1 = []
-    ppg2 = []
-    event_code = []
-    skip_first = True
-    with open(filepath, newline='') as csvfile:
-        csvreader = csv.reader(csvfile, delimiter=',')
-        for ln in csvreader:
-            if skip_first:
-                print(ln)
-                skip_first = False
-            else:
-                # print(ln)
-                # break
-                ppg1.append(float(ln[2]))
-                ppg2.append(float(ln[3]))
-                if ln[4] != '':
-                    event_code.append(float(ln[4]))
-                else:
-                    event_code.append(-1)
-
-    ppg1 = np.array(ppg1)
-    ppg2 = np.array(ppg2)
-    event_code = np.array(event_code)
 
+def parse_csv_columns(filepath, columns, dtype):
+    # the event codes are expanded from the event table saved next to the recording, the event_code column is only
+    # parsed for recordings without one
+    event_column = None
+    with open_csv(filepath) as csvfile:
+        header = next(csv.reader([csvfile.readline()]))
+        if columns is None:
+            columns = [name for name in header if name != "event_code"]
+        usecols = [col if isinstance(col, (int, np.integer)) else header.index(col) for col in columns]
+        fields = [(str(nCol), dtype) for nCol in range(len(usecols))]
+        if "event_code" in header and not os.path.exists(events_path(filepath)):
+            event_column = header.index("event_code")
+            fields.append(("event_code", "U32"))
+            data = np.loadtxt(csvfile, delimiter=',', usecols=usecols + [event_column], dtype=np.dtype(fields), ndmin=1)
+        else:
+            data = np.loadtxt(csvfile, delimiter=',', usecols=usecols, dtype=np.dtype(fields), ndmin=1)
+
+    values = np.empty((len(usecols), len(data)), dtype=dtype)
+    for nCol in range(len(usecols)):
+        values[nCol] = data[str(nCol)]
+    if event_column is not None:
+        event_code = -1 * np.ones(len(data))
+        codes = data["event_code"]
+        marked = codes != ''
+        event_code[marked] = codes[marked].astype(float)
+    else:
+        event_code = expand_events(read_recording_events(filepath), len(data))
+    return {"names": np.array([header[col] for col in usecols], dtype=str), "values": values, "event_code": event_code}
+
+
+def read_csv_columns(filepath, columns=None, dtype=np.float64, use_cache=True):
+    """
+        Parses a CSV recording with the C parser of numpy. columns selects the signal columns by header name or index,
+        by default all the columns but event_code. Returns the names and the arrays of the selected columns, and the
+        event codes, with -1 for no event, from the event table of the recording when saved. The parsed columns are
+        kept in the recording cache, unless use_cache is False.
+    """
+    recording_cache = get_cache()
+    if use_cache and recording_cache is not None:
+        params = [None if columns is None else [col if isinstance(col, str) else int(col) for col in columns], np.dtype(dtype).str]
+        arrays = recording_cache.cached(lambda path: parse_csv_columns(path, columns, dtype), filepath, params,
+                                        dependencies=[events_path(filepath)], version=PARSER_VERSION)
+    else:
+        arrays = parse_csv_columns(filepath, columns, dtype)
+    return [str(name) for name in arrays["names"]], list(arrays["values"]), arrays["event_code"]
+
+
+def load_csv_recording(filepath, columns=None, dtype=np.float64, use_cache=True):
+    """
+        Loads the columns of a CSV recording selected by header name or index (all by default) as a dict of arrays
+        by header name, including the event codes as event_code, with -1 for no event.
+    """
+    names, values, event_code = read_csv_columns(filepath, columns, dtype, use_cache)
+    recording = dict(zip(names, values))
+    recording["event_code"] = event_code
+    return recording
+
+
+def load_csv_data_ppg(filepath):
+    _, (ppg1, ppg2), event_code = read_csv_columns(filepath, [CHANNELS["ppg1"], CHANNELS["ppg2"]])
     return ppg1, ppg2, event_code
 
 
 def load_csv_data_eda(filepath):
-    eda = []
-    event_code = []
-    skip_first = True
-    with open(filepath, newline='') as csvfile:
-        csvreader = csv.reader(csvfile, delimiter=',')
-        for ln in csvreader:
-            if skip_first:
-                print(ln)
-                skip_first = False
-            else:
-                # print(ln)
-                # break
-                eda.append(float(ln[0]))
-                if ln[4] != '':
-                    event_code.append(float(ln[4]))
-                else:
-                    event_code.append(-1)
-
-    eda = np.array(eda)
-    event_code = np.array(event_code)
-
+    _, (eda,), event_code = read_csv_columns(filepath, [CHANNELS["eda"]])
     return eda, event_code
 
 
 def load_csv_data_resp(filepath):
-    resp = []
-    event_code = []
-    skip_first = True
-    with open(filepath, newline='') as csvfile:
-        csvreader = csv.reader(csvfile, delimiter=',')
-        for ln in csvreader:
-            if skip_first:
-                print(ln)
-                skip_first = False
-            else:
-                # print(ln)
-                # break
-                resp.append(float(ln[1]))
-                if ln[4] != '':
-                    event_code.append(float(ln[4]))
-                else:
-                    event_code.append(-1)
-
-    resp = np.array(resp)
-    event_code = np.array(event_code)
-
+    _, (resp,), event_code = read_csv_columns(filepath, [CHANNELS["resp"]])
     return resp, event_code
 
+
+def load_binary_data(filepath, start_s=0, end_s=None, channels=None):
+    """
+        Loads the samples from start_s to end_s seconds of a binary recording (.pkb), of all channels or of the channels
+        given by name or index. Returns the (n_samples, n_channels) data, and the event codes with -1 for no event.
+    """
+    recording = Binary_Recording(filepath)
+    start = int(round(start_s * recording.fs))
+    end = None if end_s is None else int(round(end_s * recording.fs))
+    data = np.array(recording.read(start, end, channels))
+    codes = recording.event_code(start, end)
+    recording.close()
+    event_code = -1 * np.ones(len(codes))
+    marked = codes != ''
+    event_code[marked] = codes[marked].astype(float)
+    return data, event_code
+
+
+def load_events(filepath, n_samples=None):
+    """
+        Loads the event table saved next to the recording at filepath, as a dict of sample_index, host_monotonic_ns,
+        code and label arrays. With n_samples, also returns the per-sample event codes, with -1 for no event.
+    """
+    events = read_recording_events(filepath)
+    if n_samples is None:
+        return events
+    return events, expand_events(events, n_samples)
@@ -0,0 +1,289 @@
+import threading
+import time
+import numpy as np
+import serial
+
+from PhysioKit2.utils.acquisition_health import Acquisition_Health, ERROR_COUNTER_NAMES
+from PhysioKit2.utils.serial_protocol import MAX_GAP_FRAMES
+from PhysioKit2.utils.serial_reader import Serial_Reader
+from PhysioKit2.utils.virtual_serial import Virtual_Serial, VIRTUAL_PORT_NAME
+
+# device counters added up into the health of the merged stream
+MERGED_COUNTER_NAMES = ["bytes_received", "bytes_skipped", "samples_lost"] + ERROR_COUNTER_NAMES
+
+
+class Device_Clock(object):
+    """
+        Maps the sample index of a device to host monotonic time: t = offset + index * period.
+        Samples can only arrive after they are taken, so the model follows the earliest arrivals: the earliest
+        arrival of each window is kept, and a line through the latest n_windows of them gives the offset and drift.
+    """
+    def __init__(self, fs, window_sec=1.0, n_windows=30, max_drift=0.01):
+        self.nominal_period = 1.0 / fs
+        self.window_sec = window_sec
+        self.n_windows = n_windows
+        self.max_drift = max_drift
+        self.reset()
+
+    def reset(self):
+        self.period = self.nominal_period
+        self.offset = None
+        self.window_start = None
+        self.window_min = None      # (index, time, offset at nominal period) of the earliest arrival in the window
+        self.minima = []
+
+    def update(self, last_index, read_time):
+        # last_index: device index of the last sample received, read_time: host monotonic time of its arrival
+        nominal_offset = read_time - last_index * self.nominal_period
+        if self.window_min is None or nominal_offset < self.window_min[2]:
+            self.window_min = (last_index, read_time, nominal_offset)
+        if self.window_start is None:
+            self.window_start = read_time
+
+        if read_time - self.window_start >= self.window_sec:
+            self.minima.append(self.window_min[:2])
+            self.minima = self.minima[-self.n_windows:]
+            self.window_start = read_time
+            self.window_min = None
+            if len(self.minima) >= 2:
+                self.fit()
+
+        if len(self.minima) < 2:
+            # not enough windows to estimate the drift yet: nominal period and earliest arrival so far
+            self.offset = nominal_offset if self.offset is None else min(self.offset, nominal_offset)
+
+    def fit(self):
+        index = np.array([m[0] for m in self.minima], dtype=np.float64)
+        arrival = np.array([m[1] for m in self.minima])
+        period, intercept = np.polyfit(index - index[0], arrival - arrival[0], 1)
+        self.period = float(np.clip(period, self.nominal_period * (1 - self.max_drift), self.nominal_period * (1 + self.max_drift)))
+        self.offset = float(arrival[0] + intercept - index[0] * self.period)
+
+    def drift_ppm(self):
+        return (self.period / self.nominal_period - 1) * 1e6
+
+    def time_of(self, index):
+        return self.offset + index * self.period
+
+    def index_at(self, host_time):
+        return (host_time - self.offset) / self.period
+
+
+class Device_Reader(threading.Thread):
+    """
+        Reads one serial port in its own thread, timestamping every read with the host monotonic clock
+    """
+    def __init__(self, ser, nchannels, fs, protocol, max_buffer_sec=10.0):
+        super(Device_Reader, self).__init__(daemon=True)
+        self.ser = ser
+        self.nchannels = nchannels
+        self.health = Acquisition_Health(fs)
+        self.max_buffer_samples = int(max_buffer_sec * fs)
+        # a false gap filled with thousands of samples would shift the clock of the device
+        self.reader = Serial_Reader(ser, nchannels, protocol, self.health, fill_gaps=True,
+                                    max_fill_samples=min(MAX_GAP_FRAMES, self.max_buffer_samples))
+        self.clock = Device_Clock(fs)
+        self.lock = threading.Lock()
+        self.data_event = None
+        self.stop_flag = False
+        self.reset_flag = False
+        self.bytes_pending = 0
+        self.clear()
+
+    def clear(self):
+        self.samples = np.zeros((0, self.nchannels))
+        self.first_index = 0        # device index of samples[0]
+        self.n_received = 0
+
+    def reset_buffers(self):
+        self.reset_flag = True
+
+    def run(self):
+        while not self.stop_flag:
+            if not self.ser.is_open:
+                time.sleep(0.1)
+                continue
+            try:
+                if self.reset_flag:
+                    self.ser.reset_input_buffer()
+                    self.reader.reset()
+                    with self.lock:
+                        self.clear()
+                        self.clock.reset()
+                        self.health.clear_last_read()
+                    self.reset_flag = False
+                if self.reader.protocol is None:
+                    self.reader.detect_protocol(lambda: self.stop_flag)
+                    continue
+                self.bytes_pending = self.ser.in_waiting
+                block = self.reader.read_block()
+                read_time = time.monotonic()
+            except Exception as e:
+                self.health.add_read_error()
+                print("Exception:", self.ser.port, e)
+                time.sleep(0.1)
+                continue
+
+            if len(block) > 0:
+                with self.lock:
+                    self.samples = np.concatenate([self.samples, block])
+                    self.n_received += len(block)
+                    self.clock.update(self.n_received - 1, read_time)
+                    if len(self.samples) > self.max_buffer_samples:
+                        n_drop = len(self.samples) - self.max_buffer_samples
+                        self.samples = self.samples[n_drop:]
+                        self.first_index += n_drop
+                if self.data_event is not None:
+                    self.data_event.set()
+
+    def trim(self, keep_from_index):
+        # drops the samples before keep_from_index, called with the lock held
+        n_drop = min(max(keep_from_index - self.first_index, 0), len(self.samples))
+        if n_drop > 0:
+            self.samples = self.samples[n_drop:]
+            self.first_index += n_drop
+
+
+class Multi_Device_Reader(object):
+    """
+        Runs one Device_Reader per serial port and merges their streams onto the host monotonic timeline at fs.
+        Merged sample n is taken at t0 + n / fs, where t0 is when all devices are streaming, and each device contributes
+        its sample nearest to that time according to its Device_Clock. Channels are concatenated in the order of the ports.
+        Implements the parts of the serial.Serial interface used by Data_Acquisition_Thread, along with read_block().
+    """
+    def __init__(self, ports, nchannels, fs, baudrate, protocol, health, timeout=0.01, replay_params=None):
+        self.ports = ports
+        self.fs = float(fs)
+        self.health = health
+        self.timeout = timeout
+        self.protocol = "multi_device"
+        self.is_open = False
+        self.port = ", ".join(ports)
+        self.data_event = threading.Event()
+        self.margin_samples = int(fs)   # samples kept before the latest merged one, as the clock estimates move
+
+        self.devices = []
+        self.health.devices.clear()
+        self.health.device_info.clear()
+        for nDev, (port, nch) in enumerate(zip(ports, nchannels)):
+            if port == VIRTUAL_PORT_NAME:
+                ser = Virtual_Serial(fs=fs, nchannels=nch, **(replay_params or {}))
+            else:
+                ser = serial.Serial()
+                ser.port = port
+                ser.baudrate = baudrate
+                ser.timeout = timeout
+                ser.parity = serial.PARITY_NONE
+                ser.stopbits = serial.STOPBITS_ONE
+            device = Device_Reader(ser, nch, fs, protocol)
+            device.data_event = self.data_event
+            device.name = str(nDev) + ":" + port
+            self.health.devices[device.name] = device.health
+            self.devices.append(device)
+        self.reset()
+
+    def __repr__(self):
+        return "Multi_Device_Reader(ports=[{}], fs={})".format(self.port, self.fs)
+
+    def reset(self):
+        self.t0 = None
+        self.n_merged = 0
+        self.merged_totals = dict.fromkeys(MERGED_COUNTER_NAMES, 0)
+        for device in self.devices:
+            device.reset_buffers()
+
+    def open(self):
+        try:
+            for device in self.devices:
+                device.ser.open()
+        except serial.serialutil.SerialException as e:
+            print("Could not open serial port:", e)
+            self.close()
+            return False
+        for device in self.devices:
+            if not device.is_alive():
+                device.start()
+        self.is_open = True
+        return True
+
+    def close(self):
+        self.is_open = False
+        for device in self.devices:
+            device.stop_flag = True
+            if device.ser.is_open:
+                device.ser.close()
+
+    @property
+    def in_waiting(self):
+        return sum(device.bytes_pending for device in self.devices)
+
+    def write(self, data):
+        for device in self.devices:
+            device.ser.write(data)
+        return len(data)
+
+    def reset_input_buffer(self):
+        for device in self.devices:
+            device.reset_buffers()
+
+    def reset_output_buffer(self):
+        pass
+
+    def detect_protocol(self, stop_check=None):
+        # each Device_Reader detects the protocol of its own port
+        return self.protocol
+
+    def update_health(self):
+        for name in MERGED_COUNTER_NAMES:
+            total = sum(device.health.counters[name] for device in self.devices)
+            self.health.counters[name] += total - self.merged_totals[name]
+            self.merged_totals[name] = total
+        for device in self.devices:
+            self.health.device_info[device.name] = {
+                "clock_offset_ms": 1000.0 * (device.clock.offset - self.devices[0].clock.offset) if device.clock.offset is not None and self.devices[0].clock.offset is not None else None,
+                "clock_drift_ppm": device.clock.drift_ppm()}
+
+    def read_block(self):
+        """
+            Returns the merged samples available on the common timeline as a (n_samples, total channels) array
+        """
+        self.data_event.wait(self.timeout)
+        self.data_event.clear()
+        self.update_health()
+
+        for device in self.devices:
+            device.lock.acquire()
+        try:
+            merged = self.merge()
+        finally:
+            for device in self.devices:
+                device.lock.release()
+
+        self.health.add_samples(len(merged), 0)
+        return merged
+
+    def merge(self):
+        # called with the lock of every device held
+        n_channels = sum(device.nchannels for device in self.devices)
+        if any(device.reset_flag or device.clock.offset is None or len(device.samples) == 0 for device in self.devices):
+            return np.zeros((0, n_channels))
+
+        if self.t0 is None:
+            self.t0 = max(device.clock.time_of(device.first_index) for device in self.devices)
+        t_latest = min(device.clock.time_of(device.n_received - 1) for device in self.devices)
+        n_end = int(np.floor((t_latest - self.t0) * self.fs)) + 1
+        if n_end <= self.n_merged:
+            return np.zeros((0, n_channels))
+
+        merge_times = self.t0 + np.arange(self.n_merged, n_end) / self.fs
+        merged = []
+        for device in self.devices:
+            index = np.rint(device.clock.index_at(merge_times)).astype(np.int64)
+            index = np.clip(index, device.first_index, device.first_index + len(device.samples) - 1)
+            merged.append(device.samples[index - device.first_index])
+            device.trim(index[-1] - self.margin_samples)
+        self.n_merged = n_end
+        return np.concatenate(merged, axis=1)
+
+    def read_samples(self):
+        return self.read_block().tolist()
@@ -0,0 +1,400 @@
+from collections import deque
+from datetime import datetime
+import csv
+import io
+import os
+import queue
+import shutil
+import threading
+import time
+import numpy as np
+from PhysioKit2.utils.binary_recording import Binary_Recording_Writer, EXTENSION as BINARY_EXTENSION
+from PhysioKit2.utils.compression import Compression_Stats, Compressed_CSV_File, CSV_EXTENSIONS
+from PhysioKit2.utils.events import events_path, write_events
+from PhysioKit2.utils.segments import Session_Lock, segment_name, write_manifest, merge_segments
+
+
+def utc_seconds_str(timestamp):
+    return str((timestamp - datetime(1970, 1, 1)).total_seconds()).replace('.', '_')
+
+
+def recording_path(data_root_dir, pid, exp_name, exp_condition, utc_sec, extension='.csv'):
+    """
+        Path of a saved recording: <pid>_<study name>_<condition>_<UTC seconds>_<random>.csv (.csv.gz / .csv.xz when
+        compressed, or .pkb for binary recordings)
+    """
+    return os.path.join(data_root_dir, pid + "_" + exp_name + '_' + exp_condition + '_' +
+                        utc_sec + '_' + str(round(np.random.rand(1)[0], 6)).replace('0.', '') + extension)
+
+
+def temp_session_dir():
+    # in the working directory, as <UTC seconds>_<random>_temp
+    return utc_seconds_str(datetime.now()) + '_' + str(round(np.random.rand(1)[0], 6)).replace('0.', '') + "_temp"
+
+
+def format_rows(values, eventcode=None):
+    """
+        Formats a (n_samples, n_channels) block, or a single sample, as CSV rows ending with the event code, if not None
+    """
+    values = np.asarray(values)
+    if values.ndim == 1:
+        values = values[np.newaxis, :]
+    value_fmt = '%d' if values.dtype.kind in 'iub' else '%.10g'
+    row_fmt = ','.join([value_fmt] * values.shape[1])
+    if eventcode is not None:
+        row_fmt += ',' + str(eventcode).replace('%', '%%')
+    row_fmt += '\r\n'
+    return (row_fmt * values.shape[0]) % tuple(values.ravel().tolist())
+
+
+class Recorder(object):
+    """
+        Writes the recorded samples to a temporary session directory in the working directory, as CSV segments, followed by
+        the current event code if event_column is True, or with file_format "binary", as binary recordings
+        (utils/binary_recording.py) of binary_dtype samples with the channel_types and fs of header.
+        write() only queues the data: a writer thread formats everything queued since its last write as one buffer and
+        flushes the file every flush_interval_ms. A new segment is started every segment_duration_s of samples or
+        segment_size_mb of file, if greater than 0. If fsync_interval_ms > 0, the segment is synced to disk at that interval
+        and the session manifest is updated, so that physiokit_recover can rebuild the recording after a crash. The session
+        directory holds a lock file with the pid of the process while it is recorded to, so that it is not recovered meanwhile.
+        With compression "zlib", "gzip" or "lzma", the chunks of binary recordings (after delta encoding if delta_encoding
+        is True) or blocks of CSV rows are compressed by the writer thread, reporting the ratio and CPU time in stats().
+        Single samples are queued in batches of batch_samples, or as soon as the event code changes.
+        Events added with add_event() set the event code from their sample index on, and are saved as a sparse event table
+        next to the recording (utils/events.py). An event marked at a sample already written starts at the next sample written,
+        in the event table as in the recording.
+        When the bounded queue is full, write() waits for the writer instead of dropping data.
+        Segments are only created once samples are written. save() joins the segments into one recording in the data
+        directory, along with the acquisition health sidecar.
+    """
+    def __init__(self, channels, queue_size=1000, flush_interval_ms=1000, fsync_interval_ms=0, batch_samples=25,
+                 file_format="csv", binary_dtype="int16", header=None, segment_duration_s=0, segment_size_mb=0,
+                 compression="none", delta_encoding=False, event_column=True):
+        self.binary = file_format == "binary"
+        self.compression = compression
+        self.delta_encoding = delta_encoding
+        self.extension = BINARY_EXTENSION if self.binary else CSV_EXTENSIONS[compression]
+        self.session_dir = temp_session_dir()
+        self.session_lock = None
+        self.channels = list(channels)
+        self.event_column = event_column
+        self.csv_header = self.channels + (["event_code"] if event_column else [])
+        self.binary_dtype = binary_dtype
+        self.header = header if header is not None else {}
+        self.metadata = {}
+        self.eventcode = ''
+        self.events = []
+        self.event_changes = deque()    # events not yet applied to the samples written
+        self.samples_received = 0
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.fsync_interval = fsync_interval_ms / 1000.0
+        fs = self.header.get("fs")
+        self.segment_max_samples = int(segment_duration_s * fs) if segment_duration_s > 0 and fs else 0
+        self.segment_max_bytes = int(segment_size_mb * 1e6)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.batch_samples = batch_samples
+        self.pending = []
+        self.pending_eventcode = ''
+        self.file_lock = threading.Lock()
+        self.file = None
+        self.segments = []
+        self.degraded = False
+        self.reset_stats()
+        self.writer_thread = threading.Thread(target=self.run_writer, daemon=True)
+        self.writer_thread.start()
+
+    def reset_stats(self):
+        self.blocks_written = 0
+        self.samples_written = 0
+        self.bytes_written = 0
+        self.clipped_samples = 0
+        self.max_queue_depth = 0
+        self.write_latency_ms = 0.0         # from write() to the data being written to the file, for the last batch
+        self.max_write_latency_ms = 0.0
+        self.max_enqueue_wait_ms = 0.0      # time write() waited on a full queue
+        self.flushes = 0
+        self.fsyncs = 0
+        self.write_errors = 0               # batches that could not be written, leaving gaps in the recording
+        self.samples_lost = 0
+        self.last_write_error = ''
+        self.compression_stats = None
+        if self.compression != "none":
+            self.compression_stats = Compression_Stats(self.compression if self.binary or self.compression == "lzma" else "gzip")
+
+    def stats(self):
+        binary_file = self.file if self.binary else None
+        stats = {"queue_depth": self.queue.qsize(), "max_queue_depth": self.max_queue_depth,
+                 "blocks_written": self.blocks_written, "samples_written": self.samples_written,
+                 "bytes_written": self.bytes_written + (binary_file.bytes_written if binary_file is not None else 0),
+                 "write_latency_ms": self.write_latency_ms, "max_write_latency_ms": self.max_write_latency_ms,
+                 "max_enqueue_wait_ms": self.max_enqueue_wait_ms, "flushes": self.flushes, "fsyncs": self.fsyncs,
+                 "clipped_samples": self.clipped_samples + (binary_file.clipped_samples if binary_file is not None else 0),
+                 "segments": len(self.segments) + (1 if self.file is not None else 0),
+                 "write_errors": self.write_errors, "samples_lost": self.samples_lost, "last_write_error": self.last_write_error}
+        if self.compression_stats is not None:
+            stats.update(self.compression_stats.report())
+        return stats
+
+    def start_recording(self, metadata):
+        """
+            Called when recording starts, before the first sample is written, with the details of the recording (pid, study,
+            condition, start time, data directory...), kept in the session manifest for recovery and in the header of binary recordings
+        """
+        self.metadata = dict(metadata)
+        self.events = []
+        self.event_changes.clear()
+        self.samples_received = 0
+        self.eventcode = ''
+
+    def add_event(self, sample_index, host_monotonic_ns, code, label=''):
+        """
+            Marks an event at sample_index of the recording: code is written with the samples from sample_index on,
+            an empty code ends the marking
+        """
+        event = {"sample_index": int(sample_index), "host_monotonic_ns": int(host_monotonic_ns), "code": str(code), "label": label}
+        self.events.append(event)
+        self.event_changes.append(event)
+
+    def manifest(self):
+        current = None
+        if self.file is not None:
+            current = {"file": self.segment_file, "n_samples": self.segment_samples}
+        return {"format": "binary" if self.binary else "csv", "channels": self.channels, "header": self.header,
+                "metadata": self.metadata, "segments": self.segments, "current": current, "events": self.events}
+
+    def open_segment(self):
+        # called with file_lock held
+        if not os.path.exists(self.session_dir):
+            os.makedirs(self.session_dir)
+        if self.session_lock is None:
+            self.session_lock = Session_Lock(self.session_dir)
+        self.segment_file = segment_name(len(self.segments), self.extension)
+        segment_path = os.path.join(self.session_dir, self.segment_file)
+        if self.binary:
+            header = dict(self.header)
+            header.update(self.metadata)
+            self.file = Binary_Recording_Writer(segment_path, self.channels, self.binary_dtype, header, compression=self.compression,
+                                                delta=self.delta_encoding, compression_stats=self.compression_stats)
+        else:
+            header = io.StringIO()
+            csv.writer(header).writerow(self.csv_header)
+            if self.compression_stats is not None:
+                self.file = Compressed_CSV_File(segment_path, self.compression, compression_stats=self.compression_stats)
+                self.file.write(header.getvalue().encode())
+                # the header row is compressed on its own, so that it can be left out when the segments are joined
+                self.file.write_member()
+            else:
+                self.file = open(segment_path, 'wb')
+                self.file.write(header.getvalue().encode())
+        self.segment_samples = 0
+        self.segment_bytes = 0
+        self.last_flush = self.last_fsync = time.monotonic()
+        write_manifest(self.session_dir, self.manifest())
+
+    def close_segment(self):
+        # called with file_lock held
+        if self.file is None:
+            return
+        if self.binary:
+            self.file.close(self.metadata)
+            self.bytes_written += self.file.bytes_written
+            self.clipped_samples += self.file.clipped_samples
+        else:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+        self.segments.append({"file": self.segment_file, "n_samples": self.segment_samples})
+        self.file = None
+        write_manifest(self.session_dir, self.manifest())
+
+    def checkpoint(self):
+        # called with file_lock held: the samples written so far survive a crash
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        write_manifest(self.session_dir, self.manifest())
+        self.fsyncs += 1
+
+    def write(self, value):
+        block = isinstance(value, np.ndarray)
+        n_samples = len(value) if block else 1
+        while len(self.event_changes) > 0 and self.event_changes[0]["sample_index"] < self.samples_received + n_samples:
+            # a block is split at the sample of the event
+            event = self.event_changes.popleft()
+            if event["sample_index"] < self.samples_received:
+                # marked at a sample already written: the event starts with these samples
+                event["sample_index"] = self.samples_received
+            n_before = event["sample_index"] - self.samples_received
+            if block and n_before > 0:
+                self.write_samples(value[:n_before])
+                value = value[n_before:]
+                n_samples -= n_before
+                self.samples_received += n_before
+            self.eventcode = event["code"]
+        self.write_samples(value)
+        self.samples_received += n_samples
+
+    def write_samples(self, value):
+        if isinstance(value, np.ndarray):
+            self.write_pending()
+            self.enqueue(value, self.eventcode)
+            return
+        if self.eventcode != self.pending_eventcode:
+            self.write_pending()
+        self.pending.append(value)
+        self.pending_eventcode = self.eventcode
+        if len(self.pending) >= self.batch_samples:
+            self.write_pending()
+
+    def write_pending(self):
+        if len(self.pending) > 0:
+            rows, self.pending = self.pending, []
+            self.enqueue(rows, self.pending_eventcode)
+
+    def enqueue(self, value, eventcode):
+        enqueue_time = time.monotonic()
+        self.queue.put((value, eventcode, enqueue_time))
+        wait_ms = (time.monotonic() - enqueue_time) * 1000
+        self.max_enqueue_wait_ms = max(self.max_enqueue_wait_ms, wait_ms)
+        self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+
+    def write_blocks(self, blocks):
+        # called with file_lock held
+        if self.file is None:
+            self.open_segment()
+        n_samples = sum(len(value) for value, _, _ in blocks)
+        if self.binary:
+            for value, eventcode, _ in blocks:
+                self.file.write_block(value, eventcode)
+            self.segment_bytes = self.file.bytes_written
+        else:
+            buffer = ''.join(format_rows(value, eventcode if self.event_column else None) for value, eventcode, _ in blocks).encode()
+            self.file.write(buffer)
+            self.bytes_written += len(buffer)
+            self.segment_bytes += len(buffer)
+        self.segment_samples += n_samples
+
+        curr_time = time.monotonic()
+        if (self.segment_max_samples > 0 and self.segment_samples >= self.segment_max_samples) or \
+                (self.segment_max_bytes > 0 and self.segment_bytes >= self.segment_max_bytes):
+            # the next segment is started with the next samples written
+            self.close_segment()
+            return n_samples
+        if curr_time - self.last_flush >= self.flush_interval:
+            self.file.flush()
+            self.last_flush = curr_time
+            self.flushes += 1
+        if self.fsync_interval > 0 and curr_time - self.last_fsync >= self.fsync_interval:
+            self.checkpoint()
+            self.last_fsync = curr_time
+        return n_samples
+
+    def run_writer(self):
+        while True:
+            items = [self.queue.get()]
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = items[-1] is None
+            blocks = [item for item in items if item is not None]
+            try:
+                if len(blocks) > 0:
+                    with self.file_lock:
+                        n_samples = self.write_blocks(blocks)
+                    self.write_latency_ms = (time.monotonic() - blocks[0][2]) * 1000
+                    self.max_write_latency_ms = max(self.max_write_latency_ms, self.write_latency_ms)
+                    self.blocks_written += len(blocks)
+                    self.samples_written += n_samples
+            except Exception as e:
+                n_lost = sum(len(value) for value, _, _ in blocks)
+                print("Error writing data, " + str(n_lost) + " samples lost:", e)
+                self.write_errors += 1
+                self.samples_lost += n_lost
+                self.last_write_error = str(e)
+
+            for item in items:
+                self.queue.task_done()
+            if stop:
+                break
+
+    def release_session(self):
+        # called with file_lock held
+        if self.session_lock is not None:
+            self.session_lock.release()
+            self.session_lock = None
+
+    def remove_session(self):
+        # called with file_lock held
+        self.release_session()
+        if os.path.exists(self.session_dir):
+            shutil.rmtree(self.session_dir)
+        self.segments = []
+
+    def close(self, remove_temp=True):
+        self.write_pending()
+        self.queue.join()
+        with self.file_lock:
+            self.close_segment()
+            if remove_temp:
+                self.remove_session()
+
+    def stop(self):
+        # ends the writer thread, once all queued data is written
+        self.write_pending()
+        self.queue.put(None)
+        self.writer_thread.join()
+        self.close()
+
+    def save(self, save_path, health=None, metadata=None):
+        """
+            Writes out the queued data, joins the segments into one recording at save_path and writes the health sidecar,
+            and the event table, including the writer statistics. metadata is added to the recording details set with start_recording().
+            The session directory is kept if the segments cannot be joined. Returns False if the recording could not be saved,
+            or was saved with gaps left by write errors: degraded is then set, and the errors are counted in the health sidecar
+        """
+        self.write_pending()
+        self.queue.join()
+        saved = False
+        self.degraded = False
+        with self.file_lock:
+            # samples written meanwhile go to the next recording
+            if metadata is not None:
+                self.metadata.update(metadata)
+            if self.file is None and len(self.segments) == 0:
+                # nothing recorded: saved with the header only
+                self.open_segment()
+            self.close_segment()
+            stats = self.stats()
+            segment_paths = [os.path.join(self.session_dir, segment["file"]) for segment in self.segments]
+            try:
+                # the header of a single segment is already up to date
+                header = dict(self.header, **self.metadata) if self.binary and len(segment_paths) > 1 else None
+                merge_segments(segment_paths, save_path, self.binary, header)
+                self.remove_session()
+                if len(self.events) > 0:
+                    write_events(events_path(save_path), self.events)
+                if health is not None:
+                    health.write_sidecar(save_path, extra={"recorder": stats, "degraded": stats["write_errors"] > 0})
+                if stats["write_errors"] > 0:
+                    print("Recording saved with " + str(stats["samples_lost"]) + " samples lost to write errors:", save_path)
+                    self.degraded = True
+                else:
+                    saved = True
+            except Exception as e:
+                print("Error saving the recording, segments kept in " + self.session_dir + ":", e)
+                # the next recording goes to a new session directory, this one is left to physiokit_recover
+                self.release_session()
+                self.session_dir = temp_session_dir()
+                self.segments = []
+            self.reset_stats()
+        return saved
+
+    def discard(self):
+        self.pending = []
+        self.queue.join()
+        with self.file_lock:
+            self.close_segment()
+            self.remove_session()
+            self.reset_stats()
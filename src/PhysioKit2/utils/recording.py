@@ -0,0 +1,238 @@
+import csv
+import io
+import json
+import os
+import numpy as np
+from PhysioKit2.utils.acquisition_health import sidecar_path
+from PhysioKit2.utils.binary_recording import EXTENSION as BINARY_EXTENSION, Binary_Recording
+from PhysioKit2.utils.compression import csv_codec, open_csv
+from PhysioKit2.utils.events import events_path, read_events
+
+SCAN_BLOCK_SIZE = 1 << 20
+ROW_INDEX_STEP = 1024
+
+
+class CSV_Recording(object):
+    """
+        Reader of a CSV recording, with the interface of Binary_Recording: the byte offset of every ROW_INDEX_STEP rows
+        is found with one pass over the file, and read() only parses the rows of the requested range.
+        The sampling rate is fs, or the nominal rate saved in the acquisition health file of the recording.
+        Seeking back in a compressed recording decompresses it again from its start, so compressed recordings are
+        read forward from the end of the previous read, and only seek back when a read starts before it
+    """
+    def __init__(self, filepath, fs=None):
+        self.filepath = filepath
+        self.file = open_csv(filepath, binary=True)
+        self.compressed = csv_codec(filepath) != "none"
+        self.cursor = None
+        self.cursor_row = 0
+        header_line = self.file.readline()
+        self.header_row = next(csv.reader([header_line.decode()]))
+        self.event_column = self.header_row.index("event_code") if "event_code" in self.header_row else None
+        self.columns = [col for col in range(len(self.header_row)) if col != self.event_column]
+        self.channels = [self.header_row[col] for col in self.columns]
+        self.nchannels = len(self.channels)
+        self.header = {"channels": self.channels, "fs": fs if fs is not None else self.health_fs()}
+        self.row_offsets, self.n_samples = self.index_rows(len(header_line))
+        self.event_changes = None
+
+    def health_fs(self):
+        try:
+            with open(sidecar_path(self.filepath)) as json_file:
+                return json.load(json_file).get("nominal_fs")
+        except (OSError, ValueError):
+            return None
+
+    def index_rows(self, offset):
+        # byte offsets of rows 0, ROW_INDEX_STEP, 2 * ROW_INDEX_STEP... and number of rows, reading the file in blocks
+        row_offsets = [offset]
+        n_rows = 0
+        last = b'\n'
+        while True:
+            block = self.file.read(SCAN_BLOCK_SIZE)
+            if len(block) == 0:
+                break
+            line_ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == 10)
+            # row n_rows + k + 1 starts after the line end k of this block
+            rows = n_rows + np.arange(1, len(line_ends) + 1)
+            indexed = (rows % ROW_INDEX_STEP) == 0
+            row_offsets.extend((offset + line_ends[indexed] + 1).tolist())
+            n_rows += len(line_ends)
+            offset += len(block)
+            last = block[-1:]
+        if last != b'\n':
+            n_rows += 1
+        return np.array(row_offsets, dtype=np.int64), n_rows
+
+    @property
+    def events(self):
+        # event code changes as (sample index, code), as in Binary_Recording, found on first use
+        if self.event_changes is None:
+            self.event_changes = self.find_events()
+        return self.event_changes
+
+    def find_events(self):
+        # from the event table saved next to the recording, or else from the changes of its event_code column
+        if os.path.exists(events_path(self.filepath)):
+            table = read_events(events_path(self.filepath))
+            return [(int(sample_index), str(code)) for sample_index, code in zip(table["sample_index"], table["code"])]
+        events = []
+        if self.event_column is None or self.n_samples == 0:
+            return events
+        eventcode = ''
+        for start in range(0, self.n_samples, ROW_INDEX_STEP * 64):
+            codes = self.read_columns(start, min(start + ROW_INDEX_STEP * 64, self.n_samples), [self.event_column], "U32")[:, 0]
+            changes = np.flatnonzero(codes != np.concatenate([[eventcode], codes[:-1]]))
+            events.extend((start + int(index), str(codes[index])) for index in changes)
+            eventcode = codes[-1]
+        return events
+
+    @property
+    def channel_types(self):
+        return self.header.get("channel_types")
+
+    @property
+    def fs(self):
+        return self.header["fs"]
+
+    @property
+    def duration(self):
+        return self.n_samples / float(self.fs) if self.fs else None
+
+    def channel_indices(self, channels):
+        if channels is None:
+            return None
+        return [self.channels.index(ch) if isinstance(ch, str) else ch for ch in channels]
+
+    def read_columns(self, start, end, columns, dtype):
+        if self.compressed:
+            return self.read_columns_forward(start, end, columns, dtype)
+        block = start // ROW_INDEX_STEP
+        self.file.seek(int(self.row_offsets[block]))
+        text = io.TextIOWrapper(self.file, encoding='utf-8', newline='')
+        try:
+            data = np.loadtxt(text, delimiter=',', usecols=columns, dtype=dtype, skiprows=start - block * ROW_INDEX_STEP,
+                              max_rows=end - start, ndmin=2)
+        finally:
+            text.detach()
+        return data
+
+    def read_columns_forward(self, start, end, columns, dtype):
+        # rows read from the cursor left at row cursor_row by the previous read
+        if self.cursor is None or start < self.cursor_row:
+            block = start // ROW_INDEX_STEP
+            if self.cursor is not None:
+                self.cursor.detach()
+            self.file.seek(int(self.row_offsets[block]))
+            self.cursor = io.TextIOWrapper(self.file, encoding='utf-8', newline='')
+            self.cursor_row = block * ROW_INDEX_STEP
+        for _ in range(start - self.cursor_row):
+            self.cursor.readline()
+        lines = [self.cursor.readline() for _ in range(end - start)]
+        self.cursor_row = end
+        return np.loadtxt(lines, delimiter=',', usecols=columns, dtype=dtype, ndmin=2)
+
+    def read(self, start=0, end=None, channels=None):
+        """
+            Returns the samples [start, end) as a (n_samples, nchannels) array, of the channels given by name or index
+        """
+        end = self.n_samples if end is None else min(end, self.n_samples)
+        start = max(start, 0)
+        indices = self.channel_indices(channels)
+        columns = self.columns if indices is None else [self.columns[index] for index in indices]
+        if end <= start:
+            return np.zeros((0, len(columns)))
+        return self.read_columns(start, end, columns, np.float64)
+
+    def read_time(self, start_s=0, end_s=None, channels=None):
+        end = None if end_s is None else int(round(end_s * self.fs))
+        return self.read(int(round(start_s * self.fs)), end, channels)
+
+    def event_code(self, start=0, end=None):
+        end = self.n_samples if end is None else min(end, self.n_samples)
+        start = max(start, 0)
+        event_code = np.full(max(end - start, 0), '', dtype=object)
+        for nEv, (sample_index, code) in enumerate(self.events):
+            event_end = self.events[nEv + 1][0] if nEv + 1 < len(self.events) else self.n_samples
+            if sample_index < end and event_end > start:
+                event_code[max(sample_index, start) - start: min(event_end, end) - start] = code
+        return event_code
+
+    def close(self):
+        if self.cursor is not None:
+            self.cursor.detach()
+        self.file.close()
+
+
+class Recording(object):
+    """
+        Time indexed access to a recording of any length, binary (memory mapped) or CSV (parsed by range),
+        without loading it in memory. fs sets the sampling rate of CSV recordings without an acquisition health file
+    """
+    def __init__(self, filepath, fs=None):
+        self.filepath = filepath
+        if filepath.endswith(BINARY_EXTENSION):
+            self.source = Binary_Recording(filepath)
+        else:
+            self.source = CSV_Recording(filepath, fs)
+        self.fs = fs if fs is not None else self.source.fs
+        if self.fs is None:
+            raise ValueError("Sampling rate of the recording is not known, fs is needed: " + filepath)
+
+    @property
+    def channels(self):
+        return self.source.channels
+
+    @property
+    def n_samples(self):
+        return self.source.n_samples
+
+    @property
+    def duration(self):
+        return self.n_samples / float(self.fs)
+
+    def sample_index(self, time_s):
+        return int(round(time_s * self.fs))
+
+    def window(self, start_s=0, end_s=None, channels=None):
+        """
+            Returns the samples from start_s to end_s seconds as a (n_samples, nchannels) array,
+            of all channels or of the channels given by name or index
+        """
+        end = None if end_s is None else self.sample_index(end_s)
+        return np.asarray(self.source.read(self.sample_index(start_s), end, channels), dtype=np.float64)
+
+    def event_code(self, start_s=0, end_s=None):
+        """
+            Returns the event codes from start_s to end_s seconds, with -1 for no event
+        """
+        end = None if end_s is None else self.sample_index(end_s)
+        codes = self.source.event_code(self.sample_index(start_s), end)
+        event_code = -1 * np.ones(len(codes))
+        marked = codes != ''
+        event_code[marked] = codes[marked].astype(float)
+        return event_code
+
+    def epochs(self, winlen_s, step_s, channels=None, start_s=0, end_s=None):
+        """
+            Iterates over the windows of winlen_s seconds every step_s seconds from start_s, up to end_s or the end of
+            the recording, as (onset in seconds, (n_samples, nchannels) array). Only the samples not in the previous window
+            are read, so that at most one window is held in memory
+        """
+        winlen = self.sample_index(winlen_s)
+        step = self.sample_index(step_s)
+        end = self.n_samples if end_s is None else min(self.sample_index(end_s), self.n_samples)
+        buffer = None
+        buffer_start = 0
+        for onset in range(self.sample_index(start_s), end - winlen + 1, step):
+            if buffer is not None and onset < buffer_start + len(buffer):
+                kept = buffer[onset - buffer_start:]
+                new = np.asarray(self.source.read(buffer_start + len(buffer), onset + winlen, channels), dtype=np.float64)
+                buffer = np.concatenate([kept, new])
+            else:
+                buffer = np.asarray(self.source.read(onset, onset + winlen, channels), dtype=np.float64)
+            buffer_start = onset
+            yield onset / float(self.fs), buffer
+
+    def close(self):
+        self.source.close()
@@ -0,0 +1,140 @@
+import glob
+import hashlib
+import json
+import os
+import zipfile
+import numpy as np
+
+CACHE_DIR_ENV = "PHYSIOKIT_CACHE_DIR"
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def default_cache_dir():
+    return os.environ.get(CACHE_DIR_ENV, os.path.join(os.path.expanduser("~"), ".cache", "PhysioKit2"))
+
+
+def content_digest(filepath):
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Recording_Cache(object):
+    """
+        On-disk cache of parsed recordings, as one .npz file of arrays per recording and loader parameters.
+        Entries are keyed by the path, size and modification time of the recording and of the files the parsed arrays
+        also depend on (such as its event table, or their absence), by a hash of their content if content_hash is set,
+        and by the version of the loader. The least recently used entries are removed once the cache exceeds max_size_mb
+    """
+    def __init__(self, cache_dir=None, max_size_mb=2048, content_hash=False):
+        self.cache_dir = cache_dir if cache_dir is not None else default_cache_dir()
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.content_hash = content_hash
+        self.hits = 0
+        self.misses = 0
+
+    def file_key(self, filepath):
+        stat = os.stat(filepath)
+        key = [os.path.abspath(filepath), stat.st_size, stat.st_mtime_ns]
+        if self.content_hash:
+            key.append(content_digest(filepath))
+        return key
+
+    def key(self, filepath, params, dependencies=(), version=None):
+        key = [self.file_key(filepath), params, version]
+        for path in dependencies:
+            key.append(self.file_key(path) if os.path.exists(path) else [os.path.abspath(path), "missing"])
+        return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ".npz")
+
+    def load(self, filepath, params, dependencies=(), version=None):
+        """
+            Returns the dict of arrays cached for filepath and params, or None
+        """
+        path = self.entry_path(self.key(filepath, params, dependencies, version))
+        try:
+            with np.load(path, allow_pickle=False) as entry:
+                arrays = {name: entry[name] for name in entry.files}
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError, KeyError, EOFError, zipfile.BadZipFile):
+            # damaged entry, parsed again
+            self.misses += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return arrays
+
+    def store(self, filepath, params, arrays, dependencies=(), version=None):
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir, exist_ok=True)
+        path = self.entry_path(self.key(filepath, params, dependencies, version))
+        temp_path = path + "." + str(os.getpid()) + ".tmp"
+        try:
+            with open(temp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print("Error writing recording cache:", e)
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*.npz")):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+        total = sum(entry[1] for entry in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.cache_dir, "*.npz")):
+            os.remove(path)
+
+    def cached(self, loader, filepath, params, dependencies=(), version=None):
+        """
+            Returns loader(filepath) as a dict of arrays, from the cache when neither the recording nor the files in
+            dependencies have changed, for the same version of the loader
+        """
+        arrays = self.load(filepath, params, dependencies, version)
+        if arrays is None:
+            arrays = loader(filepath)
+            self.store(filepath, params, arrays, dependencies, version)
+        return arrays
+
+
+# cache used by the loaders of load_data.py, None to disable
+cache = Recording_Cache()
+
+
+def get_cache():
+    return cache
+
+
+def set_cache(recording_cache):
+    global cache
+    cache = recording_cache
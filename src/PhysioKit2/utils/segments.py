@@ -0,0 +1,227 @@
+import ctypes
+import glob
+import json
+import os
+import shutil
+import numpy as np
+from PhysioKit2.utils.binary_recording import EXTENSION as BINARY_EXTENSION, Binary_Recording, Binary_Recording_Writer
+from PhysioKit2.utils.compression import csv_codec, member_end, open_csv
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+MANIFEST_NAME = "session.json"
+LOCK_NAME = "session.lock"
+LOCK_OFFSET = 64    # byte locked in the lock file, after the pid, which stays readable on Windows
+MERGE_BLOCK_SAMPLES = 65536
+COUNT_BLOCK_SIZE = 1 << 20
+
+
+def segment_name(index, extension):
+    return "segment_" + str(index).zfill(5) + extension
+
+
+def write_manifest(session_dir, manifest):
+    """
+        Replaces the manifest of a session atomically, so that a crash leaves either the previous or the new manifest
+    """
+    manifest_path = os.path.join(session_dir, MANIFEST_NAME)
+    with open(manifest_path + ".tmp", 'w') as f:
+        json.dump(manifest, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def read_manifest(session_dir):
+    try:
+        with open(os.path.join(session_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def lock_file(f):
+    # locks f without waiting, returns False if it is locked by another process
+    try:
+        if os.name == 'nt':
+            f.seek(LOCK_OFFSET)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def unlock_file(f):
+    if os.name == 'nt':
+        f.seek(LOCK_OFFSET)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def pid_alive(pid):
+    if os.name == 'nt':
+        # os.kill() would terminate the process on Windows
+        PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+        STILL_ACTIVE = 259
+        ERROR_ACCESS_DENIED = 5
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(PROCESS_QUERY_LIMITED_INFORMATION, False, pid)
+        if not handle:
+            return kernel32.GetLastError() == ERROR_ACCESS_DENIED
+        exit_code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        kernel32.CloseHandle(handle)
+        return exit_code.value == STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class Session_Lock(object):
+    """
+        Lock file of a session directory, holding the pid of the recording process and locked while it is open,
+        so that physiokit_recover leaves the sessions of running recorders alone. release() removes it
+    """
+    def __init__(self, session_dir):
+        self.path = os.path.join(session_dir, LOCK_NAME)
+        self.file = open(self.path, 'a+')
+        if not lock_file(self.file):
+            self.file.close()
+            raise OSError("Session is already in use: " + session_dir)
+        self.file.seek(0)
+        self.file.truncate()
+        self.file.write(str(os.getpid()))
+        self.file.flush()
+
+    def release(self):
+        unlock_file(self.file)
+        self.file.close()
+        os.remove(self.path)
+
+
+def session_in_use(session_dir):
+    """
+        True if the lock file of the session is locked, or holds the pid of a running process other than this one
+    """
+    path = os.path.join(session_dir, LOCK_NAME)
+    if not os.path.exists(path):
+        return False
+    try:
+        with open(path, 'r+') as f:
+            if not lock_file(f):
+                return True
+            unlock_file(f)
+            f.seek(0)
+            pid = int(f.read().strip())
+    except ValueError:
+        return False
+    except OSError:
+        return True
+    return pid != os.getpid() and pid_alive(pid)
+
+
+def session_segments(session_dir, manifest=None):
+    """
+        Paths of the segments of a session, in recording order: the segments listed in the manifest,
+        or all the segment files found in the session directory
+    """
+    if manifest is not None:
+        names = [segment["file"] for segment in manifest["segments"]]
+        if manifest["current"] is not None:
+            names.append(manifest["current"]["file"])
+        paths = [os.path.join(session_dir, name) for name in names]
+        return [path for path in paths if os.path.exists(path)]
+    return sorted(glob.glob(os.path.join(session_dir, "segment_*.csv*")) + glob.glob(os.path.join(session_dir, "segment_*.pkb")))
+
+
+def trim_csv_segment(path):
+    """
+        Drops an incomplete last row, left by an interrupted write. Returns the number of complete rows, header excluded
+    """
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end = data.rfind(b'\n') + 1
+        if end < len(data):
+            f.truncate(end)
+    return max(data[:end].count(b'\n') - 1, 0)
+
+
+def recording_samples(path):
+    """
+        Number of samples of a binary or CSV recording (compressed or not), header row excluded
+    """
+    if path.endswith(BINARY_EXTENSION):
+        return Binary_Recording(path).n_samples
+    n_rows = 0
+    last = b'\n'
+    with open_csv(path, binary=True) as f:
+        while True:
+            block = f.read(COUNT_BLOCK_SIZE)
+            if len(block) == 0:
+                break
+            n_rows += block.count(b'\n')
+            last = block[-1:]
+    if last != b'\n':
+        n_rows += 1
+    return max(n_rows - 1, 0)
+
+
+def merge_binary(segment_paths, save_path, header=None):
+    writer = None
+    for path in segment_paths:
+        recording = Binary_Recording(path)
+        if writer is None:
+            writer = Binary_Recording_Writer(save_path, recording.channels, recording.dtype, recording.header)
+        bounds = sorted(set([0, recording.n_samples] + [event[0] for event in recording.events if event[0] < recording.n_samples]))
+        eventcode = ''
+        events = list(recording.events)
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            while len(events) > 0 and events[0][0] <= start:
+                eventcode = events.pop(0)[1]
+            for block_start in range(start, end, MERGE_BLOCK_SAMPLES):
+                writer.write_block(recording.read(block_start, min(block_start + MERGE_BLOCK_SAMPLES, end)), eventcode)
+        # events marked after the last sample of the segment, kept in the event table as in CSV recordings
+        for _, code in events:
+            writer.write_block(np.zeros((0, recording.nchannels), dtype=recording.dtype), code)
+        recording.close()
+    writer.close(header)
+
+
+def merge_segments(segment_paths, save_path, binary=False, header=None):
+    """
+        Writes the segments of a recording to save_path as one recording, updating the header of binary recordings with header.
+        A single complete segment is moved as it is.
+    """
+    if binary:
+        if len(segment_paths) == 1 and Binary_Recording(segment_paths[0]).complete and header is None:
+            shutil.move(segment_paths[0], save_path)
+        else:
+            merge_binary(segment_paths, save_path, header)
+        return
+
+    if len(segment_paths) == 1:
+        shutil.move(segment_paths[0], save_path)
+        return
+    codec = csv_codec(segment_paths[0])
+    with open(save_path, 'wb') as out_file:
+        for nSeg, path in enumerate(segment_paths):
+            with open(path, 'rb') as segment_file:
+                if nSeg > 0:
+                    # the header row is only kept from the first segment, compressed CSV segments start with a header member
+                    if codec == "none":
+                        segment_file.readline()
+                    else:
+                        member = member_end(segment_file.read(65536), codec)
+                        segment_file.seek(member[1] if member is not None and member[0].count(b'\n') == 1 else 0)
+                shutil.copyfileobj(segment_file, out_file)
+        out_file.flush()
+        os.fsync(out_file.fileno())
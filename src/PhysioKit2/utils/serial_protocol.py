@@ -0,0 +1,236 @@
+import binascii
+import numpy as np
+
+# Binary frame layout (all fields little-endian):
+#   sync word (uint16, 0x55AA -> bytes 0xAA, 0x55)
+#   sequence counter (uint16, wraps at 65536)
+#   NCHANNELS x sample value (uint16)
+#   checksum (uint16) = CRC-16/CCITT-FALSE (polynomial 0x1021, initial value 0xFFFF) of the sequence and sample bytes
+SYNC_WORD = 0x55AA
+SYNC_BYTES = bytes([0xAA, 0x55])
+HEADER_LEN = 4
+CHECKSUM_LEN = 2
+SEQ_MODULO = 65536
+# a larger jump of the sequence counter is taken as a loss of synchronisation rather than as missing samples
+MAX_GAP_FRAMES = 16
+# frames checked at once, so that a broken frame does not cost the checksum of everything buffered after it
+DECODE_CHUNK_FRAMES = 512
+
+
+def crc16_table():
+    table = np.zeros(256, dtype=np.uint32)
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        table[byte] = crc & 0xFFFF
+    return table
+
+
+CRC16_TABLE = crc16_table()
+
+
+def crc16(raw):
+    """
+        CRC-16/CCITT-FALSE of each row of a (n_frames, n_bytes) uint8 array
+    """
+    crc = np.full(raw.shape[0], 0xFFFF, dtype=np.uint32)
+    for col in range(raw.shape[1]):
+        crc = ((crc << 8) & 0xFFFF) ^ CRC16_TABLE[(crc >> 8) ^ raw[:, col]]
+    return crc
+
+
+def frame_length(nchannels):
+    return HEADER_LEN + 2 * nchannels + CHECKSUM_LEN
+
+
+def frame_dtype(nchannels):
+    return np.dtype([("sync", "<u2"), ("seq", "<u2"), ("data", "<u2", (nchannels,)), ("checksum", "<u2")])
+
+
+def encode_frames(samples, seq_start=0):
+    """
+        Pack a (n_samples, n_channels) array into binary frames, as sent by the Arduino sketches
+    """
+    samples = np.atleast_2d(np.asarray(samples))
+    n_samples, nchannels = samples.shape
+    frames = np.zeros(n_samples, dtype=frame_dtype(nchannels))
+    frames["sync"] = SYNC_WORD
+    frames["seq"] = (seq_start + np.arange(n_samples)) % SEQ_MODULO
+    frames["data"] = samples
+    raw = frames.view(np.uint8).reshape(n_samples, -1)
+    frames["checksum"] = crc16(raw[:, 2:-CHECKSUM_LEN])
+    return frames.tobytes()
+
+
+def detect_protocol(raw_bytes, nchannels):
+    """
+        Returns "binary" if raw_bytes holds consecutive valid frames, "ascii" if it holds
+        newline terminated lines, or None if more data is needed to decide
+    """
+    flen = frame_length(nchannels)
+    decoder = Binary_Frame_Decoder(nchannels)
+    samples, _ = decoder.decode(raw_bytes)
+    if samples.shape[0] >= 2:
+        return "binary"
+    if len(raw_bytes) >= 3 * flen and raw_bytes.count(b"\n") >= 2:
+        return "ascii"
+    return None
+
+
+class Binary_Frame_Decoder(object):
+    """
+        Incremental decoder for fixed-width binary frames. Bytes are appended with decode(),
+        all complete frames are converted at once and the trailing partial frame is kept for the next call.
+        After a loss of synchronisation, a frame is only accepted once the sync word and sequence counter of the
+        next frame follow it, so that a misaligned frame passing the checksum by chance is not taken as data.
+    """
+    def __init__(self, nchannels, max_gap_frames=MAX_GAP_FRAMES):
+        self.nchannels = nchannels
+        self.frame_len = frame_length(nchannels)
+        self.dtype = frame_dtype(nchannels)
+        self.max_gap_frames = max_gap_frames
+        self.buffer = bytearray()
+        self.skipped_bytes = 0
+        self.bad_frames = 0     # number of times synchronisation was lost
+        self.seq_resyncs = 0    # sequence counter jumps larger than max_gap_frames
+        self.in_sync = True
+        self.last_seq = None
+
+    def reset(self):
+        self.buffer = bytearray()
+        self.last_seq = None
+
+    def _resync(self, start):
+        # drop bytes up to the next sync word found at or after start
+        if self.in_sync:
+            self.bad_frames += 1
+            self.in_sync = False
+        pos = self.buffer.find(SYNC_BYTES, start)
+        if pos < 0:
+            # keep the last byte, it may be the first half of a sync word
+            pos = max(len(self.buffer) - 1, start)
+        self.skipped_bytes += pos
+        del self.buffer[:pos]
+
+    def _confirmed(self):
+        # True if the valid frame at the start of the buffer is followed by the next frame, False if not,
+        # None if more data is needed to tell
+        if len(self.buffer) < 2 * self.frame_len:
+            return None
+        frames = np.frombuffer(self.buffer, dtype=self.dtype, count=2)
+        checksum = binascii.crc_hqx(bytes(self.buffer[2: self.frame_len - CHECKSUM_LEN]), 0xFFFF)
+        return bool(frames["sync"][0] == SYNC_WORD and frames["checksum"][0] == checksum and
+                    frames["sync"][1] == SYNC_WORD and (int(frames["seq"][1]) - int(frames["seq"][0])) % SEQ_MODULO == 1)
+
+    def decode(self, raw_bytes):
+        """
+            Returns (samples, seq) where samples is a (n_samples, nchannels) uint16 array
+            and seq holds the matching sequence counters
+        """
+        self.buffer.extend(raw_bytes)
+        samples = []
+        seqs = []
+
+        while len(self.buffer) >= self.frame_len:
+            if self.buffer[0] != SYNC_BYTES[0] or self.buffer[1] != SYNC_BYTES[1]:
+                self._resync(1)
+                continue
+
+            if not self.in_sync:
+                confirmed = self._confirmed()
+                if confirmed is None:
+                    break
+                if not confirmed:
+                    self._resync(1)
+                    continue
+                self.in_sync = True
+
+            n_frames = min(len(self.buffer) // self.frame_len, DECODE_CHUNK_FRAMES)
+            frames = np.frombuffer(self.buffer, dtype=self.dtype, count=n_frames)
+            raw = frames.view(np.uint8).reshape(n_frames, self.frame_len)
+            valid = (frames["sync"] == SYNC_WORD) & (frames["checksum"] == crc16(raw[:, 2:-CHECKSUM_LEN]))
+
+            if valid.all():
+                n_valid = n_frames
+            else:
+                n_valid = int(np.argmin(valid))
+
+            if n_valid > 0:
+                samples.append(frames["data"][:n_valid].copy())
+                seqs.append(frames["seq"][:n_valid].copy())
+            del frames, raw
+
+            del self.buffer[:n_valid * self.frame_len]
+            if n_valid < n_frames:
+                # frame at n_valid is broken, look for the next sync word past its sync bytes
+                self._resync(1)
+
+        if len(samples) > 0:
+            return np.concatenate(samples), np.concatenate(seqs)
+        return np.zeros((0, self.nchannels), dtype=np.uint16), np.zeros(0, dtype=np.uint16)
+
+    def find_gaps(self, seq):
+        """
+            Returns (positions, n_missing): the index in seq before which frames are missing, and how many,
+            from the sequence counters of consecutive decode() calls. Jumps of more than max_gap_frames are counted
+            in seq_resyncs instead, as the number of frames missing is then unknown
+        """
+        seq = np.asarray(seq, dtype=np.int64)
+        if len(seq) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        prev_seq = np.empty_like(seq)
+        prev_seq[0] = seq[0] - 1 if self.last_seq is None else self.last_seq
+        prev_seq[1:] = seq[:-1]
+        missing = (seq - prev_seq - 1) % SEQ_MODULO
+        self.last_seq = int(seq[-1])
+        implausible = missing > self.max_gap_frames
+        self.seq_resyncs += int(np.sum(implausible))
+        missing[implausible] = 0
+        positions = np.nonzero(missing)[0]
+        return positions, missing[positions]
+
+
+class Ascii_Line_Decoder(object):
+    """
+        Incremental decoder for comma separated lines. All complete lines are converted at once,
+        malformed lines (wrong number of values or non numeric) are skipped and the trailing partial line is kept for the next call.
+    """
+    def __init__(self, nchannels):
+        self.nchannels = nchannels
+        self.remainder = b''
+        self.bad_lines = 0
+
+    def reset(self):
+        self.remainder = b''
+
+    def decode(self, raw_bytes):
+        """
+            Returns (samples, bad_positions) where samples is a (n_samples, nchannels) int64 array
+            and bad_positions holds the index in samples at which each malformed line was skipped
+        """
+        lines = (self.remainder + raw_bytes).split(b'\n')
+        self.remainder = lines.pop()
+        values = [ln.rstrip(b'\r').split(b',') for ln in lines if len(ln.strip()) > 0]
+
+        if all(len(vals) == self.nchannels for vals in values):
+            try:
+                samples = np.array(values).astype(np.int64).reshape(-1, self.nchannels)
+                return samples, np.zeros(0, dtype=np.int64)
+            except ValueError:
+                pass
+
+        # slow path, line by line
+        samples = []
+        bad_positions = []
+        for vals in values:
+            if len(vals) == self.nchannels:
+                try:
+                    samples.append([int(val) for val in vals])
+                    continue
+                except ValueError:
+                    pass
+            bad_positions.append(len(samples))
+        self.bad_lines += len(bad_positions)
+        samples = np.array(samples, dtype=np.int64).reshape(-1, self.nchannels)
+        return samples, np.array(bad_positions, dtype=np.int64)
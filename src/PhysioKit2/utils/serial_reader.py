@@ -0,0 +1,118 @@
+import numpy as np
+
+from PhysioKit2.utils.serial_protocol import Binary_Frame_Decoder, Ascii_Line_Decoder, detect_protocol, frame_length, MAX_GAP_FRAMES
+
+
+class Serial_Reader(object):
+    """
+        Reads and decodes the sample stream of one serial port, using the ASCII or binary protocol.
+        Malformed frames / lines are skipped and recorded as gaps in health, without discarding the data around them.
+        With fill_gaps, each missing sample is replaced by the previous one, so the sample index follows the device clock.
+        Gaps of more than max_fill_samples are not filled, and are counted as resyncs in health instead.
+    """
+    def __init__(self, ser, nchannels, protocol, health, fill_gaps=False, max_fill_samples=MAX_GAP_FRAMES):
+        self.ser = ser
+        self.nchannels = nchannels
+        self.config_protocol = protocol     # "auto", "ascii" or "binary"
+        self.health = health
+        self.fill_gaps = fill_gaps
+        self.max_fill_samples = max_fill_samples
+        self.protocol = None
+        self.frame_decoder = Binary_Frame_Decoder(nchannels)
+        self.line_decoder = Ascii_Line_Decoder(nchannels)
+        self.pending_samples = np.zeros((0, nchannels))
+
+    def reset(self):
+        self.frame_decoder.reset()
+        self.line_decoder.reset()
+        self.pending_samples = np.zeros((0, self.nchannels))
+
+    def detect_protocol(self, stop_check=None):
+        """
+            Resolves the serial protocol configured as "auto" by inspecting the first bytes received.
+            Binary frames are used when found, otherwise the ASCII (comma separated lines) protocol is assumed.
+        """
+        if self.config_protocol != "auto":
+            self.protocol = self.config_protocol
+            return self.protocol
+
+        max_detect_bytes = 64 * frame_length(self.nchannels)
+        raw_bytes = b''
+        protocol = None
+        while protocol is None and not (stop_check is not None and stop_check()):
+            raw_bytes += self.ser.read(max(self.ser.in_waiting, 1))
+            protocol = detect_protocol(raw_bytes, self.nchannels)
+            if protocol is None and len(raw_bytes) > max_detect_bytes:
+                protocol = "ascii"
+
+        if protocol == "binary":
+            # frames already received are not discarded
+            self.pending_samples, seq = self.frame_decoder.decode(raw_bytes)
+            self.frame_decoder.find_gaps(seq)
+            self.health.add_samples(len(self.pending_samples), len(raw_bytes))
+        elif protocol == "ascii":
+            # the lines received after the first one, which may be partial, are not discarded
+            first_end = raw_bytes.find(b'\n')
+            if first_end < 0:
+                self.ser.readline()
+            else:
+                self.pending_samples, bad_positions = self.line_decoder.decode(raw_bytes[first_end + 1:])
+                self.health.add_corrupt_lines(len(bad_positions))
+                self.health.add_gaps(bad_positions, np.ones(len(bad_positions), dtype=np.int64))
+            self.health.add_samples(len(self.pending_samples), len(raw_bytes))
+        print("Serial protocol detected:", protocol)
+        self.protocol = protocol
+        return protocol
+
+    def decode(self, raw_bytes):
+        """
+            Decodes raw_bytes with the detected protocol into a (n_samples, nchannels) array
+        """
+        if self.protocol == "binary":
+            bad_frames = self.frame_decoder.bad_frames
+            skipped_bytes = self.frame_decoder.skipped_bytes
+            seq_resyncs = self.frame_decoder.seq_resyncs
+            samples, seq = self.frame_decoder.decode(raw_bytes)
+            self.health.add_corrupt_frames(self.frame_decoder.bad_frames - bad_frames, self.frame_decoder.skipped_bytes - skipped_bytes)
+            gap_positions, n_missing = self.frame_decoder.find_gaps(seq)
+            self.health.add_resyncs(self.frame_decoder.seq_resyncs - seq_resyncs)
+        else:
+            samples, gap_positions = self.line_decoder.decode(raw_bytes)
+            n_missing = np.ones(len(gap_positions), dtype=np.int64)
+            if len(gap_positions) > 0:
+                self.health.add_corrupt_lines(len(gap_positions))
+                print('Mismatch in the number of channels specified in JSON file and the serial data received from Arduino or microcontroller')
+
+        if self.fill_gaps:
+            fill = n_missing <= self.max_fill_samples
+            self.health.add_resyncs(int(np.sum(~fill)))
+            gap_positions, n_missing = gap_positions[fill], n_missing[fill]
+        self.health.add_gaps(gap_positions, n_missing)
+        self.health.add_samples(len(samples), len(raw_bytes))
+        if self.fill_gaps and len(gap_positions) > 0 and len(samples) > 0:
+            repeats = np.ones(len(samples), dtype=np.int64)
+            np.add.at(repeats, np.maximum(gap_positions - 1, 0), n_missing)
+            samples = np.repeat(samples, repeats, axis=0)
+        if len(self.pending_samples) > 0:
+            samples = np.concatenate([self.pending_samples, samples])
+            self.pending_samples = np.zeros((0, self.nchannels))
+        return samples
+
+    def read_samples(self):
+        """
+            Returns the list of samples received since the last call
+        """
+        if self.protocol == "binary":
+            raw_bytes = self.ser.read(max(self.ser.in_waiting, self.frame_decoder.frame_len))
+        else:
+            raw_bytes = self.ser.readline()
+        return self.decode(raw_bytes).tolist()
+
+    def read_block(self):
+        """
+            Drains the serial input buffer and returns the received samples as a (n_samples, nchannels) array.
+            When nothing is pending, waits for at least one frame (binary) or byte (ASCII), up to the serial timeout.
+        """
+        min_read = self.frame_decoder.frame_len if self.protocol == "binary" else 1
+        raw_bytes = self.ser.read(max(self.ser.in_waiting, min_read))
+        return self.decode(raw_bytes)
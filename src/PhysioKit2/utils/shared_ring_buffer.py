@@ -0,0 +1,136 @@
+from multiprocessing import shared_memory
+import numpy as np
+
+# int64 control slots at the start of the shared memory block
+WRITE_INDEX = 0     # total number of samples written
+LIVE_FLAG = 1       # set by the reading process while live acquisition is on
+STOP_FLAG = 2       # set by the reading process to stop the writing process
+N_CONTROL_SLOTS = 8
+
+
+class Shared_Ring_Buffer(object):
+    """
+        Ring buffer of raw (int64) and filtered (float64) samples in multiprocessing shared memory, written by a single
+        process and read by any number of Ring_Reader, in any process attaching to it by name, without locks.
+        The write index is only advanced once the samples are in place, so readers never see partially written samples.
+    """
+    def __init__(self, nchannels, capacity, name=None):
+        self.nchannels = nchannels
+        self.capacity = capacity
+        control_bytes = N_CONTROL_SLOTS * 8
+        block_bytes = capacity * nchannels * 8
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=control_bytes + 2 * block_bytes)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+
+        self.control = np.ndarray((N_CONTROL_SLOTS,), dtype=np.int64, buffer=self.shm.buf)
+        self.raw = np.ndarray((capacity, nchannels), dtype=np.int64, buffer=self.shm.buf, offset=control_bytes)
+        self.filt = np.ndarray((capacity, nchannels), dtype=np.float64, buffer=self.shm.buf, offset=control_bytes + block_bytes)
+        if self.owner:
+            self.control[:] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_index(self):
+        return int(self.control[WRITE_INDEX])
+
+    def write(self, raw, filt=None):
+        """
+            Appends a (n_samples, nchannels) block of raw samples, and optionally the corresponding filtered samples
+        """
+        n_samples = len(raw)
+        if n_samples == 0:
+            return
+        write_index = self.write_index
+        if n_samples > self.capacity:
+            # only the latest capacity samples fit
+            raw = raw[-self.capacity:]
+            filt = filt[-self.capacity:] if filt is not None else None
+        n_copy = len(raw)
+        start = (write_index + n_samples - n_copy) % self.capacity
+        n_first = min(n_copy, self.capacity - start)
+        self.raw[start: start + n_first] = raw[:n_first]
+        self.raw[:n_copy - n_first] = raw[n_first:]
+        if filt is not None:
+            self.filt[start: start + n_first] = filt[:n_first]
+            self.filt[:n_copy - n_first] = filt[n_first:]
+        self.control[WRITE_INDEX] = write_index + n_samples
+
+    def close(self):
+        # the numpy views are dropped first, as shared memory cannot be closed while they exist
+        self.control = None
+        self.raw = None
+        self.filt = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+        except (BufferError, FileNotFoundError) as e:
+            print("Error releasing the shared memory ring buffer:", e)
+
+
+class Ring_Reader(object):
+    """
+        Reads the samples written to a Shared_Ring_Buffer since its last read. When the writer gets more than capacity
+        samples ahead, the overwritten samples are skipped and counted in overruns / samples_lost.
+    """
+    def __init__(self, ring, from_latest=True):
+        self.ring = ring
+        self.read_index = ring.write_index if from_latest else max(ring.write_index - ring.capacity, 0)
+        self.view_start = self.read_index
+        self.overruns = 0
+        self.samples_lost = 0
+
+    def available(self):
+        return self.ring.write_index - self.read_index
+
+    def skip_overrun(self, write_index):
+        n_lost = write_index - self.ring.capacity - self.read_index
+        if n_lost > 0:
+            self.overruns += 1
+            self.samples_lost += n_lost
+            self.read_index += n_lost
+        return n_lost
+
+    def read_views(self):
+        """
+            Returns the new samples as a list of (raw, filt) views into shared memory, one per contiguous segment, without copying.
+            The views are overwritten once the writer wraps around to them: valid() tells whether they were still intact.
+        """
+        write_index = self.ring.write_index
+        self.skip_overrun(write_index)
+        self.view_start = self.read_index
+        views = []
+        while self.read_index < write_index:
+            start = self.read_index % self.ring.capacity
+            end = min(start + write_index - self.read_index, self.ring.capacity)
+            views.append((self.ring.raw[start:end], self.ring.filt[start:end]))
+            self.read_index += end - start
+        return views
+
+    def valid(self):
+        # True if the views returned by the last read_views() have not been overwritten since
+        return self.ring.write_index - self.view_start <= self.ring.capacity
+
+    def read(self):
+        """
+            Returns copies of the new (raw, filt) samples, leaving out any sample overwritten while copying
+        """
+        views = self.read_views()
+        if len(views) == 0:
+            return np.zeros((0, self.ring.nchannels), dtype=np.int64), np.zeros((0, self.ring.nchannels))
+        raw = np.concatenate([view[0] for view in views])
+        filt = np.concatenate([view[1] for view in views])
+        n_overwritten = self.ring.write_index - self.ring.capacity - self.view_start
+        if n_overwritten > 0:
+            self.overruns += 1
+            self.samples_lost += n_overwritten
+            raw = raw[n_overwritten:]
+            filt = filt[n_overwritten:]
+        return raw, filt
@@ -0,0 +1,330 @@
+import heapq
+from collections import deque
+import numpy as np
+from scipy.signal import butter, lfilter, sosfilt, sosfilt_zi
+
+# windows per numpy median in Moving_Median.lfilt_block, bounding the memory used
+MEDIAN_CHUNK_ROWS = 4096
+# window size above which Moving_Median.lfilt_block uses the heaps, faster than numpy for long windows
+MEDIAN_BLOCK_MAX_WINDOW = 200
+
+
+class Circular_Buffer(object):
+    """
+        Preallocated circular array holding the latest `size` samples of `nchannels` channels.
+        Appending a sample or a block never shifts the stored data.
+    """
+    def __init__(self, size, nchannels=1, fill_value=None):
+        self.size = int(size)
+        self.nchannels = nchannels
+        self.data = np.zeros((self.size, nchannels))
+        self.index = 0          # next position to write
+        self.count = 0          # number of valid samples held
+        if fill_value is not None:
+            self.data[:] = fill_value
+            self.count = self.size
+
+    def __len__(self):
+        return self.count
+
+    def is_full(self):
+        return self.count == self.size
+
+    def oldest(self):
+        # sample that the next append overwrites once the buffer is full
+        return self.data[self.index] if self.count == self.size else self.data[0]
+
+    def append(self, value):
+        self.data[self.index] = value
+        self.index += 1
+        if self.index == self.size:
+            self.index = 0
+        if self.count < self.size:
+            self.count += 1
+
+    def extend(self, values):
+        values = np.asarray(values).reshape(-1, self.nchannels)
+        n_samples = values.shape[0]
+        if n_samples >= self.size:
+            self.data[:] = values[-self.size:]
+            self.index = 0
+        else:
+            n_first = min(n_samples, self.size - self.index)
+            self.data[self.index: self.index + n_first] = values[:n_first]
+            self.data[:n_samples - n_first] = values[n_first:]
+            self.index = (self.index + n_samples) % self.size
+        self.count = min(self.count + n_samples, self.size)
+
+    def get(self):
+        """
+            Returns a copy of the samples held, ordered from oldest to latest: (count, nchannels)
+        """
+        if self.count < self.size:
+            return self.data[:self.count].copy()
+        return np.concatenate([self.data[self.index:], self.data[:self.index]])
+
+
+class Moving_Average(object):
+    """
+        Moving average over the latest window_size samples, in O(1) per sample.
+        Until the window is filled, the average is taken over the samples received so far.
+    """
+    def __init__(self, window_size, nchannels=1):
+        self.window_size = int(window_size)
+        self.nchannels = nchannels
+        self.buffer = Circular_Buffer(self.window_size, nchannels)
+        self.sum = np.zeros(nchannels)
+        self.inv_window_size = 1.0 / self.window_size
+
+    def lfilt(self, value):
+        if self.buffer.is_full():
+            self.sum -= self.buffer.oldest()
+        self.sum += value
+        self.buffer.append(value)
+        if self.buffer.index == 0:
+            # re-sum once per window to avoid accumulating floating point error
+            self.sum = self.buffer.data.sum(axis=0)
+
+        if self.buffer.is_full():
+            y = self.sum * self.inv_window_size
+        else:
+            y = self.sum / self.buffer.count
+        return float(y[0]) if self.nchannels == 1 else y
+
+    def lfilt_block(self, data):
+        # data: (n_samples,) or (n_samples, nchannels)
+        data = np.asarray(data, dtype=np.float64)
+        in_shape = data.shape
+        data = data.reshape(-1, self.nchannels)
+
+        history = self.buffer.get()
+        n_hist = history.shape[0]
+        ext = np.concatenate([history, data], axis=0)
+        csum = np.concatenate([np.zeros((1, self.nchannels)), np.cumsum(ext, axis=0)], axis=0)
+        end_idx = np.arange(n_hist + 1, ext.shape[0] + 1)
+        start_idx = np.maximum(end_idx - self.window_size, 0)
+        y = (csum[end_idx] - csum[start_idx]) / (end_idx - start_idx)[:, np.newaxis]
+
+        self.buffer.extend(data)
+        self.sum = csum[-1] - csum[max(ext.shape[0] - self.window_size, 0)]
+        return y.reshape(in_shape)
+
+
+class Exponential_Smoothing(object):
+    """
+        First order exponential smoothing: y[n] = y[n-1] + alpha * (x[n] - y[n-1]), initialised with the first sample
+    """
+    def __init__(self, alpha, nchannels=1):
+        self.alpha = alpha
+        self.nchannels = nchannels
+        self.y = None
+
+    def lfilt(self, value):
+        if self.y is None:
+            self.y = np.zeros(self.nchannels) + value
+        else:
+            self.y = self.y + self.alpha * (value - self.y)
+        return float(self.y[0]) if self.nchannels == 1 else self.y
+
+    def lfilt_block(self, data):
+        # data: (n_samples,) or (n_samples, nchannels)
+        data = np.asarray(data, dtype=np.float64)
+        in_shape = data.shape
+        data = data.reshape(-1, self.nchannels)
+        if data.shape[0] == 0:
+            return data.reshape(in_shape)
+        if self.y is None:
+            self.y = data[0].copy()
+        zi = ((1 - self.alpha) * self.y)[np.newaxis, :]
+        y, _ = lfilter([self.alpha], [1, -(1 - self.alpha)], data, axis=0, zi=zi)
+        self.y = y[-1].copy()
+        return y.reshape(in_shape)
+
+
+class Moving_Median(object):
+    """
+        Moving median over the latest window_size samples of a single channel. lfilt() keeps the lower half of the window
+        in a max-heap and the upper half in a min-heap, removing the samples leaving the window lazily, when they reach
+        the top of their heap: O(log window_size) per sample. Up to MEDIAN_BLOCK_MAX_WINDOW samples, lfilt_block() takes
+        the median of every window of the block with numpy instead, O(window_size) per sample without a loop in Python,
+        and the heaps are rebuilt on the next lfilt()
+    """
+    def __init__(self, window_size):
+        self.window_size = int(window_size)
+        self.buffer = Circular_Buffer(self.window_size)
+        self.low = []           # lower half, as negated values
+        self.high = []          # upper half
+        self.low_size = 0       # samples of the window in each heap, excluding those to be removed
+        self.high_size = 0
+        self.removed = {}       # value: number of samples of that value left in the heaps but out of the window
+        self.heaps_valid = True
+
+    def prune(self, heap, sign):
+        while heap and self.removed.get(sign * heap[0], 0) > 0:
+            value = sign * heapq.heappop(heap)
+            self.removed[value] -= 1
+            if self.removed[value] == 0:
+                del self.removed[value]
+
+    def rebalance(self):
+        if self.low_size > self.high_size + 1:
+            heapq.heappush(self.high, -heapq.heappop(self.low))
+            self.low_size -= 1
+            self.high_size += 1
+            self.prune(self.low, -1)
+        elif self.low_size < self.high_size:
+            heapq.heappush(self.low, -heapq.heappop(self.high))
+            self.high_size -= 1
+            self.low_size += 1
+            self.prune(self.high, 1)
+
+    def add(self, value):
+        if self.low_size == 0 or value <= -self.low[0]:
+            heapq.heappush(self.low, -value)
+            self.low_size += 1
+        else:
+            heapq.heappush(self.high, value)
+            self.high_size += 1
+        self.rebalance()
+
+    def remove(self, value):
+        self.removed[value] = self.removed.get(value, 0) + 1
+        if value <= -self.low[0]:
+            self.low_size -= 1
+            self.prune(self.low, -1)
+        else:
+            self.high_size -= 1
+            self.prune(self.high, 1)
+        self.rebalance()
+
+    def rebuild_heaps(self):
+        values = np.sort(self.buffer.get()[:, 0])
+        n_low = (len(values) + 1) // 2
+        self.low = (-values[:n_low][::-1]).tolist()
+        self.high = values[n_low:].tolist()
+        self.low_size = len(self.low)
+        self.high_size = len(self.high)
+        self.removed = {}
+        self.heaps_valid = True
+
+    def lfilt(self, value):
+        value = float(value)
+        if not self.heaps_valid:
+            self.rebuild_heaps()
+        if self.buffer.is_full():
+            self.remove(float(self.buffer.oldest()[0]))
+        self.buffer.append(value)
+        self.add(value)
+
+        if (self.low_size + self.high_size) % 2:
+            return -self.low[0]
+        return 0.5 * (-self.low[0] + self.high[0])
+
+    def lfilt_block(self, data):
+        # data: (n_samples,)
+        data = np.ravel(np.asarray(data, dtype=np.float64))
+        if len(data) == 0:
+            return data
+        if self.window_size > MEDIAN_BLOCK_MAX_WINDOW:
+            return np.array([self.lfilt(val) for val in data.tolist()])
+        history = self.buffer.get()[:, 0]
+        ext = np.concatenate([history, data])
+        ends = len(history) + np.arange(1, len(data) + 1)
+        y = np.empty(len(data))
+        # windows not yet filled, only at the start of the stream
+        n_partial = int(np.sum(ends < self.window_size))
+        for index in range(n_partial):
+            y[index] = np.median(ext[:ends[index]])
+        if n_partial < len(data):
+            windows = np.lib.stride_tricks.sliding_window_view(ext, self.window_size)[ends[n_partial] - self.window_size:]
+            for start in range(0, len(windows), MEDIAN_CHUNK_ROWS):
+                y[n_partial + start: n_partial + start + MEDIAN_CHUNK_ROWS] = np.median(windows[start: start + MEDIAN_CHUNK_ROWS], axis=1)
+        self.buffer.extend(data)
+        self.heaps_valid = False
+        return y
+
+
+class Sliding_MinMax(object):
+    """
+        Minimum and maximum over the latest window_size samples of a single channel,
+        using monotonic deques: amortised O(1) per sample
+    """
+    def __init__(self, window_size):
+        self.window_size = int(window_size)
+        self.count = 0
+        self.min_deque = deque()      # (sample index, value), values increasing
+        self.max_deque = deque()      # (sample index, value), values decreasing
+
+    def update(self, value):
+        while self.min_deque and self.min_deque[-1][1] >= value:
+            self.min_deque.pop()
+        self.min_deque.append((self.count, value))
+        while self.max_deque and self.max_deque[-1][1] <= value:
+            self.max_deque.pop()
+        self.max_deque.append((self.count, value))
+
+        self.count += 1
+        oldest_index = self.count - self.window_size
+        if self.min_deque[0][0] < oldest_index:
+            self.min_deque.popleft()
+        if self.max_deque[0][0] < oldest_index:
+            self.max_deque.popleft()
+        return self.min_deque[0][1], self.max_deque[0][1]
+
+    def update_block(self, data):
+        data = np.ravel(data)
+        if len(data) > self.window_size:
+            # only the latest window_size samples can affect the result
+            self.count += len(data) - self.window_size
+            self.min_deque.clear()
+            self.max_deque.clear()
+            data = data[-self.window_size:]
+        for val in data.tolist():
+            self.update(val)
+        return self.get_min(), self.get_max()
+
+    def get_min(self):
+        return self.min_deque[0][1] if self.min_deque else 0
+
+    def get_max(self):
+        return self.max_deque[0][1] if self.max_deque else 0
+
+
+class Streaming_Resampler(object):
+    """
+        Resampling of a stream from fs to target_fs, block by block: low-pass filtered (when downsampling) and linearly
+        interpolated at the target sample times, so that the samples already returned never change
+    """
+    def __init__(self, fs, target_fs, nchannels=1, order=4):
+        self.ratio = float(fs) / target_fs      # input samples per output sample
+        self.nchannels = nchannels
+        self.sos = butter(order, 0.4 * target_fs, 'lowpass', fs=fs, output='sos') if target_fs < fs else None
+        self.zi = None
+        self.last = None        # last filtered input sample
+        self.n_in = 0
+        self.n_out = 0
+
+    def resample_block(self, data):
+        # data: (n_samples, nchannels), returns (n_resampled, nchannels)
+        data = np.asarray(data, dtype=np.float64).reshape(-1, self.nchannels)
+        if data.shape[0] == 0:
+            return np.zeros((0, self.nchannels))
+        if self.sos is not None:
+            if self.zi is None:
+                self.zi = sosfilt_zi(self.sos)[:, :, np.newaxis] * data[0]
+            data, self.zi = sosfilt(self.sos, data, axis=0, zi=self.zi)
+        # input samples from index base, the previous block ending with sample n_in - 1
+        ext = data if self.last is None else np.concatenate([self.last, data])
+        base = self.n_in - (ext.shape[0] - data.shape[0])
+        self.n_in += data.shape[0]
+        self.last = data[-1:]
+
+        n_new = int(np.floor((self.n_in - 1) / self.ratio)) + 1 - self.n_out
+        if n_new <= 0:
+            return np.zeros((0, self.nchannels))
+        pos = (self.n_out + np.arange(n_new)) * self.ratio - base
+        self.n_out += n_new
+        index = np.floor(pos).astype(int)
+        frac = (pos - index)[:, np.newaxis]
+        upper = np.minimum(index + 1, ext.shape[0] - 1)
+        return ext[index] * (1 - frac) + ext[upper] * frac
@@ -0,0 +1,117 @@
+import socket
+import threading
+import time
+
+SYNC_SIGNAL_BYTE = b"1"
+
+
+class Sync_Server(threading.Thread):
+    """
+        TCP server of the external sync: accepts clients, relays their messages and sends them the sync signal.
+        on_update(str) is called with connection messages.
+    """
+    def __init__(self, ip, port, on_update=None):
+        super(Sync_Server, self).__init__(daemon=True)
+
+        self.stop_flag = False
+        self.ip = ip
+        self.port = port
+        self.on_update = on_update
+        self.buffer_size = 1024
+        self.server_socket = None
+        self.client_connect_status = []
+        self.signal_byte = SYNC_SIGNAL_BYTE
+        self.connections = []  # Connection added to this list every time a client connects
+        self.client_addresses = []
+
+
+    def run(self):
+        self.server_socket = socket.socket()
+        self.server_socket.bind((self.ip, self.port))
+        self.server_socket.listen(5)
+
+        while not self.stop_flag:
+            client_socket, addr = self.server_socket.accept()
+            self.connections.append(client_socket)
+            self.client_addresses.append(addr)
+            self.client_connect_status.append(True)
+            if self.on_update is not None:
+                self.on_update(f"Connection from {addr} has been established.")
+            threading.Thread(target=self.manage_connections, args=(client_socket, addr), daemon=True).start()
+
+        self.server_socket.close()
+
+
+    def manage_connections(self, client_socket, addr):
+        while not self.stop_flag:
+            try:
+                msg = client_socket.recv(1024)
+            except ConnectionError:
+                print(f"Connection from {addr} has been lost.")
+                if client_socket in self.connections:
+                    self.connections.remove(client_socket)
+                return
+            if len(msg.decode('utf-8')) > 0:
+                print(msg.decode("utf-8"))
+            for connection in self.connections:  # iterates through the connections array and sends message to each one
+                msgbreak = msg
+                try:
+                    connection.send(bytes(str(msgbreak.decode("utf-8")), "utf-8"))
+                except ConnectionError:
+                    print(f"Unable to reach client with socket {connection}")
+                    if connection in self.connections:
+                        self.connections.remove(connection)
+
+
+    def send_sync_to_client(self):
+        for conn in self.connections:
+            conn.sendall(self.signal_byte)
+
+
+class Sync_Client(threading.Thread):
+    """
+        TCP client of the external sync: connects to the server, retrying every 5 seconds, and waits for its sync signal.
+        on_connect(bool) is called when the connection is established or lost, on_sync(bool) when the sync signal is received.
+    """
+    def __init__(self, ip, port, on_connect=None, on_sync=None):
+        super(Sync_Client, self).__init__(daemon=True)
+
+        self.stop_flag = False
+        self.wait_for_sync = False
+        self.ip = ip
+        self.port = port
+        self.on_connect = on_connect
+        self.on_sync = on_sync
+        self.buffer_size = 1024
+        self.client_conn = None
+        self.signal_byte = SYNC_SIGNAL_BYTE
+
+
+    def notify(self, callback, value):
+        if callback is not None:
+            callback(value)
+
+
+    def run(self):
+        while not self.stop_flag:
+            try:
+                self.client_conn = socket.create_connection((self.ip, self.port))
+                self.notify(self.on_connect, True)
+
+                while not self.stop_flag:
+                    if self.wait_for_sync:
+                        data = self.client_conn.recv(self.buffer_size)
+                        if data == self.signal_byte:
+                            self.notify(self.on_sync, True)
+
+                        elif not data:
+                            self.notify(self.on_sync, False)
+                            self.notify(self.on_connect, False)
+                            time.sleep(1)
+                    else:
+                        time.sleep(1)
+
+            except:
+                self.notify(self.on_connect, False)
+                # print("Connection could not be established... Retrying...")
+                time.sleep(5)
@@ -0,0 +1,341 @@
+import argparse
+import sys
+import threading
+import time
+import numpy as np
+
+from PhysioKit2.utils.binary_recording import Binary_Recording, EXTENSION as BINARY_EXTENSION
+from PhysioKit2.utils.compression import open_csv
+from PhysioKit2.utils.serial_protocol import encode_frames, frame_length, MAX_GAP_FRAMES
+
+VIRTUAL_PORT_NAME = "replay"
+NON_SIGNAL_COLUMNS = ["event_code", "arduino_ts"]
+
+
+class Synthetic_Signal_Source(object):
+    """
+        Generates ADC like (0 - 4095) test signals: slow drift for EDA, 0.25 Hz for Resp and 1.2 Hz pulse for PPG
+    """
+    def __init__(self, nchannels, fs, noise_std=5.0, seed=None):
+        self.nchannels = nchannels
+        self.fs = fs
+        self.noise_std = noise_std
+        self.rng = np.random.default_rng(seed)
+        self.sample_index = 0
+        self.freqs = np.array([0.02, 0.25, 1.2, 1.2, 1.2, 1.2, 1.2, 1.2])
+        self.freqs = np.resize(self.freqs, nchannels)
+
+    def next_block(self, n_samples):
+        t = (self.sample_index + np.arange(n_samples))[:, np.newaxis] / float(self.fs)
+        self.sample_index += n_samples
+        sig = 2048 + 800 * np.sin(2 * np.pi * self.freqs[np.newaxis, :] * t) + \
+            self.rng.normal(0, self.noise_std, (n_samples, self.nchannels))
+        return np.clip(np.round(sig), 0, 4095).astype(np.int64)
+
+
+class Recording_Source(object):
+    """
+        Replays the signal columns of a PhysioKit recording (CSV, compressed CSV or binary), looping over it when loop is True
+    """
+    def __init__(self, filepath, nchannels=None, loop=True):
+        if filepath.endswith(BINARY_EXTENSION):
+            recording = Binary_Recording(filepath)
+            self.channels = recording.channels[:nchannels]
+            self.data = np.array(recording.read(), dtype=np.int64)[:, :len(self.channels)]
+        else:
+            with open_csv(filepath) as csvfile:
+                header = csvfile.readline().strip().split(',')
+            usecols = [idx for idx, name in enumerate(header) if name not in NON_SIGNAL_COLUMNS]
+            if nchannels is not None:
+                usecols = usecols[:nchannels]
+            self.channels = [header[idx] for idx in usecols]
+            self.data = np.loadtxt(filepath, delimiter=',', skiprows=1, usecols=usecols, ndmin=2).astype(np.int64)
+        self.nchannels = len(self.channels)
+        self.loop = loop
+        self.sample_index = 0
+
+    def next_block(self, n_samples):
+        blocks = []
+        while n_samples > 0:
+            if self.sample_index >= self.data.shape[0]:
+                if not self.loop:
+                    break
+                self.sample_index = 0
+            block = self.data[self.sample_index: self.sample_index + n_samples]
+            self.sample_index += block.shape[0]
+            n_samples -= block.shape[0]
+            blocks.append(block)
+        if len(blocks) == 0:
+            return np.zeros((0, self.nchannels), dtype=np.int64)
+        return np.concatenate(blocks)
+
+
+class Virtual_Serial(object):
+    """
+        Hardware free stand-in for serial.Serial. Streams a recorded CSV file or a synthetic source
+        at fs * speed samples per second (speed <= 0 streams as fast as data is read), using the ASCII
+        or binary protocol of the Arduino sketches. Timing jitter, dropped bytes and corrupt lines or frames can be injected,
+        corrupt_line_prob being the probability of a line, or a frame, to have one of its bytes changed.
+    """
+    def __init__(self, source="synthetic", fs=250, nchannels=4, speed=1.0, protocol="ascii",
+                 jitter_ms=0.0, drop_byte_prob=0.0, corrupt_line_prob=0.0, loop=True, seed=None):
+        if source == "synthetic":
+            self.source = Synthetic_Signal_Source(nchannels, fs, seed=seed)
+        else:
+            self.source = Recording_Source(source, nchannels=nchannels, loop=loop)
+        self.nchannels = self.source.nchannels
+        self.fs = float(fs)
+        self.speed = float(speed)
+        self.protocol = protocol
+        self.jitter_s = jitter_ms / 1000.0
+        self.drop_byte_prob = drop_byte_prob
+        self.corrupt_line_prob = corrupt_line_prob
+        self.rng = np.random.default_rng(seed)
+
+        # serial.Serial attributes set by Data_Acquisition_Thread.connectPort
+        self.port = VIRTUAL_PORT_NAME
+        self.baudrate = None
+        self.timeout = None
+        self.parity = None
+        self.stopbits = None
+        self.is_open = False
+
+        self.max_chunk_samples = 1024
+        self.buffer = bytearray()
+        self.written = bytearray()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.samples_sent = 0
+        self.bytes_sent = 0
+        self.bytes_dropped = 0
+        self.lines_corrupted = 0
+        self.frames_corrupted = 0
+        self.source_exhausted = False
+
+    def __repr__(self):
+        return "Virtual_Serial(port='{}', fs={}, speed={}, protocol='{}')".format(self.port, self.fs, self.speed, self.protocol)
+
+    def open(self):
+        self.is_open = True
+        self.start_time = time.monotonic()
+        self.next_nominal = 0.0
+        self.next_arrival = 0.0
+        self.buffer = bytearray()
+
+    def close(self):
+        self.is_open = False
+
+    def _encode(self, samples):
+        if self.protocol == "binary":
+            raw_bytes = encode_frames(samples, seq_start=self.samples_sent)
+            if self.corrupt_line_prob > 0:
+                # any byte of the frame: sync word, sequence counter, sample values or checksum
+                frames = np.frombuffer(raw_bytes, dtype=np.uint8).reshape(len(samples), -1).copy()
+                rows = np.where(self.rng.random(len(frames)) < self.corrupt_line_prob)[0]
+                cols = self.rng.integers(frame_length(self.nchannels), size=len(rows))
+                frames[rows, cols] ^= self.rng.integers(1, 256, size=len(rows), dtype=np.uint8)
+                self.frames_corrupted += len(rows)
+                raw_bytes = frames.tobytes()
+            return raw_bytes
+
+        lines = [','.join(map(str, row)).encode() for row in samples.tolist()]
+        if self.corrupt_line_prob > 0:
+            for idx in np.where(self.rng.random(len(lines)) < self.corrupt_line_prob)[0]:
+                ln = bytearray(lines[idx])
+                ln[self.rng.integers(len(ln))] = ord(b'x')
+                lines[idx] = bytes(ln)
+                self.lines_corrupted += 1
+        return b'\r\n'.join(lines) + b'\r\n'
+
+    def _generate(self):
+        # moves all the samples due by now into the input buffer
+        if self.source_exhausted:
+            return
+        if self.speed > 0:
+            elapsed = time.monotonic() - self.start_time
+            interval = 1.0 / (self.fs * self.speed)
+            n_samples = 0
+            while self.next_arrival <= elapsed and n_samples < self.max_chunk_samples:
+                n_samples += 1
+                self.next_nominal += interval
+                release = self.next_nominal
+                if self.jitter_s > 0:
+                    # samples are released late by up to jitter_s, never before the previous one
+                    release += self.rng.uniform(0, self.jitter_s)
+                self.next_arrival = max(release, self.next_arrival)
+        else:
+            n_samples = self.max_chunk_samples if len(self.buffer) == 0 else 0
+
+        if n_samples == 0:
+            return
+        samples = self.source.next_block(n_samples)
+        if samples.shape[0] < n_samples:
+            self.source_exhausted = True
+        if samples.shape[0] == 0:
+            return
+
+        raw_bytes = self._encode(samples)
+        self.samples_sent += samples.shape[0]
+        if self.drop_byte_prob > 0:
+            keep = self.rng.random(len(raw_bytes)) >= self.drop_byte_prob
+            self.bytes_dropped += int(len(raw_bytes) - keep.sum())
+            raw_bytes = np.frombuffer(raw_bytes, dtype=np.uint8)[keep].tobytes()
+        self.bytes_sent += len(raw_bytes)
+        self.buffer.extend(raw_bytes)
+
+    def end_stream(self):
+        # no more samples are generated, the data already buffered can still be read
+        self.source_exhausted = True
+
+    def _wait_for_data(self):
+        if self.speed > 0:
+            wait = self.next_arrival - (time.monotonic() - self.start_time)
+            time.sleep(min(max(wait, 0.0005), 0.1))
+
+    @property
+    def in_waiting(self):
+        self._generate()
+        return len(self.buffer)
+
+    def read(self, size=1):
+        self._generate()
+        while len(self.buffer) < size and self.is_open and not self.source_exhausted:
+            self._wait_for_data()
+            self._generate()
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    def readline(self, size=-1):
+        self._generate()
+        while self.buffer.find(b'\n') < 0 and self.is_open and not self.source_exhausted:
+            self._wait_for_data()
+            self._generate()
+        end = self.buffer.find(b'\n') + 1
+        if end == 0:
+            end = len(self.buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        data = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        return data
+
+    def write(self, data):
+        self.written.extend(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def reset_input_buffer(self):
+        self._generate()
+        self.buffer = bytearray()
+
+    def reset_output_buffer(self):
+        self.written = bytearray()
+
+
+def main():
+    """
+        Measures the throughput and sample loss of the acquisition engine reading a replayed stream, without hardware or Qt.
+        The samples lost reported in the acquisition health are checked against the samples sent and not received,
+        returning 1 if they differ by more than a factor of --loss_tolerance (and a few frames)
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--source', type=str, default="synthetic", help='PhysioKit CSV recording or "synthetic"')
+    parser.add_argument('--fs', type=float, default=250)
+    parser.add_argument('--nchannels', type=int, default=4)
+    parser.add_argument('--speed', type=float, default=0, help='multiple of fs, 0 streams as fast as possible')
+    parser.add_argument('--protocol', type=str, default="ascii", choices=["ascii", "binary"])
+    parser.add_argument('--serial_protocol', type=str, default="auto", choices=["auto", "ascii", "binary"],
+                        help='protocol setting of the acquisition engine')
+    parser.add_argument('--block_mode', action='store_true')
+    parser.add_argument('--high_rate_mode', action='store_true', help='bulk reads without fixed sleep (implies block mode)')
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds')
+    parser.add_argument('--jitter_ms', type=float, default=0.0)
+    parser.add_argument('--drop_byte_prob', type=float, default=0.0)
+    parser.add_argument('--corrupt_line_prob', type=float, default=0.0, help='probability of a line or frame to be corrupted')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--loss_tolerance', type=float, default=2.0,
+                        help='largest ratio between the samples lost reported and those really lost')
+    args = parser.parse_args()
+
+    # imported here, as the acquisition engine imports this module
+    from PhysioKit2.utils import config
+    from PhysioKit2.utils.acquisition_engine import Acquisition_Engine
+
+    config.SAMPLING_RATE = args.fs
+    config.NCHANNELS = args.nchannels
+    config.SERIAL_PROTOCOL = args.serial_protocol
+    config.HIGH_RATE_MODE = args.high_rate_mode
+    config.BLOCK_MODE = args.block_mode or args.high_rate_mode
+    config.DEVICE_PORTS = None
+    config.REPLAY_PARAMS = {"source": args.source, "speed": args.speed, "protocol": args.protocol, "jitter_ms": args.jitter_ms,
+                            "drop_byte_prob": args.drop_byte_prob, "corrupt_line_prob": args.corrupt_line_prob,
+                            "loop": True, "seed": args.seed}
+    config.LIVE_ACQUISITION_FLAG = True
+    config.HOLD_ACQUISITION_THREAD = False
+
+    engine = Acquisition_Engine(config)
+    if not engine.connectPort(VIRTUAL_PORT_NAME):
+        print("Replay port could not get connected")
+        return 1
+    ser = engine.ser
+    if ser.nchannels != config.NCHANNELS:
+        print("The source has {} channels, {} specified".format(ser.nchannels, config.NCHANNELS))
+        return 1
+
+    samples_published = [0]
+    def count_samples(value):
+        samples_published[0] += len(value) if config.BLOCK_MODE else 1
+    engine.subscribe("data", count_samples)
+    engine.subscribe("health", lambda health_report: print("{:.0f} samples/s | corrupt: {} | gaps: {} | lost: {}".format(
+        health_report["samples_per_sec"], health_report["corrupt_lines"] + health_report["corrupt_frames"],
+        health_report["sequence_gaps"], health_report["samples_lost"])))
+    engine.start_recording()
+
+    acquisition_thread = threading.Thread(target=engine.run, daemon=True)
+    acquisition_thread.start()
+    t0 = time.monotonic()
+    while time.monotonic() - t0 < args.duration and acquisition_thread.is_alive():
+        if ser.source_exhausted and len(ser.buffer) == 0:
+            break
+        time.sleep(0.05)
+    elapsed = time.monotonic() - t0
+    health = engine.health.snapshot()
+
+    # the bytes already sent are read before stopping, so that every sample sent is either received or lost
+    ser.end_stream()
+    drain_start = time.monotonic()
+    while (len(ser.buffer) > 0 or time.monotonic() - drain_start < 0.5) and acquisition_thread.is_alive() and \
+            time.monotonic() - drain_start < 10:
+        time.sleep(0.05)
+    engine.stop_flag = True
+    acquisition_thread.join(timeout=5)
+    engine.disconnectPort()
+    counters = engine.health.counters
+    true_lost = ser.samples_sent - counters["samples_received"]
+
+    print("Protocol: {}, samples sent: {}, received: {}, published: {}, lost: {} ({:.3f} %)".format(
+        engine.reader.protocol, ser.samples_sent, counters["samples_received"], samples_published[0], true_lost,
+        100.0 * true_lost / max(ser.samples_sent, 1)))
+    print("Bytes sent: {}, dropped: {}, corrupt lines injected: {}, corrupt frames injected: {}".format(
+        ser.bytes_sent, ser.bytes_dropped, ser.lines_corrupted, ser.frames_corrupted))
+    print("Health: corrupt lines: {}, corrupt frames: {}, bytes skipped: {}, gaps: {}, lost: {}, resyncs: {}, read errors: {}, processing errors: {}".format(
+        counters["corrupt_lines"], counters["corrupt_frames"], counters["bytes_skipped"], counters["sequence_gaps"],
+        counters["samples_lost"], counters["resyncs"], counters["read_errors"], counters["processing_errors"]))
+    print("Throughput: {:.0f} samples/s, {:.0f} bytes/s".format(health["samples_received"] / elapsed, health["bytes_received"] / elapsed))
+
+    # a partial frame or line may be left in the decoder, and samples lost at resyncs are not counted
+    slack = MAX_GAP_FRAMES * (counters["resyncs"] + 1)
+    reported_lost = counters["samples_lost"]
+    if reported_lost > args.loss_tolerance * true_lost + slack or true_lost > args.loss_tolerance * reported_lost + slack:
+        print("Samples lost reported in the acquisition health ({}) differ from the samples really lost ({})".format(
+            reported_lost, true_lost))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,30 @@
+import os
+import queue
+import threading
+
+from PhysioKit2.utils.acquisition_health import sidecar_path
+from PhysioKit2.utils.acquisition_process import Ring_Acquisition_Engine, Shared_Config
+from PhysioKit2.utils.shared_ring_buffer import Shared_Ring_Buffer
+
+
+def test_commands_run_while_not_live(tmp_path):
+    ring = Shared_Ring_Buffer(2, 100)
+    command_queue = queue.Queue()
+    status_queue = queue.Queue()
+    engine = Ring_Acquisition_Engine(Shared_Config({"NCHANNELS": 2, "SAMPLING_RATE": 100}, ring), ring, command_queue,
+                                     status_queue, False)
+    thread = threading.Thread(target=engine.run)
+    thread.start()
+    try:
+        # the serial port is not open and the live flag is not set
+        command_queue.put(("recording_summary",))
+        assert status_queue.get(timeout=0.5)[0] == "recording_summary"
+        recording_path = str(tmp_path / "s.csv")
+        command_queue.put(("write_sidecar", recording_path, None))
+        command_queue.put(("recording_summary",))
+        status_queue.get(timeout=0.5)
+        assert os.path.exists(sidecar_path(recording_path))
+    finally:
+        engine.stop_flag = True
+        thread.join()
+        ring.close()
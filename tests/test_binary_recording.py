@@ -0,0 +1,32 @@
+import numpy as np
+
+from PhysioKit2.utils.binary_recording import Binary_Recording, Binary_Recording_Writer
+from PhysioKit2.utils.segments import merge_segments
+
+
+def write_segment(path, values, events):
+    # events: {sample index: code}, an index equal to len(values) marks an event after the last sample
+    writer = Binary_Recording_Writer(path, ["a", "b"], header={"fs": 100}, chunk_samples=64)
+    eventcode = ''
+    for n in range(len(values)):
+        eventcode = events.get(n, eventcode)
+        writer.write_block(values[n], eventcode)
+    if len(values) in events:
+        writer.write_block(np.zeros((0, 2)), events[len(values)])
+    writer.close()
+
+
+def test_merge_keeps_event_after_last_sample(tmp_path):
+    values = np.arange(1000).reshape(500, 2)
+    segment_paths = [str(tmp_path / "segment_00000.pkb"), str(tmp_path / "segment_00001.pkb")]
+    write_segment(segment_paths[0], values[:300], {100: '3', 300: ''})
+    write_segment(segment_paths[1], values[300:], {200: '5'})
+    save_path = str(tmp_path / "merged.pkb")
+    merge_segments(segment_paths, save_path, binary=True, header={"study": "s"})
+
+    recording = Binary_Recording(save_path)
+    assert recording.n_samples == 500
+    assert [tuple(event) for event in recording.events] == [(100, '3'), (300, ''), (500, '5')]
+    assert np.array_equal(recording.read(), values)
+    assert np.array_equal(recording.read(50, 450, ["b"])[:, 0], values[50:450, 1])
+    recording.close()
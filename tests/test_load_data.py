@@ -0,0 +1,22 @@
+import numpy as np
+
+from PhysioKit2.analysis_helper.utils import load_data as analysis_load_data
+from PhysioKit2.utils import load_data
+
+
+def test_legacy_loaders_select_columns_by_name(tmp_path):
+    recording_path = str(tmp_path / "s.csv")
+    with open(recording_path, 'w') as csvfile:
+        csvfile.write("arduino_ts,PPG Ear,EDA,PPG Finger,Resp\n10,1,2,3,4\n14,5,6,7,8\n")
+
+    ppg1, ppg2, event_code = load_data.load_csv_data_ppg(recording_path)
+    assert np.array_equal(ppg1, [3, 7]) and np.array_equal(ppg2, [1, 5])
+    assert np.array_equal(event_code, [-1, -1])
+    eda, _ = load_data.load_csv_data_eda(recording_path)
+    resp, _ = load_data.load_csv_data_resp(recording_path)
+    assert np.array_equal(eda, [2, 6]) and np.array_equal(resp, [4, 8])
+
+    # the analysis loader negates the PPG signals, and shares the other loaders
+    ppg1, ppg2, _ = analysis_load_data.load_csv_data_ppg(recording_path)
+    assert np.array_equal(ppg1, [-3, -7]) and np.array_equal(ppg2, [-1, -5])
+    assert analysis_load_data.load_csv_data_eda is load_data.load_csv_data_eda
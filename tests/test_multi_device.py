@@ -0,0 +1,62 @@
+import numpy as np
+
+from PhysioKit2.utils.acquisition_health import Acquisition_Health
+from PhysioKit2.utils.multi_device import Device_Clock
+from PhysioKit2.utils.serial_protocol import encode_frames
+from PhysioKit2.utils.serial_reader import Serial_Reader
+
+FS = 250
+NCHANNELS = 2
+READ_FRAMES = 25
+
+
+def run_device(frames_bytes, max_fill_samples=4):
+    # reads of READ_FRAMES frames arriving 2 ms after their last sample is taken, as Device_Reader.run() handles them
+    health = Acquisition_Health(FS)
+    reader = Serial_Reader(None, NCHANNELS, "binary", health, fill_gaps=True, max_fill_samples=max_fill_samples)
+    reader.protocol = "binary"
+    clock = Device_Clock(FS)
+    n_received = 0
+    read_time = 0.0
+    for nRead, frame_bytes in enumerate(frames_bytes):
+        block = reader.decode(frame_bytes)
+        n_received += len(block)
+        read_time = (nRead + 1) * READ_FRAMES / float(FS) + 0.002
+        clock.update(n_received - 1, read_time)
+    return n_received, clock, health, read_time
+
+
+def reads(samples, seqs):
+    raw = b''.join(encode_frames(samples[n: n + 1], seq_start=seqs[n]) for n in range(len(samples)))
+    frame_len = len(raw) // len(samples)
+    return [raw[start: start + READ_FRAMES * frame_len] for start in range(0, len(raw), READ_FRAMES * frame_len)]
+
+
+def test_corrupt_frame_does_not_shift_the_clock():
+    n_frames = 100 * READ_FRAMES
+    samples = np.random.default_rng(0).integers(0, 4096, size=(n_frames, NCHANNELS))
+    seqs = np.arange(n_frames) % 65536
+    # a frame passing the checksum with a wrong sequence counter
+    seqs[n_frames // 2] = (seqs[n_frames // 2] + 30000) % 65536
+    n_received, clock, health, read_time = run_device(reads(samples, seqs))
+
+    assert n_received == n_frames
+    assert health.counters["samples_lost"] == 0
+    assert health.counters["resyncs"] == 2
+    # the last sample is taken 2 ms before the last read
+    assert abs(clock.time_of(n_received - 1) - (read_time - 0.002)) < 2.0 / FS
+
+
+def test_gap_above_cap_is_not_filled():
+    n_frames = 100 * READ_FRAMES
+    samples = np.random.default_rng(0).integers(0, 4096, size=(n_frames, NCHANNELS))
+    seqs = np.arange(n_frames)
+    seqs[n_frames // 2:] += 10
+    n_received, _, health, _ = run_device(reads(samples, seqs), max_fill_samples=4)
+    assert n_received == n_frames
+    assert health.counters["resyncs"] == 1
+    assert health.counters["samples_lost"] == 0
+
+    n_received, _, health, _ = run_device(reads(samples, seqs), max_fill_samples=16)
+    assert n_received == n_frames + 10
+    assert health.counters["samples_lost"] == 10
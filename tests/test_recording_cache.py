@@ -0,0 +1,32 @@
+import numpy as np
+
+from PhysioKit2.utils.events import write_events, events_path
+from PhysioKit2.utils.load_data import read_csv_columns
+from PhysioKit2.utils.recording_cache import Recording_Cache, get_cache, set_cache
+
+
+def test_event_table_added_after_caching(tmp_path):
+    recording_path = str(tmp_path / "s.csv")
+    with open(recording_path, 'w') as csvfile:
+        csvfile.write("a,b\n1,2\n3,4\n")
+    previous_cache = get_cache()
+    set_cache(Recording_Cache(str(tmp_path / "cache")))
+    try:
+        _, _, event_code = read_csv_columns(recording_path)
+        assert np.array_equal(event_code, [-1, -1])
+
+        write_events(events_path(recording_path), [{"sample_index": 1, "host_monotonic_ns": 0, "code": "5", "label": ""}])
+        _, _, event_code = read_csv_columns(recording_path)
+        _, _, uncached_event_code = read_csv_columns(recording_path, use_cache=False)
+        assert np.array_equal(uncached_event_code, [-1, 5])
+        assert np.array_equal(event_code, uncached_event_code)
+    finally:
+        set_cache(previous_cache)
+
+
+def test_loader_version_in_key(tmp_path):
+    recording_path = str(tmp_path / "s.csv")
+    with open(recording_path, 'w') as csvfile:
+        csvfile.write("a\n1\n")
+    recording_cache = Recording_Cache(str(tmp_path / "cache"))
+    assert recording_cache.key(recording_path, [], version=1) != recording_cache.key(recording_path, [], version=2)
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from PhysioKit2 import recover
+from PhysioKit2.recover import find_sessions, recover_session
+from PhysioKit2.utils.recorder import Recorder
+from PhysioKit2.utils.segments import LOCK_NAME, recording_samples
+
+
+def record_session(n_samples):
+    # a session left unsaved, its segments written and its lock still held
+    recorder = Recorder(["a", "b"], segment_duration_s=1, header={"fs": 100})
+    recorder.start_recording({})
+    for start in range(0, n_samples, 50):
+        recorder.write(np.arange(2 * start, 2 * (start + 50)).reshape(50, 2))
+        recorder.queue.join()
+    recorder.close(remove_temp=False)
+    assert len(recorder.segments) > 1
+    return recorder
+
+
+def test_session_of_running_recorder_is_skipped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    recorder = record_session(250)
+    assert os.path.exists(os.path.join(recorder.session_dir, LOCK_NAME))
+    assert find_sessions('.') == []
+
+    # lock file left by a process still running
+    recorder.session_lock.file.close()
+    process = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        with open(os.path.join(recorder.session_dir, LOCK_NAME), 'w') as f:
+            f.write(str(process.pid))
+        assert find_sessions('.') == []
+    finally:
+        process.kill()
+        process.wait()
+
+    # the process is gone: the session is recovered, with all its samples
+    sessions = find_sessions('.')
+    assert sessions == [os.path.join('.', recorder.session_dir)]
+    save_path = recover_session(sessions[0], str(tmp_path / "data"))
+    assert recording_samples(save_path) == 250
+    assert not os.path.exists(recorder.session_dir)
+
+
+def test_session_kept_when_recording_is_incomplete(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    recorder = record_session(250)
+    recorder.session_lock.release()
+
+    def merge_first_segment(segment_paths, save_path, binary=False, header=None):
+        with open(segment_paths[0], 'rb') as segment_file, open(save_path, 'wb') as out_file:
+            out_file.write(segment_file.read())
+
+    monkeypatch.setattr(recover, "merge_segments", merge_first_segment)
+    with pytest.raises(ValueError):
+        recover_session(recorder.session_dir, str(tmp_path / "data"))
+    assert os.path.exists(recorder.session_dir)
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from PhysioKit2.utils.serial_protocol import Binary_Frame_Decoder, SEQ_MODULO, encode_frames, frame_length
+
+NCHANNELS = 4
+N_FRAMES = 200000
+READ_SIZE = 4096
+
+
+def source_samples(n_frames, nchannels, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 4096, size=(n_frames, nchannels))
+
+
+def decode_stream(raw_bytes, nchannels):
+    # decodes the stream in reads of READ_SIZE bytes, returns the samples, their frame index and the missing frames reported
+    decoder = Binary_Frame_Decoder(nchannels)
+    samples = []
+    seqs = []
+    n_missing = 0
+    for start in range(0, len(raw_bytes), READ_SIZE):
+        block, seq = decoder.decode(raw_bytes[start: start + READ_SIZE])
+        _, missing = decoder.find_gaps(seq)
+        n_missing += int(np.sum(missing))
+        samples.append(block)
+        seqs.append(seq)
+    samples = np.concatenate(samples)
+    seqs = np.concatenate(seqs).astype(np.int64)
+    # the frame index, from the sequence counter wrapping at SEQ_MODULO
+    index = seqs + SEQ_MODULO * np.concatenate([[0], np.cumsum(np.diff(seqs) < 0)])
+    return samples, index, n_missing, decoder
+
+
+@pytest.mark.parametrize("damage", ["drop", "corrupt"])
+def test_reported_missing_matches_true_missing(damage):
+    sent = source_samples(N_FRAMES, NCHANNELS)
+    raw = np.frombuffer(encode_frames(sent), dtype=np.uint8)
+    rng = np.random.default_rng(1)
+    if damage == "drop":
+        raw = raw[rng.random(len(raw)) >= 0.001]
+    else:
+        raw = raw.copy()
+        hit = np.flatnonzero(rng.random(len(raw)) < 0.001)
+        raw[hit] ^= rng.integers(1, 256, size=len(hit), dtype=np.uint8)
+
+    samples, index, n_missing, decoder = decode_stream(raw.tobytes(), NCHANNELS)
+
+    # no misaligned frame is taken as data
+    assert np.array_equal(samples, sent[index])
+    assert samples.max() <= 4095
+    true_missing = (index[-1] - index[0] + 1) - len(index)
+    assert true_missing > 0
+    assert n_missing == true_missing
+    assert decoder.seq_resyncs == 0
+
+
+def test_sequence_jump_is_a_resync():
+    sent = source_samples(100, NCHANNELS)
+    raw = encode_frames(sent[:50]) + encode_frames(sent[50:], seq_start=50 + 1000)
+    decoder = Binary_Frame_Decoder(NCHANNELS)
+    samples, seq = decoder.decode(raw)
+    positions, n_missing = decoder.find_gaps(seq)
+    assert len(samples) == 100
+    assert len(positions) == 0 and len(n_missing) == 0
+    assert decoder.seq_resyncs == 1
+
+
+def test_frame_after_resync_needs_the_next_frame():
+    sent = source_samples(3, NCHANNELS)
+    raw = b'\x00' + encode_frames(sent)
+    decoder = Binary_Frame_Decoder(NCHANNELS)
+    samples, _ = decoder.decode(raw[:1 + frame_length(NCHANNELS)])
+    assert len(samples) == 0
+    samples, _ = decoder.decode(raw[1 + frame_length(NCHANNELS):])
+    assert np.array_equal(samples, sent)
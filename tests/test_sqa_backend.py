@@ -0,0 +1,26 @@
+import json
+import pytest
+from importlib.resources import files
+
+torch = pytest.importorskip("torch")
+
+from PhysioKit2.sqa.backend import compare, export_torchscript
+
+TOLERANCE = 1e-4
+
+
+@pytest.fixture
+def model_config(tmp_path):
+    with open(str(files('PhysioKit2.sqa.config').joinpath('SQAPhysMD.json'))) as json_file:
+        model_config = json.load(json_file)
+    model_config.setdefault("inference", {})["torchscript_name"] = str(tmp_path / "SQAPhysMD_frozen.pt")
+    return model_config
+
+
+@pytest.mark.parametrize("batch_size", [1, 8, 64])
+def test_torchscript_parity(model_config, batch_size):
+    output_path = model_config["inference"]["torchscript_name"]
+    assert export_torchscript(model_config, output_path) == output_path
+    result = compare(model_config, batch_sizes=(batch_size,), repeats=1)[0]
+    assert result["batch_size"] == batch_size
+    assert result["max_abs_diff"] <= TOLERANCE
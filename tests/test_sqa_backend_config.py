@@ -0,0 +1,32 @@
+import pytest
+
+from PhysioKit2.sqa.backend_config import ckpt_path, select_backend, torchscript_path
+
+
+def model_config(backend, tmp_path, exported=False):
+    torchscript_name = str(tmp_path / "SQAPhysMD_frozen.pt")
+    if exported:
+        open(torchscript_name, 'wb').close()
+    return {"inference": {"backend": backend, "torchscript_name": torchscript_name, "int8_name": str(tmp_path / "SQAPhysMD_int8.pt")},
+            "ckpt_name": "SQAPhysMD.pth"}
+
+
+def test_eager_by_default():
+    assert select_backend({"ckpt_name": "SQAPhysMD.pth"}) == ("eager", None)
+
+
+def test_exported_model_is_selected(tmp_path):
+    config = model_config("torchscript", tmp_path, exported=True)
+    assert select_backend(config) == ("torchscript", str(tmp_path / "SQAPhysMD_frozen.pt"))
+
+
+@pytest.mark.parametrize("backend", ["torchscript", "int8", "onnx"])
+def test_fallback_to_eager(tmp_path, capsys, backend):
+    # the model of the backend has not been exported, or the backend is unknown
+    assert select_backend(model_config(backend, tmp_path)) == ("eager", None)
+    assert "using the eager model" in capsys.readouterr().out
+
+
+def test_relative_names_next_to_checkpoint():
+    config = {"inference": {"torchscript_name": "SQAPhysMD_frozen.pt"}}
+    assert torchscript_path(config) == ckpt_path("SQAPhysMD_frozen.pt")